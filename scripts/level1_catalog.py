@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Script to query the catalog of exported level1 orthomosaics without Metashape.
+The exporters in resume_functions.py spool one entry per product next to the plot
+directories, and -ingest adds them to the catalog:
+    <root>/level1_catalog_spool/
+    <root>/<plot>/YYYYMMDD/imagery/
+SQLite locking is unreliable on network filesystems, so the catalog should be kept
+on local disk and -ingest run from a single host (e.g. from cron).
+User provides:
+    --catalog: path to the catalog
+    --ingest: spool directory to add entries from (optional)
+    --bbox: min_lon min_lat max_lon max_lat the product footprints must intersect (optional)
+    --start / --end: capture date range as YYYYMMDD (optional)
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+from metashape.catalog import query_catalog, prune_catalog, ingest_spool
+
+def main():
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description="Query the catalog of exported level1 orthomosaics.")
+    parser.add_argument('-catalog', required=True, help='Path to level1_catalog.sqlite (on local disk)')
+    parser.add_argument('-ingest', default=None, metavar='SPOOL_DIR',
+                      help='Add the products spooled by the exporters in <root>/level1_catalog_spool first; '
+                           'only one process may ingest into a catalog')
+    parser.add_argument('-bbox', nargs=4, type=float, default=None, metavar=('MIN_LON', 'MIN_LAT', 'MAX_LON', 'MAX_LAT'),
+                      help='WGS84 bounding box the product footprints must intersect')
+    parser.add_argument('-start', default=None, help='First capture date (YYYYMMDD)')
+    parser.add_argument('-end', default=None, help='Last capture date (YYYYMMDD)')
+    parser.add_argument('-product', choices=['rgb', 'multispec'], default=None, help='Product type')
+    parser.add_argument('-plot', default=None, help='Plot identifier')
+    parser.add_argument('-json', action='store_true', help='Print the matching entries as JSON')
+    parser.add_argument('-prune', action='store_true', help='Remove entries whose files no longer exist first')
+    args = parser.parse_args()
+
+    catalog_path = Path(args.catalog).resolve()
+    if args.ingest:
+        spool_dir = Path(args.ingest).resolve()
+        if not spool_dir.is_dir():
+            sys.exit(f"Spool directory not found: {spool_dir}")
+        print(f"Added {ingest_spool(catalog_path, spool_dir)} spooled products to {catalog_path}")
+    if not catalog_path.is_file():
+        sys.exit(f"Catalog not found: {catalog_path}")
+
+    if args.prune:
+        print(f"Removed {prune_catalog(catalog_path)} entries of missing products")
+
+    products = query_catalog(catalog_path, bbox=args.bbox, start=args.start, end=args.end,
+                             product=args.product, plot=args.plot)
+    if args.json:
+        print(json.dumps(products, indent=2))
+        return
+    for product in products:
+        print(f"{product['date']}  {product['plot']}  {product['product']}  {product['resolution']}  "
+              f"{product['profile'] or '-'}  {product['path']}")
+    print(f"{len(products)} products")
+
+if __name__ == "__main__":
+    main()
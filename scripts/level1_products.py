@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Script to derive products from exported level1 orthomosaics without Metashape.
+Assumes TERN directory structure:
+    <plot>/YYYYMMDD/imagery/
+        └── multispec/level1_proc/YYYYMMDD_<plot>_multispec_ortho_<res>.tif
+User provides:
+    --raster: path to an exported multispectral orthomosaic
+    --indices: vegetation indices to compute (default: ndvi ndre)
+    --qa: write a per-band reflectance QA report (exits with status 2 if calibration looks bad)
+Index rasters are written next to the orthomosaic as "YYYYMMDD_<plot>_<index>_<res>.tif"
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+from metashape.indices import compute_indices, INDEX_FORMULAS
+from metashape.qa import reflectance_qa
+
+def main():
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description="Derive products from exported level1 orthomosaics.")
+    parser.add_argument('-raster', required=True, help='Path to the exported multispectral orthomosaic')
+    parser.add_argument('-indices', nargs='*', choices=sorted(INDEX_FORMULAS), default=['ndvi', 'ndre'],
+                      help='Vegetation indices to compute, none to skip (default: ndvi ndre)')
+    parser.add_argument('-qa', action='store_true',
+                      help='Write a per-band reflectance QA report next to the raster')
+    parser.add_argument('-bands', nargs='+', default=None,
+                      help='Band labels in raster order (default: read from the *_bands.json sidecar)')
+    parser.add_argument('-window', type=int, default=1024,
+                      help='Approximate processing window size in pixels (default: 1024)')
+    args = parser.parse_args()
+
+    raster_path = Path(args.raster).resolve()
+    if not raster_path.is_file():
+        sys.exit(f"Raster not found: {raster_path}")
+
+    if args.indices:
+        compute_indices(raster_path, indices=args.indices, band_names=args.bands, window=args.window)
+
+    if args.qa:
+        report = reflectance_qa(raster_path, band_names=args.bands, window=args.window)
+        if not report['passed']:
+            sys.exit(2)
+
+if __name__ == "__main__":
+    main()
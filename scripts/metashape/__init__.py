@@ -1,11 +1,36 @@
 """
 TERN Dronescape Metashape Processing Package
+
+Submodules are imported on first use, so tools that only plan or inspect runs
+(e.g. the -dry_run mode of the entry scripts) start without Metashape.
 """
 
-# Import all necessary functions to expose them at the package level
-from .image_utils import find_filtered_images, filter_images_by_timestamp, filter_multispec_by_flight_pattern
-from .gpu_setup import setup_gpu
-from .utils import find_images
-from .camera_ops import configure_multispectral_camera
-from .processing import detect_reflectance_panels, merge_chunks
-from .markers import find_marker_files, load_markers 
\ No newline at end of file
+import importlib
+
+# Functions exposed at the package level, and the submodule each one lives in
+_EXPORTS = {
+    'find_filtered_images': 'image_utils',
+    'filter_images_by_timestamp': 'image_utils',
+    'filter_multispec_by_flight_pattern': 'image_utils',
+    'setup_gpu': 'gpu_setup',
+    'find_images': 'utils',
+    'configure_multispectral_camera': 'camera_ops',
+    'detect_reflectance_panels': 'processing',
+    'merge_chunks': 'processing',
+    'find_marker_files': 'markers',
+    'load_markers': 'markers',
+    'compute_camera_tiles': 'tiling',
+    'create_tile_chunks': 'tiling',
+    'process_tiles': 'tiling',
+    'write_mosaic_vrt': 'tiling',
+}
+
+__all__ = list(_EXPORTS)
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,434 @@
+import csv
+import shutil
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+import numpy as np
+import Metashape
+from .processing import align_images, align_images_two_pass, build_surface, gradual_selection
+from .utils import DEM_RESOLUTION, PROCESSING_PROFILES, resolve_profile
+from .export import export_raster_timed
+from .markers import DJI_MRK_PATTERN, iter_dji_timestamps
+
+ALIGNMENT_MODES = {
+    'single': align_images,
+    'two_pass': align_images_two_pass,
+}
+
+def alignment_stats(chunk):
+    """
+    Summarise alignment quality for a chunk.
+    Reprojection error is the per tie point error used by gradual selection.
+
+    Args:
+        chunk: Metashape chunk after alignment
+
+    Returns:
+        Dictionary with camera counts, aligned ratio, tie point count and
+        RMS / max reprojection error in pixels
+    """
+    cameras = [cam for cam in chunk.cameras
+               if cam.master == cam and not (cam.group and cam.group.label == 'Calibration images')]
+    n_aligned = sum(1 for cam in cameras if cam.transform)
+
+    stats = {
+        'cameras': len(cameras),
+        'aligned': n_aligned,
+        'aligned_ratio': n_aligned / len(cameras) if cameras else 0.0,
+        'tie_points': 0,
+        'rms_reprojection_error': float('nan'),
+        'max_reprojection_error': float('nan'),
+    }
+
+    if not chunk.tie_points:
+        return stats
+
+    point_filter = Metashape.TiePoints.Filter()
+    point_filter.init(chunk, criterion=Metashape.TiePoints.Filter.ReprojectionError)
+    errors = np.asarray(point_filter.values, dtype=np.float64)
+    if errors.size:
+        stats['tie_points'] = int(errors.size)
+        stats['rms_reprojection_error'] = float(np.sqrt(np.mean(errors ** 2)))
+        stats['max_reprojection_error'] = float(errors.max())
+    return stats
+
+def print_table(rows, columns):
+    """
+    Print benchmark rows as an aligned text table.
+
+    Args:
+        rows: List of dictionaries
+        columns: Keys to print, in order
+    """
+    def fmt(value):
+        if isinstance(value, float):
+            return f"{value:.3f}"
+        return str(value)
+
+    widths = [max([len(col)] + [len(fmt(row.get(col, ''))) for row in rows]) for col in columns]
+    print("  ".join(col.ljust(w) for col, w in zip(columns, widths)))
+    print("  ".join("-" * w for w in widths))
+    for row in rows:
+        print("  ".join(fmt(row.get(col, '')).ljust(w) for col, w in zip(columns, widths)))
+
+def benchmark_alignment_modes(doc, chunk, modes=('single', 'two_pass'), keep_chunks=False):
+    """
+    Run each alignment mode on a fresh copy of the same chunk and compare
+    wall time, aligned-camera ratio and reprojection error.
+
+    Args:
+        doc: Metashape document
+        chunk: Chunk holding the images to align (existing alignment is not used)
+        modes: Alignment modes to compare (keys of ALIGNMENT_MODES)
+        keep_chunks: Keep the benchmark chunks in the document for inspection
+
+    Returns:
+        List of result dictionaries, one per mode
+    """
+    results = []
+    for mode in modes:
+        test_chunk = chunk.copy(items=[], keypoints=False)
+        test_chunk.label = f"{chunk.label}_bench_{mode}"
+        for camera in test_chunk.cameras:
+            camera.transform = None
+
+        print(f"Benchmarking alignment mode '{mode}' on {test_chunk.label}...")
+        start = time.perf_counter()
+        ALIGNMENT_MODES[mode](test_chunk)
+        elapsed = time.perf_counter() - start
+
+        result = {'mode': mode, 'wall_time_s': elapsed}
+        result.update(alignment_stats(test_chunk))
+        results.append(result)
+
+        if not keep_chunks:
+            doc.remove(test_chunk)
+
+    print_table(results, ['mode', 'wall_time_s', 'cameras', 'aligned', 'aligned_ratio',
+                          'tie_points', 'rms_reprojection_error', 'max_reprojection_error'])
+    return results
+
+def sample_elevation(elevation, x, y):
+    """
+    Sample an elevation model at arrays of coordinates in its CRS.
+
+    Args:
+        elevation: Metashape.Elevation
+        x: Array of X coordinates
+        y: Array of Y coordinates
+
+    Returns:
+        Array of elevations, NaN where the DEM has no data
+    """
+    values = np.full(len(x), np.nan)
+    for i, (px, py) in enumerate(zip(x, y)):
+        try:
+            values[i] = elevation.altitude(Metashape.Vector([px, py]))
+        except Exception:
+            continue
+    values[values <= -32767] = np.nan
+    return values
+
+def benchmark_ortho_surfaces(doc, chunk, smooth_strength='low', dem_resolution=DEM_RESOLUTION,
+                             samples=100, keep_chunks=False):
+    """
+    Compare the tie point mesh and coarse tie point DEM orthorectification paths.
+
+    Both paths run on copies of the aligned chunk and are timed from surface
+    build through orthomosaic build. Geometric differences are measured by
+    rasterising the mesh to a DEM at the same resolution and sampling both
+    surfaces on a regular grid; height differences are converted to the
+    horizontal ortho shift they cause at the image edge.
+
+    Args:
+        doc: Metashape document
+        chunk: Aligned Metashape chunk
+        smooth_strength: Smoothing strength for the mesh path
+        dem_resolution: Resolution in metres of the DEM path (and comparison raster)
+        samples: Number of sample points along each axis
+        keep_chunks: Keep the benchmark chunks in the document for inspection
+
+    Returns:
+        Dictionary with per-path timings and surface difference statistics
+    """
+    results = []
+    test_chunks = {}
+    for surface in ('model', 'dem'):
+        test_chunk = chunk.copy(items=[Metashape.DataSource.TiePointsData], keypoints=False)
+        test_chunk.label = f"{chunk.label}_bench_{surface}"
+        test_chunks[surface] = test_chunk
+
+        print(f"Benchmarking orthorectification surface '{surface}' on {test_chunk.label}...")
+        start = time.perf_counter()
+        surface_data = build_surface(test_chunk, surface=surface, smooth_strength=smooth_strength,
+                                     dem_resolution=dem_resolution)
+        surface_time = time.perf_counter() - start
+        test_chunk.buildOrthomosaic(surface_data=surface_data, refine_seamlines=True)
+        total_time = time.perf_counter() - start
+
+        results.append({'surface': surface, 'surface_time_s': surface_time,
+                        'ortho_time_s': total_time - surface_time, 'total_time_s': total_time})
+
+    print_table(results, ['surface', 'surface_time_s', 'ortho_time_s', 'total_time_s'])
+
+    # Rasterise the mesh so both surfaces can be sampled the same way
+    model_chunk = test_chunks['model']
+    model_chunk.buildDem(source_data=Metashape.DataSource.ModelData, resolution=dem_resolution)
+    dem = test_chunks['dem'].elevation
+    model_dem = model_chunk.elevation
+
+    left, right = max(dem.left, model_dem.left), min(dem.right, model_dem.right)
+    bottom, top = max(dem.bottom, model_dem.bottom), min(dem.top, model_dem.top)
+    xs, ys = np.meshgrid(np.linspace(left, right, samples), np.linspace(bottom, top, samples))
+    xs, ys = xs.ravel(), ys.ravel()
+    diff = sample_elevation(dem, xs, ys) - sample_elevation(model_dem, xs, ys)
+    diff = np.abs(diff[np.isfinite(diff)])
+
+    # Horizontal displacement of an ortho pixel seen at the image edge is dh * tan(half field of view)
+    tan_half_fov = max((sensor.width / 2) / sensor.calibration.f
+                       for sensor in chunk.sensors if sensor.calibration and sensor.calibration.f)
+
+    comparison = {'samples': int(diff.size)}
+    if diff.size:
+        comparison.update({
+            'mean_abs_height_diff_m': float(diff.mean()),
+            'rms_height_diff_m': float(np.sqrt(np.mean(diff ** 2))),
+            'p95_height_diff_m': float(np.percentile(diff, 95)),
+            'max_height_diff_m': float(diff.max()),
+            'p95_edge_shift_m': float(np.percentile(diff, 95) * tan_half_fov),
+            'max_edge_shift_m': float(diff.max() * tan_half_fov),
+        })
+    for key, value in comparison.items():
+        print(f"{key}: {value:.3f}" if isinstance(value, float) else f"{key}: {value}")
+
+    if not keep_chunks:
+        doc.remove(list(test_chunks.values()))
+
+    return {'timings': results, 'comparison': comparison}
+
+def benchmark_export_codecs(chunk, out_dir, product='rgb', codecs=('lzw', 'deflate', 'jpeg', 'cog-zstd', 'cog-deflate'),
+                            block_size=0, keep_files=False):
+    """
+    Export the chunk orthomosaic once per codec and compare write time and file size.
+    Codecs prefixed with 'cog-' are exported uncompressed by Metashape and re-written
+    as Cloud-Optimized GeoTIFF by GDAL, so their time includes both steps.
+
+    Args:
+        chunk: Metashape chunk with an orthomosaic
+        out_dir: Scratch directory for the benchmark exports
+        product: 'rgb' or 'multispec' (multispec exports reflectance and skips JPEG)
+        codecs: Codecs to compare
+        block_size: Block size in pixels, 0 for a single file
+        keep_files: Keep the exported files
+
+    Returns:
+        List of result dictionaries, one per codec
+    """
+    resolution = round(chunk.orthomosaic.resolution, 2)
+    out_dir = Path(out_dir)
+    results = []
+    for codec in codecs:
+        if product == 'multispec' and codec.endswith('jpeg'):
+            print(f"Skipping lossy codec '{codec}' for reflectance data")
+            continue
+
+        cog_codec = codec[len('cog-'):] if codec.startswith('cog-') else None
+        codec_dir = out_dir / codec
+        print(f"Benchmarking export codec '{codec}'...")
+        result = export_raster_timed(chunk, codec_dir / f"{product}_ortho.tif", resolution,
+                                     codec='none' if cog_codec else codec, block_size=block_size,
+                                     raster_transform=(product == 'multispec'), cog_codec=cog_codec)
+        result['codec'] = codec
+        result['mb'] = result['bytes'] / 1e6
+        results.append(result)
+
+        if not keep_files:
+            shutil.rmtree(codec_dir, ignore_errors=True)
+
+    if results:
+        baseline = max(r['bytes'] for r in results)
+        for result in results:
+            result['size_ratio'] = result['bytes'] / baseline if baseline else float('nan')
+
+    print_table(results, ['codec', 'files', 'mb', 'size_ratio', 'write_time_s'])
+    return results
+
+def checkpoint_errors(chunk):
+    """
+    Measure marker errors of an aligned chunk in metres: the distance between each
+    marker's estimated position and its reference location. Markers with their
+    reference disabled are check points; if there are none, all markers with a
+    reference location are used (control point error).
+
+    Args:
+        chunk: Aligned Metashape chunk with loaded markers
+
+    Returns:
+        Dictionary with the marker type used, marker count and RMS / max error in metres
+    """
+    markers = [m for m in chunk.markers if m.reference.location]
+    checkpoints = [m for m in markers if not m.reference.enabled]
+    kind = 'check' if checkpoints else 'control'
+    markers = checkpoints or markers
+
+    errors = []
+    if chunk.crs and chunk.transform.matrix:
+        for marker in markers:
+            if marker.position is None:
+                continue
+            estimated = chunk.transform.matrix.mulp(marker.position)
+            reference = chunk.crs.unproject(marker.reference.location)
+            # Local east/north/up frame, so the error is in metres for geographic CRSs too
+            errors.append(chunk.crs.localframe(reference).mulv(estimated - reference).norm())
+
+    errors = np.asarray(errors, dtype=np.float64)
+    return {
+        'marker_type': kind,
+        'markers': int(errors.size),
+        'rms_marker_error_m': float(np.sqrt(np.mean(errors ** 2))) if errors.size else float('nan'),
+        'max_marker_error_m': float(errors.max()) if errors.size else float('nan'),
+    }
+
+def write_table_csv(rows, columns, path):
+    """
+    Write benchmark rows to a CSV file.
+
+    Args:
+        rows: List of dictionaries
+        columns: Keys to write, in order
+        path: Output CSV path
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=columns, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"Benchmark table written to {path}")
+
+def benchmark_profiles(doc, chunk, profiles=tuple(PROCESSING_PROFILES), smooth_strength='low', ortho=True,
+                       keep_chunks=False, out_csv=None):
+    """
+    Run a plot under each processing profile on fresh copies of the same chunk and
+    compare wall time per stage with alignment quality and marker error.
+
+    Args:
+        doc: Metashape document
+        chunk: Chunk holding the images (existing alignment is not used) and any loaded markers
+        profiles: Profile names to compare (keys of PROCESSING_PROFILES)
+        smooth_strength: Smoothing strength for the model
+        ortho: Also build the orthomosaic (the slowest stage)
+        keep_chunks: Keep the benchmark chunks in the document for inspection
+        out_csv: Optional path of a CSV copy of the comparison table
+
+    Returns:
+        List of result dictionaries, one per profile
+    """
+    results = []
+    for name in profiles:
+        profile = resolve_profile(name)
+        test_chunk = chunk.copy(items=[], keypoints=False)
+        test_chunk.label = f"{chunk.label}_bench_{name}"
+        for camera in test_chunk.cameras:
+            camera.transform = None
+
+        print(f"Benchmarking processing profile '{name}' on {test_chunk.label}...")
+        result = {'profile': name}
+        start = time.perf_counter()
+        if profile['align_mode'] == 'two_pass':
+            align_images_two_pass(test_chunk, downscale=profile['align_downscale'],
+                                  keypoint_limit=profile['keypoint_limit'], tiepoint_limit=profile['tiepoint_limit'])
+        else:
+            align_images(test_chunk, downscale=profile['align_downscale'],
+                         keypoint_limit=profile['keypoint_limit'], tiepoint_limit=profile['tiepoint_limit'])
+        result['align_s'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        if profile['gradual_selection'] > 0:
+            gradual_selection(test_chunk, iterations=profile['gradual_selection'])
+        result['selection_s'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        surface_data = build_surface(test_chunk, surface=profile['ortho_surface'], smooth_strength=smooth_strength,
+                                     dem_resolution=profile['dem_resolution'], face_count=profile['face_count'])
+        result['surface_s'] = time.perf_counter() - start
+
+        if ortho:
+            start = time.perf_counter()
+            test_chunk.buildOrthomosaic(surface_data=surface_data, refine_seamlines=profile['refine_seamlines'])
+            result['ortho_s'] = time.perf_counter() - start
+
+        result['total_s'] = sum(value for key, value in result.items() if key.endswith('_s'))
+        result.update(alignment_stats(test_chunk))
+        result.update(checkpoint_errors(test_chunk))
+        results.append(result)
+
+        if not keep_chunks:
+            doc.remove(test_chunk)
+
+    columns = ['profile', 'align_s', 'selection_s', 'surface_s'] + (['ortho_s'] if ortho else []) + [
+        'total_s', 'cameras', 'aligned_ratio', 'tie_points', 'rms_reprojection_error',
+        'marker_type', 'markers', 'rms_marker_error_m', 'max_marker_error_m']
+    print_table(results, columns)
+    if out_csv:
+        write_table_csv(results, columns, out_csv)
+    return results
+
+def write_synthetic_timestamps(path, lines=100000):
+    """
+    Write a synthetic DJI RTK timestamp file for parser benchmarks.
+
+    Args:
+        path: Output path
+        lines: Number of exposures
+    """
+    with open(path, 'w') as f:
+        for seq in range(1, lines + 1):
+            f.write(f"{seq}\t{369321.5 + seq * 2:.6f}\t[2160]\t   -12,N\t    19,E\t    75,V\t"
+                    f"{-27.1234 + seq * 1e-6:.8f},Lat\t{153.1234 + seq * 1e-6:.8f},Lon\t45.123,Ellh\t"
+                    f"0.012345, 0.012345, 0.023456\t50,Q\n")
+
+def _read_timestamps_in_memory(path):
+    # Baseline: read the whole file, then parse every line
+    with open(path, 'r') as f:
+        lines = f.readlines()
+    return [DJI_MRK_PATTERN.match(line).groupdict() for line in lines if DJI_MRK_PATTERN.match(line)]
+
+def benchmark_mrk_parser(lines=100000, out_dir=None):
+    """
+    Compare the streaming DJI timestamp parser with reading the whole file into memory,
+    on a synthetic file. Reports wall time, throughput and peak Python memory.
+
+    Args:
+        lines: Number of exposures in the synthetic file
+        out_dir: Directory for the synthetic file (default: a temporary directory)
+
+    Returns:
+        List of result dictionaries, one per parser
+    """
+    tmp_dir = tempfile.mkdtemp() if out_dir is None else str(out_dir)
+    Path(tmp_dir).mkdir(parents=True, exist_ok=True)
+    path = Path(tmp_dir) / "benchmark_Timestamp.MRK"
+    write_synthetic_timestamps(path, lines)
+    print(f"Wrote {lines} exposures ({path.stat().st_size / 1e6:.1f} MB) to {path}")
+
+    parsers = {
+        'streaming': lambda: sum(1 for _ in iter_dji_timestamps(path)),
+        'in_memory': lambda: len(_read_timestamps_in_memory(path)),
+    }
+    results = []
+    for name, parse in parsers.items():
+        tracemalloc.start()
+        start = time.perf_counter()
+        parsed = parse()
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        results.append({'parser': name, 'lines': parsed, 'time_s': elapsed,
+                        'lines_per_s': parsed / elapsed if elapsed else float('nan'), 'peak_mb': peak / 1e6})
+
+    if out_dir is None:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    print_table(results, ['parser', 'lines', 'time_s', 'lines_per_s', 'peak_mb'])
+    return results
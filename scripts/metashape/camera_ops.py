@@ -1,12 +1,15 @@
 import datetime
 import Metashape
+from .utils import canonical_band_name
 
-def configure_multispectral_camera(chunk):
+def configure_multispectral_camera(chunk, master_band=None):
     """
     Configures the multispectral camera bands by adjusting their layer indices:
     - Moving Panchro from index 4 to index 10
     - Adjusting all other bands accordingly
     - Provides instructions for manually setting Panchro as the master camera
+    When only a subset of bands was loaded without Panchro, the loaded bands keep
+    contiguous layer indices and master_band (e.g. 'nir') is made the master camera.
     """
     print("Configuring multispectral camera band indices...")
     
@@ -34,6 +37,9 @@ def configure_multispectral_camera(chunk):
             break
     
     if not panchro_sensor:
+        if master_band:
+            set_master_band(multispec_sensors, master_band)
+            return
         print("Warning: Panchro sensor not found. Cannot reconfigure multispectral camera.")
         return
     
@@ -82,21 +88,50 @@ def configure_multispectral_camera(chunk):
     panchro_sensor.makeMaster()
     print(f"Set {panchro_sensor.label} as master camera")
 
-def remove_images_outside_rgb_times(chunk):
+def set_master_band(multispec_sensors, band):
+    """
+    Remap the layer indices of a band subset to 0..n-1 in their current order and
+    make the given band the master camera.
+    
+    Args:
+        multispec_sensors: List of multispectral sensors
+        band: Canonical band name of the master (e.g. 'nir')
+    """
+    sorted_sensors = sorted(multispec_sensors, key=lambda x: x.layer_index)
+    temp_offset = 100
+    for sensor in sorted_sensors:
+        sensor.layer_index += temp_offset
+    for new_index, sensor in enumerate(sorted_sensors):
+        sensor.layer_index = new_index
+        print(f"Set {sensor.label} to layer index {sensor.layer_index}")
+    
+    for sensor in sorted_sensors:
+        if canonical_band_name(sensor.label) == band:
+            sensor.makeMaster()
+            print(f"Set {sensor.label} as master camera")
+            return
+    print(f"Warning: {band} sensor not found. Keeping the default master camera.")
+
+def remove_images_outside_rgb_times(chunk, rgb_chunk=None, cameras=None):
     """
     Removes multispectral images that were captured outside of RGB camera capture times.
     Uses filename prefixes to identify RGB ('DJI_') and multispectral ('IMG_') cameras.
     Automatically detects and adjusts for time offset between cameras.
+    
+    Args:
+        chunk: Metashape chunk with the multispectral cameras
+        rgb_chunk: Chunk holding the RGB cameras (defaults to chunk)
+        cameras: Optional list of master cameras to check (defaults to all cameras)
     """
     print("Removing images outside RGB capture times...")
     
     # Maximum allowed time offset in hours (to avoid matching wrong days)
     MAX_OFFSET_HOURS = 6
     
-    def get_camera_timestamps(prefix):
+    def get_camera_timestamps(source_chunk, prefix):
         """Helper function to get timestamps for cameras with given prefix"""
         timestamps = []
-        for camera in chunk.cameras:
+        for camera in source_chunk.cameras:
             if not camera.label.startswith(prefix):
                 continue
             if not camera.label == camera.master.label:
@@ -117,7 +152,7 @@ def remove_images_outside_rgb_times(chunk):
         return timestamps
     
     # Get RGB camera timestamps
-    rgb_timestamps = get_camera_timestamps('DJI_')
+    rgb_timestamps = get_camera_timestamps(rgb_chunk or chunk, 'DJI_')
     if not rgb_timestamps:
         print("Could not get RGB camera timestamps")
         return
@@ -127,7 +162,7 @@ def remove_images_outside_rgb_times(chunk):
     last_rgb_time = max(rgb_timestamps)
     
     # Get multispectral camera timestamps
-    multispec_timestamps = get_camera_timestamps('IMG_')
+    multispec_timestamps = get_camera_timestamps(chunk, 'IMG_')
     if not multispec_timestamps:
         print("Could not get multispectral camera timestamps")
         return
@@ -165,7 +200,10 @@ def remove_images_outside_rgb_times(chunk):
     del_camera_names = list()
 
     # Check multispectral cameras
+    check_keys = {camera.key for camera in cameras} if cameras is not None else None
     for camera in chunk.cameras:
+        if check_keys is not None and camera.key not in check_keys:
+            continue
         if not camera.label.startswith('IMG_'):
             continue
         if not camera.label == camera.master.label:
@@ -0,0 +1,233 @@
+import datetime
+import json
+import os
+import socket
+import sqlite3
+import time
+from pathlib import Path
+
+SPOOL_NAME = "level1_catalog_spool"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    plot TEXT NOT NULL,
+    date TEXT NOT NULL,
+    product TEXT NOT NULL,
+    resolution REAL,
+    crs TEXT,
+    min_x REAL, min_y REAL, max_x REAL, max_y REAL,
+    bands TEXT,
+    calibration TEXT,
+    profile TEXT,
+    exported TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS products_date ON products (date);
+CREATE INDEX IF NOT EXISTS products_plot ON products (plot, date);
+CREATE VIRTUAL TABLE IF NOT EXISTS products_footprint USING rtree (id, min_lon, max_lon, min_lat, max_lat);
+"""
+
+def default_spool_dir(imagery_dir):
+    """
+    Spool directory shared by all plots: <root>/level1_catalog_spool for imagery
+    directories laid out as <root>/<plot>/YYYYMMDD/imagery/.
+
+    Args:
+        imagery_dir: Path to <plot>/YYYYMMDD/imagery/
+
+    Returns:
+        Spool directory path
+    """
+    return Path(imagery_dir).resolve().parents[2] / SPOOL_NAME
+
+def spool_product(spool_dir, **entry):
+    """
+    Queue a product for the catalog as one JSON file per export. Exporters on
+    different hosts never write the SQLite catalog, whose locking is unreliable on
+    network filesystems; ingest_spool adds the entries from a single writer.
+
+    Args:
+        spool_dir: Spool directory
+        **entry: Arguments of catalog_product other than catalog_path
+
+    Returns:
+        Path of the spooled entry
+    """
+    spool_dir = Path(spool_dir)
+    spool_dir.mkdir(parents=True, exist_ok=True)
+    name = f"{time.time_ns()}_{socket.gethostname()}_{os.getpid()}.json"
+    tmp_path = spool_dir / f".{name}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(entry, f)
+    os.replace(tmp_path, spool_dir / name)
+    return spool_dir / name
+
+def ingest_spool(catalog_path, spool_dir):
+    """
+    Add spooled products to the catalog in export order and remove their spool files.
+    Run from one process only, as the single writer of the catalog.
+
+    Args:
+        catalog_path: Path to the SQLite catalog
+        spool_dir: Spool directory written by spool_product
+
+    Returns:
+        Number of products added
+    """
+    added = 0
+    for entry_path in sorted(Path(spool_dir).glob("*.json")):
+        try:
+            with open(entry_path) as f:
+                entry = json.load(f)
+            catalog_product(catalog_path, **entry)
+        except (ValueError, TypeError, KeyError) as e:
+            print(f"Warning: could not catalog spooled entry {entry_path}: {e}")
+            os.replace(entry_path, entry_path.with_suffix('.bad'))
+            continue
+        entry_path.unlink()
+        added += 1
+    return added
+
+def open_catalog(catalog_path):
+    """
+    Open (and create if needed) a product catalog.
+
+    Args:
+        catalog_path: Path to the SQLite catalog
+
+    Returns:
+        sqlite3.Connection
+    """
+    Path(catalog_path).parent.mkdir(parents=True, exist_ok=True)
+    # Exports of several plots can finish at the same time, so wait for the lock
+    connection = sqlite3.connect(str(catalog_path), timeout=60)
+    connection.row_factory = sqlite3.Row
+    connection.executescript(SCHEMA)
+    return connection
+
+def _iso_date(yyyymmdd):
+    return datetime.datetime.strptime(str(yyyymmdd), "%Y%m%d").date().isoformat()
+
+def catalog_product(catalog_path, path, plot, yyyymmdd, product, resolution, crs, bounds, footprint,
+                    bands=None, calibration=None, profile=None):
+    """
+    Add or update a level1 product in the catalog.
+
+    Args:
+        catalog_path: Path to the SQLite catalog
+        path: Exported product path
+        plot: Plot identifier
+        yyyymmdd: Capture date string in YYYYMMDD format
+        product: Product name, e.g. 'rgb' or 'multispec'
+        resolution: Resolution in CRS units
+        crs: Coordinate system identifier (e.g. 'EPSG::32755') or WKT
+        bounds: (min_x, min_y, max_x, max_y) in the product CRS
+        footprint: (min_lon, min_lat, max_lon, max_lat) in WGS84, used for spatial queries
+        bands: Optional list of band names
+        calibration: Optional dictionary of calibration parameters
+        profile: Optional processing profile name
+
+    Returns:
+        Catalog id of the product
+    """
+    row = {
+        'path': str(Path(path).resolve()),
+        'plot': plot,
+        'date': _iso_date(yyyymmdd),
+        'product': product,
+        'resolution': resolution,
+        'crs': crs,
+        'min_x': bounds[0], 'min_y': bounds[1], 'max_x': bounds[2], 'max_y': bounds[3],
+        'bands': json.dumps(bands) if bands is not None else None,
+        'calibration': json.dumps(calibration) if calibration is not None else None,
+        'profile': profile,
+        'exported': datetime.datetime.now().isoformat(timespec='seconds'),
+    }
+    columns = ', '.join(row)
+    updates = ', '.join(f"{column} = excluded.{column}" for column in row if column != 'path')
+    with open_catalog(catalog_path) as connection:
+        connection.execute(f"INSERT INTO products ({columns}) VALUES ({', '.join('?' * len(row))}) "
+                           f"ON CONFLICT(path) DO UPDATE SET {updates}", list(row.values()))
+        product_id = connection.execute("SELECT id FROM products WHERE path = ?", (row['path'],)).fetchone()[0]
+        min_lon, min_lat, max_lon, max_lat = footprint
+        connection.execute("INSERT OR REPLACE INTO products_footprint VALUES (?, ?, ?, ?, ?)",
+                           (product_id, min_lon, max_lon, min_lat, max_lat))
+    connection.close()
+    return product_id
+
+def query_catalog(catalog_path, bbox=None, start=None, end=None, product=None, plot=None):
+    """
+    Find catalogued products by footprint, date range, product and plot.
+
+    Args:
+        catalog_path: Path to the SQLite catalog
+        bbox: Optional (min_lon, min_lat, max_lon, max_lat) the footprint must intersect
+        start: Optional first date (YYYYMMDD)
+        end: Optional last date (YYYYMMDD)
+        product: Optional product name
+        plot: Optional plot identifier
+
+    Returns:
+        List of product dictionaries ordered by date and plot
+    """
+    # CROSS JOIN fixes the join order, so bounding box queries are driven by the R-tree
+    # and other queries by the date and plot indexes
+    if bbox is not None:
+        sql = "SELECT p.*, f.min_lon, f.min_lat, f.max_lon, f.max_lat FROM products_footprint f CROSS JOIN products p"
+    else:
+        sql = "SELECT p.*, f.min_lon, f.min_lat, f.max_lon, f.max_lat FROM products p CROSS JOIN products_footprint f"
+    conditions, params = ["f.id = p.id"], []
+    if bbox is not None:
+        min_lon, min_lat, max_lon, max_lat = bbox
+        conditions += ["f.max_lon >= ?", "f.min_lon <= ?", "f.max_lat >= ?", "f.min_lat <= ?"]
+        params += [min_lon, max_lon, min_lat, max_lat]
+    if start:
+        conditions.append("p.date >= ?")
+        params.append(_iso_date(start))
+    if end:
+        conditions.append("p.date <= ?")
+        params.append(_iso_date(end))
+    if product:
+        conditions.append("p.product = ?")
+        params.append(product)
+    if plot:
+        conditions.append("p.plot = ?")
+        params.append(plot)
+    sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY p.date, p.plot, p.product, p.resolution"
+
+    with open_catalog(catalog_path) as connection:
+        rows = connection.execute(sql, params).fetchall()
+    connection.close()
+
+    results = []
+    for row in rows:
+        result = dict(row)
+        for key in ('bands', 'calibration'):
+            if result[key] is not None:
+                result[key] = json.loads(result[key])
+        results.append(result)
+    return results
+
+def prune_catalog(catalog_path):
+    """
+    Remove catalog entries whose product files no longer exist.
+
+    Args:
+        catalog_path: Path to the SQLite catalog
+
+    Returns:
+        Number of entries removed
+    """
+    with open_catalog(catalog_path) as connection:
+        missing = []
+        for row in connection.execute("SELECT id, path FROM products").fetchall():
+            # Products split in blocks are catalogued by their block manifest
+            if not Path(row['path']).exists():
+                missing.append(row['id'])
+        for product_id in missing:
+            connection.execute("DELETE FROM products WHERE id = ?", (product_id,))
+            connection.execute("DELETE FROM products_footprint WHERE id = ?", (product_id,))
+    connection.close()
+    return len(missing)
@@ -0,0 +1,243 @@
+import hashlib
+import json
+import mmap
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from .image_utils import read_capture_time
+
+MANIFEST_NAME = "scan_manifest.json"
+
+# Bytes read from the start and end of a file for the quick pre-hash
+QUICK_HASH_BYTES = 64 * 1024
+
+def load_scan_manifest(manifest_path):
+    """
+    Load a scan manifest of file sizes, modification times and hashes.
+
+    Args:
+        manifest_path: Path to the manifest JSON
+
+    Returns:
+        Dictionary of relative path -> {'size', 'mtime', 'quick', 'hash'}
+    """
+    manifest_path = Path(manifest_path)
+    if not manifest_path.is_file():
+        return {}
+    with open(manifest_path) as f:
+        return json.load(f).get('files', {})
+
+def save_scan_manifest(manifest_path, files):
+    """
+    Save a scan manifest atomically.
+
+    Args:
+        manifest_path: Path to the manifest JSON
+        files: Dictionary from load_scan_manifest
+    """
+    manifest_path = Path(manifest_path)
+    tmp_path = manifest_path.with_suffix('.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump({'files': files}, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+def _quick_digest(path, size):
+    # Hash of the head and tail of the file, enough to split most same-size groups
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        digest.update(f.read(QUICK_HASH_BYTES))
+        if size > 2 * QUICK_HASH_BYTES:
+            f.seek(size - QUICK_HASH_BYTES)
+            digest.update(f.read(QUICK_HASH_BYTES))
+    return digest.hexdigest()
+
+def _full_digest(path, size):
+    digest = hashlib.blake2b(digest_size=16)
+    if size == 0:
+        return digest.hexdigest()
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        digest.update(data)
+    return digest.hexdigest()
+
+def _hash_entries(entries, field, func, workers):
+    # Fill entry[field] for every (path, entry) pair missing it
+    todo = [(path, entry) for path, entry in entries if field not in entry]
+    if not todo:
+        return 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        digests = executor.map(lambda job: func(job[0], job[1]['size']), todo)
+        for (_, entry), digest in zip(todo, digests):
+            entry[field] = digest
+    return len(todo)
+
+def scan_entries(image_paths, root, files):
+    """
+    Look up or create the manifest entry of each image. Entries whose size or
+    modification time changed are reset so their hashes are recomputed.
+
+    Args:
+        image_paths: Image paths below root
+        root: Directory the manifest keys are relative to
+        files: Dictionary from load_scan_manifest, updated in place
+
+    Returns:
+        List of (path, entry) tuples
+    """
+    entries = []
+    for path in image_paths:
+        stat = os.stat(path)
+        key = os.path.relpath(path, root).replace(os.sep, '/')
+        entry = files.get(key)
+        if entry is None or entry['size'] != stat.st_size or entry['mtime'] != int(stat.st_mtime):
+            entry = {'size': stat.st_size, 'mtime': int(stat.st_mtime)}
+            files[key] = entry
+        entries.append((path, entry))
+    return entries
+
+def find_duplicates(entries, workers=8):
+    """
+    Find files with identical content. Files are grouped by size, only groups with
+    more than one file get a quick head/tail hash, and only files whose quick hashes
+    collide are fully hashed (memory mapped, in a thread pool).
+
+    Args:
+        entries: List of (path, entry) tuples from scan_entries
+        workers: Number of hashing threads
+
+    Returns:
+        Dictionary of duplicate path -> path of the copy that is kept
+    """
+    by_size = defaultdict(list)
+    for path, entry in entries:
+        by_size[entry['size']].append((path, entry))
+    candidates = [item for group in by_size.values() if len(group) > 1 for item in group]
+    quick_hashed = _hash_entries(candidates, 'quick', _quick_digest, workers)
+
+    by_quick = defaultdict(list)
+    for path, entry in candidates:
+        by_quick[(entry['size'], entry['quick'])].append((path, entry))
+    candidates = [item for group in by_quick.values() if len(group) > 1 for item in group]
+    full_hashed = _hash_entries(candidates, 'hash', _full_digest, workers)
+    print(f"Hashed {quick_hashed} files (quick) and {full_hashed} files (full) of {len(entries)}; "
+          f"others reused from the manifest or unique by size")
+
+    by_hash = defaultdict(list)
+    for path, entry in candidates:
+        by_hash[entry['hash']].append(path)
+
+    duplicates = {}
+    for paths in by_hash.values():
+        # Keep the shortest path, so 'IMG_0001_1.tif' wins over 'IMG_0001_1 (1).tif' or 'copy/IMG_0001_1.tif'
+        paths = sorted(paths, key=lambda p: (len(p), p))
+        for path in paths[1:]:
+            duplicates[path] = paths[0]
+    return duplicates
+
+def canonical_flight(paths, flight_of):
+    """
+    Choose the flight that keeps an image uploaded into several date folders: the
+    folder named after the image's EXIF capture date, otherwise the earliest folder.
+    The choice only depends on the group, so every flight's run makes the same one.
+
+    Args:
+        paths: Paths of identical images
+        flight_of: Dictionary of path -> imagery directory (<plot>/YYYYMMDD/imagery/) of its flight
+            on network storage, also for images read from a staged copy
+
+    Returns:
+        Imagery directory of the canonical flight
+    """
+    roots = sorted({flight_of[path] for path in paths}, key=lambda root: (root.parent.name, str(root)))
+    if len(roots) == 1:
+        return roots[0]
+    captured = read_capture_time(min(paths, key=lambda p: (len(p), p)))
+    if captured:
+        matching = [root for root in roots if root.parent.name == captured.strftime("%Y%m%d")]
+        if matching:
+            return matching[0]
+    return roots[0]
+
+def deduplicate_images(image_paths, root, manifest_path, other_flights=(), workers=8):
+    """
+    Remove duplicate images from a scan before they are added to Metashape.
+
+    Duplicates within the flight are dropped, keeping one copy. If other flights are
+    given, images identical to an image of another flight (e.g. the same SD card
+    uploaded into two date folders) are kept only by the canonical flight of each
+    group (see canonical_flight) and dropped from this flight otherwise. The other
+    flights' manifests are read for cached hashes but never written.
+
+    Args:
+        image_paths: Image paths of the flight, below root
+        root: Imagery directory the image paths are below
+        manifest_path: Scan manifest of the flight, storing hashes for later runs
+        other_flights: Iterable of (image paths, root, manifest path) of other flights to compare with
+        workers: Number of hashing threads
+
+    Returns:
+        List of image paths without duplicates, in the original order
+    """
+    files = load_scan_manifest(manifest_path)
+    entries = scan_entries(image_paths, root, files)
+
+    # Flights are told apart by their manifest's directory, which stays on network storage when staged
+    flight = Path(manifest_path).parent
+    flight_of = dict.fromkeys(image_paths, flight)
+    all_entries = list(entries)
+    for other_paths, other_root, other_manifest in other_flights:
+        other_entries = scan_entries(other_paths, other_root, load_scan_manifest(other_manifest))
+        flight_of.update(dict.fromkeys(other_paths, Path(other_manifest).parent))
+        all_entries += other_entries
+
+    duplicates = find_duplicates(all_entries, workers=workers)
+    save_scan_manifest(manifest_path, files)
+
+    groups = defaultdict(list)
+    for path, kept in duplicates.items():
+        groups[kept].append(path)
+
+    own = set(image_paths)
+    dropped = {}
+    for kept, copies in groups.items():
+        paths = [kept] + copies
+        own_paths = [path for path in paths if path in own]
+        if not own_paths:
+            continue
+        canonical = canonical_flight(paths, flight_of)
+        if canonical == flight:
+            # Keep one copy in this flight, preferring the shortest path as within a flight
+            keep = min(own_paths, key=lambda p: (len(p), p))
+        else:
+            keep = min((path for path in paths if flight_of[path] == canonical),
+                       key=lambda p: (len(p), p))
+        for path in own_paths:
+            if path != keep:
+                dropped[path] = keep
+
+    for path, original in sorted(dropped.items()):
+        where = "this flight" if original in own else "another flight"
+        print(f"Duplicate image {os.path.relpath(path, root)} (same content as {original} in {where})")
+    if dropped:
+        print(f"Excluded {len(dropped)} duplicate images of {len(image_paths)}")
+    return [path for path in image_paths if path not in dropped]
+
+def other_flight_images(imagery_dir, subdir, find_func):
+    """
+    List the images of the other flights of a plot, i.e. <plot>/*/imagery/<subdir>.
+
+    Args:
+        imagery_dir: Path to <plot>/YYYYMMDD/imagery/ of the current flight
+        subdir: Sub-directory of imagery/ holding the images, e.g. 'rgb/level0_raw'
+        find_func: Function listing the images of a directory
+
+    Returns:
+        List of (image paths, root, manifest path) tuples
+    """
+    imagery_dir = Path(imagery_dir)
+    flights = []
+    for other in sorted(imagery_dir.parent.parent.glob("*/imagery")):
+        if other.resolve() == imagery_dir.resolve() or not (other / subdir).is_dir():
+            continue
+        flights.append((find_func(other / subdir), other, other / MANIFEST_NAME))
+    return flights
@@ -0,0 +1,268 @@
+from pathlib import Path
+import numpy as np
+import Metashape
+from .processing import optimize_cameras
+
+# Robust z-score (median / MAD) above which a camera's error is flagged
+OUTLIER_Z = 3.5
+
+# Cameras with fewer tie points than this fraction of the median are flagged
+MIN_TIE_POINT_FRACTION = 0.1
+
+def _tie_point_arrays(chunk):
+    # Point coordinates (chunk frame) indexed by track id, and a validity mask
+    tie_points = chunk.tie_points
+    n_tracks = len(tie_points.tracks)
+    coords = np.full((n_tracks, 3), np.nan)
+    valid = np.zeros(n_tracks, dtype=bool)
+    for point in tie_points.points:
+        if point.valid:
+            coord = point.coord
+            coords[point.track_id] = (coord.x / coord.w, coord.y / coord.w, coord.z / coord.w)
+            valid[point.track_id] = True
+    return coords, valid
+
+def _camera_projections(tie_points, camera, valid):
+    # Measured image coordinates and track ids of a camera's projections of valid points
+    projections = tie_points.projections[camera]
+    if not projections:
+        return np.empty((0, 2)), np.empty(0, dtype=np.int64)
+    track_ids = np.fromiter((p.track_id for p in projections), dtype=np.int64, count=len(projections))
+    measured = np.array([(p.coord.x, p.coord.y) for p in projections])
+    keep = valid[track_ids]
+    return measured[keep], track_ids[keep]
+
+def project_frame(camera, points):
+    """
+    Project chunk-frame points into a frame camera with the Metashape frame camera
+    model (radial k1-k4, tangential p1/p2, affinity b1/b2), vectorised over points.
+
+    Args:
+        camera: Aligned Metashape camera with a frame sensor
+        points: Points in the chunk frame, shape (n, 3)
+
+    Returns:
+        Image coordinates in pixels, shape (n, 2)
+    """
+    inverse = camera.transform.inv()
+    transform = np.array([[inverse[row, col] for col in range(4)] for row in range(4)])
+    local = points @ transform[:3, :3].T + transform[:3, 3]
+    x = local[:, 0] / local[:, 2]
+    y = local[:, 1] / local[:, 2]
+
+    calib = camera.sensor.calibration
+    r2 = x * x + y * y
+    radial = 1 + r2 * (calib.k1 + r2 * (calib.k2 + r2 * (calib.k3 + r2 * calib.k4)))
+    xd = x * radial + calib.p1 * (r2 + 2 * x * x) + 2 * calib.p2 * x * y
+    yd = y * radial + calib.p2 * (r2 + 2 * y * y) + 2 * calib.p1 * x * y
+    u = calib.width * 0.5 + calib.cx + xd * (calib.f + calib.b1) + yd * calib.b2
+    v = calib.height * 0.5 + calib.cy + yd * calib.f
+    return np.column_stack([u, v])
+
+def _project_loop(camera, points):
+    # Fallback for non-frame sensors: one camera.project call per point
+    projected = np.full((len(points), 2), np.nan)
+    for i, point in enumerate(points):
+        pixel = camera.project(Metashape.Vector([float(v) for v in point]))
+        if pixel is not None:
+            projected[i] = (pixel.x, pixel.y)
+    return projected
+
+def _frame_model_matches(camera, points, tolerance=0.05):
+    # Check the vectorised model against Metashape on a few points of one camera per sensor.
+    # Additional corrections (fit_corrections) are not modelled, hence the tolerance.
+    sample = points[:10]
+    return bool(np.nanmax(np.abs(project_frame(camera, sample) - _project_loop(camera, sample))) <= tolerance)
+
+def _position_errors(chunk, cameras):
+    # Estimated minus reference camera position in local east/north/up metres
+    errors = np.full((len(cameras), 3), np.nan)
+    if not chunk.crs or not chunk.transform.matrix:
+        return errors
+    matrix = chunk.transform.matrix
+    for i, camera in enumerate(cameras):
+        if not camera.transform or not camera.reference.location:
+            continue
+        estimated = matrix.mulp(camera.center)
+        reference = chunk.crs.unproject(camera.reference.location)
+        diff = chunk.crs.localframe(reference).mulv(estimated - reference)
+        errors[i] = (diff.x, diff.y, diff.z)
+    return errors
+
+def camera_diagnostics(chunk):
+    """
+    Collect per-camera alignment diagnostics as NumPy columns. Tie points are read
+    once into arrays, and reprojection errors of frame cameras are computed with a
+    vectorised camera model instead of one camera.project call per projection.
+
+    Args:
+        chunk: Aligned Metashape chunk
+
+    Returns:
+        Dictionary of column name -> array, one row per camera
+    """
+    cameras = list(chunk.cameras)
+    n = len(cameras)
+    columns = {
+        'key': np.array([camera.key for camera in cameras], dtype=np.int64),
+        'label': np.array([camera.label for camera in cameras], dtype=str),
+        'sensor': np.array([camera.sensor.label if camera.sensor else '' for camera in cameras], dtype=str),
+        'master': np.array([camera.master.key for camera in cameras], dtype=np.int64),
+        'enabled': np.array([bool(camera.enabled) for camera in cameras]),
+        'aligned': np.array([camera.transform is not None for camera in cameras]),
+        'tie_points': np.zeros(n, dtype=np.int64),
+        'reprojection_error': np.full(n, np.nan),
+        'max_reprojection_error': np.full(n, np.nan),
+    }
+
+    if chunk.tie_points:
+        tie_points = chunk.tie_points
+        coords, valid = _tie_point_arrays(chunk)
+        vectorised = {}
+        for i, camera in enumerate(cameras):
+            if not camera.transform:
+                continue
+            measured, track_ids = _camera_projections(tie_points, camera, valid)
+            columns['tie_points'][i] = len(track_ids)
+            if not len(track_ids):
+                continue
+            points = coords[track_ids]
+            sensor = camera.sensor
+            if sensor.key not in vectorised:
+                vectorised[sensor.key] = (sensor.type == Metashape.Sensor.Type.Frame
+                                          and _frame_model_matches(camera, points))
+                if not vectorised[sensor.key]:
+                    print(f"Projecting tie points of sensor {sensor.label} point by point "
+                          f"(not a frame sensor, or the vectorised model does not match)")
+            projected = project_frame(camera, points) if vectorised[sensor.key] else _project_loop(camera, points)
+            residuals = np.linalg.norm(projected - measured, axis=1)
+            residuals = residuals[np.isfinite(residuals)]
+            if residuals.size:
+                columns['reprojection_error'][i] = np.sqrt(np.mean(residuals ** 2))
+                columns['max_reprojection_error'][i] = residuals.max()
+
+    errors = _position_errors(chunk, cameras)
+    columns['position_error_east'] = errors[:, 0]
+    columns['position_error_north'] = errors[:, 1]
+    columns['position_error_up'] = errors[:, 2]
+    columns['position_error'] = np.linalg.norm(errors, axis=1)
+    return columns
+
+def _robust_high(values, z=OUTLIER_Z):
+    # Flag values above median + z * scaled MAD; NaNs are never flagged
+    finite = values[np.isfinite(values)]
+    flags = np.zeros(len(values), dtype=bool)
+    if finite.size < 3:
+        return flags, float('nan')
+    median = np.median(finite)
+    mad = 1.4826 * np.median(np.abs(finite - median))
+    threshold = median + z * mad if mad > 0 else np.inf
+    flags[np.isfinite(values)] = values[np.isfinite(values)] > threshold
+    return flags, float(threshold)
+
+def flag_outliers(columns, z=OUTLIER_Z, min_tie_point_fraction=MIN_TIE_POINT_FRACTION):
+    """
+    Flag outlier cameras in camera_diagnostics columns. Errors are compared per
+    sensor, so bands with different resolutions do not flag each other.
+
+    Adds boolean columns 'unaligned', 'few_tie_points', 'high_reprojection_error',
+    'high_position_error' and 'outlier' (any of them) in place.
+
+    Args:
+        columns: Dictionary from camera_diagnostics
+        z: Robust z-score above which an error is flagged
+        min_tie_point_fraction: Flag cameras with fewer tie points than this fraction of the sensor median
+
+    Returns:
+        Dictionary of per-sensor thresholds
+    """
+    n = len(columns['key'])
+    active = columns['enabled']
+    aligned = active & columns['aligned']
+    columns['unaligned'] = active & ~columns['aligned']
+    columns['few_tie_points'] = np.zeros(n, dtype=bool)
+    columns['high_reprojection_error'] = np.zeros(n, dtype=bool)
+    thresholds = {}
+    for sensor in np.unique(columns['sensor']):
+        rows = aligned & (columns['sensor'] == sensor)
+        if not rows.any():
+            continue
+        min_points = min_tie_point_fraction * np.median(columns['tie_points'][rows])
+        columns['few_tie_points'][rows] = columns['tie_points'][rows] < min_points
+        flags, threshold = _robust_high(columns['reprojection_error'][rows], z)
+        columns['high_reprojection_error'][rows] = flags
+        thresholds[str(sensor)] = {'min_tie_points': float(min_points), 'max_reprojection_error': threshold}
+
+    # Position error is a property of the capture, so compare masters only
+    masters = aligned & (columns['key'] == columns['master'])
+    columns['high_position_error'] = np.zeros(n, dtype=bool)
+    flags, threshold = _robust_high(columns['position_error'][masters], z)
+    columns['high_position_error'][masters] = flags
+    thresholds['max_position_error'] = threshold
+
+    columns['outlier'] = (columns['unaligned'] | columns['few_tie_points']
+                          | columns['high_reprojection_error'] | columns['high_position_error'])
+    return thresholds
+
+def write_camera_diagnostics(chunk, path, z=OUTLIER_Z):
+    """
+    Write per-camera diagnostics with outlier flags to a compressed .npz file (one
+    array per column) and print a summary of the outliers.
+
+    Args:
+        chunk: Aligned Metashape chunk
+        path: Output .npz path
+        z: Robust z-score above which an error is flagged
+
+    Returns:
+        Dictionary of columns, including the outlier flags
+    """
+    columns = camera_diagnostics(chunk)
+    thresholds = flag_outliers(columns, z=z)
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    np.savez_compressed(path, **columns)
+
+    aligned = columns['enabled'] & columns['aligned']
+    print(f"Camera diagnostics for {chunk.label}: {int(aligned.sum())} of {int(columns['enabled'].sum())} "
+          f"enabled cameras aligned, median reprojection error "
+          f"{np.nanmedian(columns['reprojection_error'][aligned]) if aligned.any() else float('nan'):.3f} px")
+    for sensor, limits in thresholds.items():
+        if sensor != 'max_position_error':
+            print(f"  {sensor}: flagging < {limits['min_tie_points']:.0f} tie points, "
+                  f"> {limits['max_reprojection_error']:.3f} px")
+    for reason in ('unaligned', 'few_tie_points', 'high_reprojection_error', 'high_position_error'):
+        labels = columns['label'][columns[reason]]
+        if labels.size:
+            shown = ', '.join(labels[:10]) + (' ...' if labels.size > 10 else '')
+            print(f"  {reason}: {labels.size} cameras ({shown})")
+    print(f"{int(columns['outlier'].sum())} outlier cameras. Diagnostics saved to: {path}")
+    return columns
+
+def drop_outlier_cameras(chunk, columns, reasons=('few_tie_points', 'high_reprojection_error', 'high_position_error')):
+    """
+    Disable the cameras flagged for the given reasons and re-optimize.
+    Unaligned cameras are not included by default, as they do not affect optimization.
+
+    Args:
+        chunk: Metashape chunk the diagnostics were computed on
+        columns: Dictionary from write_camera_diagnostics
+        reasons: Outlier flags to act on
+
+    Returns:
+        Number of cameras disabled
+    """
+    flagged = np.zeros(len(columns['key']), dtype=bool)
+    for reason in reasons:
+        flagged |= columns[reason]
+    # Multispectral bands are aligned per capture, so disable the whole capture
+    masters = set(columns['master'][flagged].tolist())
+    disabled = 0
+    for camera in chunk.cameras:
+        if camera.master.key in masters and camera.enabled:
+            camera.enabled = False
+            disabled += 1
+    if disabled:
+        print(f"Disabled {disabled} outlier cameras, re-optimizing...")
+        optimize_cameras(chunk)
+    return disabled
@@ -0,0 +1,233 @@
+import json
+import re
+import time
+from pathlib import Path
+import Metashape
+from .processing import reflectance_band_sensors
+
+# TIFF codecs supported by Metashape's exporter
+TIFF_CODECS = {
+    'none': Metashape.ImageCompression.TiffCompressionNone,
+    'lzw': Metashape.ImageCompression.TiffCompressionLZW,
+    'deflate': Metashape.ImageCompression.TiffCompressionDeflate,
+    'packbits': Metashape.ImageCompression.TiffCompressionPackbits,
+    'jpeg': Metashape.ImageCompression.TiffCompressionJPEG,
+}
+
+# Codecs only available when re-writing the export as a Cloud-Optimized GeoTIFF with GDAL
+COG_CODECS = ('zstd', 'deflate', 'lzw', 'jpeg', 'none')
+
+def resolution_suffix(res_xy):
+    """
+    Format a resolution for product file names, e.g. 0.05 -> '05'.
+    
+    Args:
+        res_xy: Resolution rounded to 2 decimal places
+        
+    Returns:
+        Decimal digits of the resolution
+    """
+    return str(res_xy).split('.')[1]
+
+def make_compression(codec='lzw', jpeg_quality=90, overviews=True):
+    """
+    Create TIFF export settings: tiled BigTIFF with internal overviews.
+
+    Args:
+        codec: One of TIFF_CODECS
+        jpeg_quality: JPEG quality when codec is 'jpeg'
+        overviews: Whether to write internal overviews
+
+    Returns:
+        Metashape.ImageCompression
+    """
+    if codec not in TIFF_CODECS:
+        raise ValueError(f"Unsupported TIFF codec '{codec}', expected one of {sorted(TIFF_CODECS)}")
+
+    compression = Metashape.ImageCompression()
+    compression.tiff_compression = TIFF_CODECS[codec]
+    compression.tiff_big = True
+    compression.tiff_tiled = True
+    compression.tiff_overviews = overviews
+    if codec == 'jpeg':
+        compression.jpeg_quality = jpeg_quality
+    return compression
+
+def block_kwargs(block_size):
+    """
+    Build the exportRaster arguments that split the output into square blocks.
+
+    Args:
+        block_size: Block size in pixels, 0 for a single file
+
+    Returns:
+        Dictionary of extra exportRaster arguments
+    """
+    if not block_size:
+        return {}
+    return {'split_in_blocks': True, 'block_width': block_size, 'block_height': block_size}
+
+def find_export_files(path):
+    """
+    Find the files written for an export path, including split blocks.
+    Blocks are written next to the requested path with '-<col>-<row>' appended to its stem.
+
+    Args:
+        path: Path passed to exportRaster
+
+    Returns:
+        Sorted list of paths
+    """
+    path = Path(path)
+    if path.is_file():
+        return [path]
+    pattern = re.compile(rf"^{re.escape(path.stem)}(-\d+)+{re.escape(path.suffix)}$")
+    return sorted(p for p in path.parent.glob(f"{path.stem}-*{path.suffix}") if pattern.match(p.name))
+
+def write_block_manifest(path, codec, block_size, resolution, product):
+    """
+    Write a JSON manifest listing the files produced by an export.
+
+    Args:
+        path: Path passed to exportRaster
+        codec: Codec used for the export
+        block_size: Block size in pixels, 0 for a single file
+        resolution: Export resolution
+        product: 'rgb' or 'multispec'
+
+    Returns:
+        Path of the manifest
+    """
+    path = Path(path)
+    blocks = []
+    for block_path in find_export_files(path):
+        indices = [int(i) for i in re.findall(r"-(\d+)", block_path.stem[len(path.stem):])]
+        blocks.append({
+            'file': block_path.name,
+            'bytes': block_path.stat().st_size,
+            'index': indices,
+        })
+
+    manifest = {
+        'product': product,
+        'source': path.name,
+        'codec': codec,
+        'block_size': block_size,
+        'resolution': resolution,
+        'total_bytes': sum(b['bytes'] for b in blocks),
+        'blocks': blocks,
+    }
+    manifest_path = path.with_name(f"{path.stem}_manifest.json")
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Wrote manifest of {len(blocks)} files to: {manifest_path}")
+    return manifest_path
+
+def convert_to_cog(path, codec='zstd', block_size=512):
+    """
+    Re-write a GeoTIFF as a Cloud-Optimized GeoTIFF using GDAL, if available.
+    Metashape writes tiled TIFFs with overviews but cannot guarantee the COG
+    layout or use ZSTD and predictors; GDAL's COG driver adds those.
+
+    Args:
+        path: GeoTIFF to convert in place
+        codec: One of COG_CODECS
+        block_size: Internal tile size in pixels
+
+    Returns:
+        True if the file was converted, False if GDAL is not available or cannot read the file
+    """
+    try:
+        from osgeo import gdal
+    except ImportError:
+        print("Warning: GDAL not available. Keeping Metashape tiled TIFF layout.")
+        return False
+
+    if codec not in COG_CODECS:
+        raise ValueError(f"Unsupported COG codec '{codec}', expected one of {COG_CODECS}")
+
+    path = Path(path)
+    tmp_path = path.with_name(f"{path.stem}_cog{path.suffix}")
+    src = gdal.Open(str(path))
+    if src is None:
+        print(f"Warning: GDAL could not open {path}. Keeping Metashape tiled TIFF layout.")
+        return False
+    is_float = src.GetRasterBand(1).DataType in (gdal.GDT_Float32, gdal.GDT_Float64)
+    options = [f"COMPRESS={codec.upper()}", f"BLOCKSIZE={block_size}", "BIGTIFF=IF_SAFER", "NUM_THREADS=ALL_CPUS"]
+    if codec in ('zstd', 'deflate', 'lzw'):
+        # Floating point predictor for reflectance, horizontal differencing for integer data
+        options.append(f"PREDICTOR={3 if is_float else 2}")
+    gdal.Translate(str(tmp_path), src, format='COG', creationOptions=options)
+    src = None
+    tmp_path.replace(path)
+    return True
+
+def export_raster_timed(chunk, path, resolution, codec='lzw', block_size=0, raster_transform=False, cog_codec=None):
+    """
+    Export the chunk orthomosaic and measure write time and output size.
+
+    Args:
+        chunk: Metashape chunk with an orthomosaic
+        path: Output path
+        resolution: Output resolution
+        codec: Metashape TIFF codec
+        block_size: Block size in pixels, 0 for a single file
+        raster_transform: Export raster transform values (multispectral reflectance)
+        cog_codec: If set, re-write each output as a COG with this codec using GDAL
+
+    Returns:
+        Dictionary with write time and total size of the produced files
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    transform = Metashape.RasterTransformValue if raster_transform else Metashape.RasterTransformNone
+
+    start = time.perf_counter()
+    chunk.exportRaster(path=str(path), resolution_x=resolution, resolution_y=resolution,
+                       image_format=Metashape.ImageFormatTIFF, raster_transform=transform, save_alpha=False,
+                       source_data=Metashape.OrthomosaicData, image_compression=make_compression(codec),
+                       **block_kwargs(block_size))
+    files = find_export_files(path)
+    if cog_codec:
+        for file_path in files:
+            convert_to_cog(file_path, codec=cog_codec)
+    elapsed = time.perf_counter() - start
+
+    return {'files': len(files), 'bytes': sum(p.stat().st_size for p in files), 'write_time_s': elapsed}
+
+def band_sidecar_path(path):
+    """
+    Return the path of the band description sidecar of an exported raster, keyed on the
+    product name, so a product split in blocks and recorded by its block manifest gets
+    the same sidecar as a single-file export.
+    """
+    path = Path(path)
+    stem = path.stem
+    if path.suffix == '.json' and stem.endswith('_manifest'):
+        stem = stem[:-len('_manifest')]
+    return path.with_name(f"{stem}_bands.json")
+
+def write_band_sidecar(path, multispec_chunk):
+    """
+    Record the band order and reflectance scaling of an exported multispectral
+    orthomosaic so it can be processed without the Metashape project.
+
+    Args:
+        path: Exported raster path
+        multispec_chunk: Metashape chunk the raster was exported from
+
+    Returns:
+        Path of the sidecar
+    """
+    formula = list(multispec_chunk.raster_transform.formula)
+    sensors = reflectance_band_sensors([s for s in multispec_chunk.sensors if hasattr(s, 'layer_index')])
+    sidecar = {
+        'bands': [sensor.label for sensor in sensors][:len(formula)],
+        'layer_indices': [sensor.layer_index for sensor in sensors][:len(formula)],
+        'raster_transform': formula,
+        'reflectance': bool(multispec_chunk.raster_transform.enabled),
+    }
+    sidecar_path = band_sidecar_path(path)
+    with open(sidecar_path, 'w') as f:
+        json.dump(sidecar, f, indent=2)
+    return sidecar_path
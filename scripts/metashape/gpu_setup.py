@@ -1,37 +1,259 @@
-import Metashape
+import datetime
+import json
+import socket
+import time
+from pathlib import Path
+from .utils import DEVICE_STAGES, DEVICE_POLICIES
 
-def setup_gpu():
+# Name fragments of integrated GPUs, which are skipped by the 'discrete' selector
+INTEGRATED_GPU_NAMES = ('uhd graphics', 'hd graphics', 'iris', 'radeon(tm) graphics', 'radeon graphics')
+
+# Cache of device probe timings, keyed by host, Metashape version and device list
+DEVICE_PROBE_CACHE = Path.home() / ".metashape_device_probe.json"
+
+# The CPU is only enabled by 'auto' if it makes the probe workload at least this much faster
+CPU_AUTO_SPEEDUP = 0.95
+
+def describe_devices(gpu_list):
+    """
+    Summarise the devices reported by Metashape.app.enumGPUDevices().
+    Works on plain dictionaries, so device selection can be checked without GPUs.
+
+    Args:
+        gpu_list: List of device dictionaries from enumGPUDevices
+
+    Returns:
+        List of dictionaries with index, name, vendor, memory_gb, compute_units and integrated
+    """
+    devices = []
+    for index, gpu in enumerate(gpu_list):
+        name = str(gpu.get('name', f"GPU {index}"))
+        devices.append({
+            'index': index,
+            'name': name,
+            'vendor': str(gpu.get('vendor', '')),
+            'memory_gb': gpu.get('mem_size', 0) / 1e9,
+            'compute_units': gpu.get('compute_units', 0),
+            'integrated': any(fragment in name.lower() for fragment in INTEGRATED_GPU_NAMES),
+        })
+    return devices
+
+def select_gpus(devices, selector, probe=None):
+    """
+    Select GPUs by capability or name.
+
+    Args:
+        devices: List from describe_devices
+        selector: 'discrete', 'all', 'none', 'fastest' or a case-insensitive name substring
+        probe: Optional timings from probe_devices, needed for 'fastest'
+
+    Returns:
+        List of device indices
+    """
+    discrete = [device['index'] for device in devices if not device['integrated']]
+    if selector == 'none':
+        return []
+    if selector == 'all':
+        return [device['index'] for device in devices]
+    if selector == 'discrete':
+        # Fall back to whatever is there rather than to the CPU
+        return discrete or [device['index'] for device in devices]
+    if selector == 'fastest':
+        if not probe or not probe.get('gpus'):
+            print("No device probe timings, using all discrete GPUs instead of the fastest")
+            return select_gpus(devices, 'discrete')
+        timed = [index for index in range(len(devices)) if probe['gpus'][index] is not None]
+        return [min(timed, key=lambda index: probe['gpus'][index])] if timed else []
+    return [device['index'] for device in devices if selector.lower() in device['name'].lower()]
+
+def parse_device_overrides(specs):
+    """
+    Parse per-stage device overrides given as STAGE=GPUS[:cpu|:nocpu|:auto],
+    e.g. 'ortho=nvidia:cpu' or 'matching=fastest'.
+
+    Args:
+        specs: List of override strings
+
+    Returns:
+        Dictionary of stage -> partial stage policy
+    """
+    cpu_flags = {'cpu': True, 'nocpu': False, 'auto': 'auto'}
+    overrides = {}
+    for spec in specs or ():
+        stage, _, value = spec.partition('=')
+        gpus, _, cpu = value.partition(':')
+        if stage not in DEVICE_STAGES or not gpus or (cpu and cpu not in cpu_flags):
+            raise ValueError(f"Invalid device override '{spec}', expected STAGE=GPUS[:cpu|:nocpu|:auto] "
+                             f"with STAGE one of {', '.join(DEVICE_STAGES)}")
+        overrides[stage] = {'gpus': gpus}
+        if cpu:
+            overrides[stage]['cpu'] = cpu_flags[cpu]
+    return overrides
+
+def resolve_device_policy(devices, policy='gpu', overrides=None, probe=None):
+    """
+    Turn a device policy into the Metashape gpu_mask and cpu_enable setting of each stage.
+
+    Args:
+        devices: List from describe_devices
+        policy: Policy name (key of DEVICE_POLICIES)
+        overrides: Optional dictionary of stage -> partial stage policy (see parse_device_overrides)
+        probe: Optional timings from probe_devices
+
+    Returns:
+        Dictionary of stage -> {'gpu_mask', 'cpu_enable', 'gpus'}
+    """
+    if policy not in DEVICE_POLICIES:
+        raise ValueError(f"Unknown device policy '{policy}', expected one of {', '.join(DEVICE_POLICIES)}")
+    settings = {}
+    for stage in DEVICE_STAGES:
+        stage_policy = dict(DEVICE_POLICIES[policy][stage])
+        stage_policy.update((overrides or {}).get(stage, {}))
+
+        indices = select_gpus(devices, stage_policy['gpus'], probe)
+        cpu = stage_policy['cpu']
+        if cpu == 'auto':
+            cpu = bool(probe and probe.get('gpu_cpu') is not None and indices
+                       and probe['gpu_cpu'] < CPU_AUTO_SPEEDUP * min(probe['gpus'][index] or float('inf')
+                                                                     for index in indices))
+        if not indices and not cpu:
+            if devices:
+                print(f"Warning: no GPU matches '{stage_policy['gpus']}' for {stage}, enabling CPU")
+            cpu = True
+
+        settings[stage] = {
+            'gpu_mask': sum(1 << index for index in indices),
+            'cpu_enable': bool(cpu),
+            'gpus': [devices[index]['name'] for index in indices],
+        }
+    return settings
+
+def use_stage_devices(settings, stage):
+    """
+    Switch Metashape to the devices of a processing stage.
+
+    Args:
+        settings: Dictionary from setup_gpu or resolve_device_policy (None leaves the devices unchanged)
+        stage: Stage name (one of DEVICE_STAGES)
+    """
+    if not settings:
+        return
+    import Metashape
+    Metashape.app.gpu_mask = settings[stage]['gpu_mask']
+    Metashape.app.cpu_enable = settings[stage]['cpu_enable']
+
+def _time_matching(chunk, gpu_mask, cpu_enable, downscale):
+    import Metashape
+    Metashape.app.gpu_mask = gpu_mask
+    Metashape.app.cpu_enable = cpu_enable
+    start = time.perf_counter()
+    chunk.matchPhotos(downscale=downscale, keypoint_limit=20000, tiepoint_limit=0, generic_preselection=False,
+                      reference_preselection=False, reset_matches=True)
+    return time.perf_counter() - start
+
+def probe_devices(gpu_list, image_paths, cache_path=DEVICE_PROBE_CACHE, n_images=6, downscale=2):
+    """
+    Time image matching on a few images with each GPU alone, the CPU alone, and the
+    fastest GPU together with the CPU. Timings are cached per host, Metashape version
+    and device list, so the probe only runs again when the hardware changes.
+
+    Args:
+        gpu_list: List of device dictionaries from enumGPUDevices
+        image_paths: Images of the flight being processed; a run of consecutive images is used
+        cache_path: JSON file caching the timings (None disables the cache)
+        n_images: Number of images to match
+        downscale: Matching downscale factor
+
+    Returns:
+        Dictionary with per-GPU seconds ('gpus', None for devices that failed), 'cpu' and 'gpu_cpu' seconds
+    """
+    import Metashape
+    names = [str(gpu.get('name', '')) for gpu in gpu_list]
+    key = "|".join([socket.gethostname(), Metashape.app.version] + names)
+
+    cache = {}
+    if cache_path and Path(cache_path).is_file():
+        try:
+            cache = json.loads(Path(cache_path).read_text())
+        except (OSError, ValueError):
+            cache = {}
+    if key in cache:
+        print(f"Using cached device probe from {cache[key]['created']}")
+        return cache[key]
+
+    start = len(image_paths) // 2
+    sample = list(image_paths[start:start + n_images])
+    # Read the images once so every configuration starts from the page cache
+    for path in sample:
+        Path(path).read_bytes()
+
+    print(f"Probing {len(gpu_list)} GPU(s) and the CPU on {len(sample)} images...")
+    doc = Metashape.Document()
+    chunk = doc.addChunk()
+    chunk.addPhotos(sample)
+
+    probe = {'gpus': [], 'created': datetime.datetime.now().isoformat(timespec='seconds')}
+    for index, name in enumerate(names):
+        try:
+            probe['gpus'].append(_time_matching(chunk, 1 << index, False, downscale))
+            print(f"  GPU {index} {name}: {probe['gpus'][-1]:.2f}s")
+        except RuntimeError as e:
+            probe['gpus'].append(None)
+            print(f"  GPU {index} {name}: failed ({e})")
+    probe['cpu'] = _time_matching(chunk, 0, True, downscale)
+    print(f"  CPU: {probe['cpu']:.2f}s")
+    timed = [index for index in range(len(names)) if probe['gpus'][index] is not None]
+    probe['gpu_cpu'] = None
+    if timed:
+        fastest = min(timed, key=lambda index: probe['gpus'][index])
+        probe['gpu_cpu'] = _time_matching(chunk, 1 << fastest, True, downscale)
+        print(f"  GPU {fastest} + CPU: {probe['gpu_cpu']:.2f}s")
+
+    if cache_path:
+        cache[key] = probe
+        Path(cache_path).write_text(json.dumps(cache, indent=2))
+    return probe
+
+def setup_gpu(policy='gpu', overrides=None, probe_images=None, probe_cache=DEVICE_PROBE_CACHE):
     """
-    Sets up GPU acceleration in Metashape by:
-    1. Enabling GPU acceleration
-    2. Verifying available GPUs
-    3. Specifically using GPU 1 (NVIDIA) and ignoring GPU 0 (Intel)
-    4. Disabling CPU usage when GPU is active
+    Sets up the compute devices of each processing stage by:
+    1. Enumerating the available GPUs
+    2. Optionally timing a small matching workload on each device (cached)
+    3. Selecting GPUs per stage by name and capability instead of by index
+    4. Applying the 'matching' stage setting, the first stage of every run
+
+    Args:
+        policy: Device policy name (key of DEVICE_POLICIES; default 'gpu': discrete GPUs, CPU off)
+        overrides: Optional per-stage overrides (see parse_device_overrides)
+        probe_images: Images to run the device probe on (None skips the probe)
+        probe_cache: JSON file caching probe timings
+
+    Returns:
+        Dictionary of stage -> {'gpu_mask', 'cpu_enable', 'gpus'} to pass to use_stage_devices
     """
+    import Metashape
     print("Setting up GPU acceleration...")
-    
-    # Enable GPU acceleration and disable CPU usage
-    Metashape.app.gpu_mask = 2 ** 32 - 1  # Enable all available GPUs
-    Metashape.app.cpu_enable = False  # Disable CPU usage when GPU is active
-    
-    # Get list of available GPUs
+
     gpu_list = Metashape.app.enumGPUDevices()
-    
-    if not gpu_list:
+    devices = describe_devices(gpu_list)
+    if not devices:
         print("Warning: No GPU devices found. Processing will use CPU only.")
-        Metashape.app.cpu_enable = True  # Enable CPU since no GPU is available
-        return
-    
-    print(f"Found {len(gpu_list)} GPU device(s):")
-    for i, gpu in enumerate(gpu_list):
-        print(f"GPU {i}: {gpu}")  # GPU object string representation
-    
-    # Directly target GPU 1 (NVIDIA) and ignore GPU 0 (Intel)
-    if len(gpu_list) > 1:
-        print(f"Using NVIDIA GPU (GPU 1): {gpu_list[1]}")
-        # Enable only GPU 1 (NVIDIA)
-        Metashape.app.gpu_mask = 1 << 1
     else:
-        print("Warning: Only one GPU found. Using all available GPUs.")
-    
-    print("GPU setup complete.") 
\ No newline at end of file
+        print(f"Found {len(devices)} GPU device(s):")
+        for device in devices:
+            kind = "integrated" if device['integrated'] else "discrete"
+            print(f"GPU {device['index']}: {device['name']} ({kind}, {device['memory_gb']:.1f} GB, "
+                  f"{device['compute_units']} compute units)")
+
+    probe = None
+    if probe_images and devices:
+        probe = probe_devices(gpu_list, probe_images, cache_path=probe_cache)
+
+    settings = resolve_device_policy(devices, policy, overrides, probe)
+    for stage, setting in settings.items():
+        gpus = ", ".join(setting['gpus']) or "no GPU"
+        print(f"{stage}: {gpus}, CPU {'on' if setting['cpu_enable'] else 'off'}")
+    use_stage_devices(settings, 'matching')
+
+    print("GPU setup complete.")
+    return settings
@@ -1,8 +1,11 @@
 import os
+import re
+import struct
 import datetime
 import math
+from collections import Counter, defaultdict
 import numpy as np
-import Metashape
+from .utils import MICASENSE_BANDS
 
 def find_filtered_images(folder, extensions=(), exclude_patterns=()):
     """
@@ -258,4 +261,274 @@ def filter_multispec_by_flight_pattern(chunk, spatial_threshold=0.2, keep_ratio=
     else:
         print("All multispectral images are within the main flight area")
     
-    return len(ms_outside_area) 
\ No newline at end of file
+    return len(ms_outside_area) 
+
+# MicaSense capture files: IMG_<capture>_<band>.tif
+CAPTURE_PATTERN = re.compile(r'^(IMG_\d+)_(\d+)\.tiff?$', re.IGNORECASE)
+
+def _read_tiff_header(f):
+    # Byte order, first IFD offset and BigTIFF flag of a classic (42) or BigTIFF (43) file, or None
+    header = f.read(16)
+    if header[:2] not in (b'II', b'MM'):
+        return None
+    order = '<' if header[:2] == b'II' else '>'
+    magic = struct.unpack(order + 'H', header[2:4])[0]
+    if magic == 42:
+        return order, struct.unpack(order + 'I', header[4:8])[0], False
+    if magic == 43 and struct.unpack(order + 'HH', header[4:8]) == (8, 0):
+        return order, struct.unpack(order + 'Q', header[8:16])[0], True
+    return None
+
+def _ifd_integer(order, field_type, value):
+    # Inline SHORT, LONG or LONG8 value of an IFD entry
+    fmt = {3: 'H', 4: 'I', 16: 'Q'}.get(field_type)
+    if fmt is None or struct.calcsize(fmt) > len(value):
+        return None
+    return struct.unpack(order + fmt, value[:struct.calcsize(fmt)])[0]
+
+def read_tiff_size(path):
+    """
+    Read the width and height of a TIFF or BigTIFF from its first IFD without decoding it.
+    
+    Args:
+        path: Path to a TIFF file
+        
+    Returns:
+        Tuple of (width, height), or None if the header cannot be read
+    """
+    try:
+        with open(path, 'rb') as f:
+            header = _read_tiff_header(f)
+            if header is None:
+                return None
+            order, offset, big = header
+            ifd = _read_ifd(f, 0, offset, order, big)
+    except (OSError, struct.error):
+        return None
+
+    size = {tag: _ifd_integer(order, ifd[tag][0], ifd[tag][2]) for tag in (256, 257) if tag in ifd}
+    if size.get(256) is None or size.get(257) is None:
+        return None
+    return size[256], size[257]
+
+def read_geotiff_origin(path):
+    """
+    Read the map coordinates of the upper left corner of a GeoTIFF (or BigTIFF) from
+    its ModelTiepoint and ModelPixelScale tags without decoding it.
+    
+    Args:
+        path: Path to a GeoTIFF file
+        
+    Returns:
+        Tuple of (x, y), or None if the tags cannot be read
+    """
+    try:
+        with open(path, 'rb') as f:
+            header = _read_tiff_header(f)
+            if header is None:
+                return None
+            order, offset, big = header
+            ifd = _read_ifd(f, 0, offset, order, big)
+            if 33922 not in ifd or 33550 not in ifd:
+                return None
+            doubles = {}
+            for tag in (33922, 33550):
+                _, count, value = ifd[tag]
+                if 8 * count <= len(value):
+                    data = value[:8 * count]
+                else:
+                    f.seek(struct.unpack(order + ('Q' if big else 'I'), value)[0])
+                    data = f.read(8 * count)
+                doubles[tag] = struct.unpack(order + 'd' * count, data)
+    except (OSError, struct.error):
+        return None
+    # Tie point (I, J, K, X, Y, Z) of raster position (I, J) and pixel scale (sx, sy, sz)
+    i, j, _, x, y, _ = doubles[33922][:6]
+    scale_x, scale_y = doubles[33550][:2]
+    return x - i * scale_x, y + j * scale_y
+
+def _read_ifd(f, base, offset, order, big=False):
+    # Read the entries of a TIFF IFD as tag -> (type, count, raw value/offset bytes);
+    # BigTIFF IFDs have an 8-byte entry count and 20-byte entries with 8-byte values
+    f.seek(base + offset)
+    if big:
+        count_fmt, entry_fmt, value_size = 'Q', 'HHQ', 8
+    else:
+        count_fmt, entry_fmt, value_size = 'H', 'HHI', 4
+    count = struct.unpack(order + count_fmt, f.read(struct.calcsize(count_fmt)))[0]
+    head_size = struct.calcsize(order + entry_fmt)
+    entry_size = head_size + value_size
+    entries = f.read(entry_size * count)
+    ifd = {}
+    for i in range(count):
+        tag, field_type, n = struct.unpack(order + entry_fmt, entries[entry_size * i:entry_size * i + head_size])
+        ifd[tag] = (field_type, n, entries[entry_size * i + head_size:entry_size * (i + 1)])
+    return ifd
+
+def read_capture_time(path, max_header=128 * 1024):
+    """
+    Read the EXIF capture time of a JPEG or TIFF image from its header only.
+    
+    Args:
+        path: Image path
+        max_header: Number of bytes searched for the EXIF block of a JPEG
+        
+    Returns:
+        datetime.datetime, or None if no capture time is recorded
+    """
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(max_header)
+            if head[:2] == b'\xff\xd8':
+                exif = head.find(b'Exif\x00\x00')
+                if exif < 0:
+                    return None
+                base = exif + 6
+            else:
+                base = 0
+            order = '<' if head[base:base + 2] == b'II' else '>'
+            ifd0 = _read_ifd(f, base, struct.unpack(order + 'I', head[base + 4:base + 8])[0], order)
+            candidates = []
+            if 0x8769 in ifd0:
+                exif_ifd = _read_ifd(f, base, struct.unpack(order + 'I', ifd0[0x8769][2])[0], order)
+                candidates.append(exif_ifd.get(0x9003))
+            candidates.append(ifd0.get(0x0132))
+            for entry in candidates:
+                if entry is None:
+                    continue
+                _, count, value = entry
+                if count > 4:
+                    f.seek(base + struct.unpack(order + 'I', value)[0])
+                    value = f.read(count)
+                text = value[:count].rstrip(b'\x00').decode('ascii', errors='replace')
+                try:
+                    return datetime.datetime.strptime(text, "%Y:%m:%d %H:%M:%S")
+                except ValueError:
+                    continue
+    except (OSError, struct.error):
+        return None
+    return None
+
+def group_capture_sets(image_paths):
+    """
+    Group multispectral band files into captures by directory and capture name
+    (IMG_0001_1.tif ... IMG_0001_5.tif) in a single pass.
+    
+    Args:
+        image_paths: Multispectral image paths
+        
+    Returns:
+        Tuple of (dictionary of (directory, capture) -> {band number: path},
+                  list of paths not matching the capture naming)
+    """
+    captures = defaultdict(dict)
+    unmatched = []
+    for path in image_paths:
+        directory, fname = os.path.split(path)
+        match = CAPTURE_PATTERN.match(fname)
+        if not match:
+            unmatched.append(path)
+            continue
+        captures[(directory, match.group(1))][int(match.group(2))] = path
+    return captures, unmatched
+
+def validate_capture_sets(image_paths, check_dimensions=True):
+    """
+    Validate multispectral captures before loading them with MultiplaneLayout.
+    The expected band set is the most common one across captures; captures with
+    missing or extra bands, or with a band whose dimensions differ from the usual
+    dimensions of that band, are dropped and reported.
+    
+    Args:
+        image_paths: Multispectral image paths
+        check_dimensions: Whether to compare image dimensions read from the TIFF headers
+        
+    Returns:
+        List of complete captures, each a list of band file paths in band order
+    """
+    print("Validating multispectral capture sets...")
+    captures, unmatched = group_capture_sets(image_paths)
+    if unmatched:
+        print(f"Warning: {len(unmatched)} files do not follow the IMG_XXXX_N naming and are skipped")
+    if not captures:
+        return []
+    
+    band_sets = Counter(tuple(sorted(bands)) for bands in captures.values())
+    expected = band_sets.most_common(1)[0][0]
+    print(f"Expected bands per capture: {list(expected)} ({len(captures)} captures)")
+    
+    complete = {key: bands for key, bands in captures.items() if tuple(sorted(bands)) == expected}
+    incomplete = [key for key in captures if key not in complete]
+    for directory, capture in sorted(incomplete):
+        bands = sorted(captures[(directory, capture)])
+        missing = sorted(set(expected) - set(bands))
+        extra = sorted(set(bands) - set(expected))
+        print(f"Dropping {capture} in {directory}: missing bands {missing}, extra bands {extra}")
+    
+    mismatched = []
+    if check_dimensions:
+        sizes = {key: {band: read_tiff_size(path) for band, path in bands.items()}
+                 for key, bands in complete.items()}
+        usual = {band: Counter(size[band] for size in sizes.values()).most_common(1)[0][0] for band in expected}
+        for key, size in sizes.items():
+            wrong = [band for band in expected if size[band] != usual[band]]
+            if wrong:
+                mismatched.append(key)
+                print(f"Dropping {key[1]} in {key[0]}: unexpected dimensions of bands {wrong}")
+        for key in mismatched:
+            del complete[key]
+    
+    print(f"Kept {len(complete)} complete captures, dropped {len(incomplete)} incomplete "
+          f"and {len(mismatched)} with mismatched dimensions")
+    return [[complete[key][band] for band in expected] for key in sorted(complete)]
+
+def select_band_files(image_paths, bands, reference_band=None):
+    """
+    Keep only the files of the selected multispectral bands, plus a reference band
+    used as master camera for alignment (Panchro if it was captured, otherwise NIR
+    or the first selected band).
+    
+    Args:
+        image_paths: Multispectral image paths
+        bands: Canonical band names to load (keys of MICASENSE_BANDS)
+        reference_band: Optional canonical name of the alignment reference band
+        
+    Returns:
+        Tuple of (selected image paths, reference band name)
+    """
+    unknown = [band for band in bands if band not in MICASENSE_BANDS]
+    if unknown:
+        raise ValueError(f"Unknown bands {unknown}, expected some of {sorted(MICASENSE_BANDS)}")
+    
+    captured = set()
+    for path in image_paths:
+        match = CAPTURE_PATTERN.match(os.path.basename(path))
+        if match:
+            captured.add(int(match.group(2)))
+    
+    if reference_band is None:
+        if MICASENSE_BANDS['panchro'] in captured:
+            reference_band = 'panchro'
+        elif 'nir' in bands:
+            reference_band = 'nir'
+        else:
+            reference_band = min(bands, key=MICASENSE_BANDS.get)
+    
+    numbers = {MICASENSE_BANDS[band] for band in bands} | {MICASENSE_BANDS[reference_band]}
+    missing = sorted(band for band in bands if MICASENSE_BANDS[band] not in captured)
+    if missing:
+        print(f"Warning: selected bands {missing} were not captured")
+    
+    selected = []
+    selected_bytes = total_bytes = 0
+    for path in image_paths:
+        size = os.path.getsize(path)
+        total_bytes += size
+        match = CAPTURE_PATTERN.match(os.path.basename(path))
+        if match and int(match.group(2)) in numbers:
+            selected.append(path)
+            selected_bytes += size
+    
+    print(f"Loading bands {sorted(bands, key=MICASENSE_BANDS.get)} with {reference_band} as alignment reference: "
+          f"{len(selected)} of {len(image_paths)} files, {selected_bytes / 1e9:.2f} of {total_bytes / 1e9:.2f} GB")
+    return selected, reference_band
@@ -0,0 +1,231 @@
+import json
+import os
+from pathlib import Path
+import numpy as np
+
+def scanned_images_path(project_path):
+    """
+    Path of the list of images already considered for a project, next to the project.
+
+    Args:
+        project_path: Path of the .psx project
+
+    Returns:
+        Path of <project stem>_scanned_images.json
+    """
+    project_path = Path(project_path)
+    return project_path.with_name(f"{project_path.stem}_scanned_images.json")
+
+def load_scanned_images(path, root):
+    """
+    Load the images already considered for a project, including those that were
+    excluded or removed from its chunks (time filter, dedup, operator deletions).
+
+    Args:
+        path: Path from scanned_images_path
+        root: Directory the recorded paths are relative to (imagery or staged imagery directory)
+
+    Returns:
+        Set of normalised absolute image paths
+    """
+    path = Path(path)
+    if not path.is_file():
+        return set()
+    return {os.path.normpath(os.path.join(root, rel_path)) for rel_path in json.loads(path.read_text())}
+
+def record_scanned_images(path, image_paths, root):
+    """
+    Add images to the list of images considered for a project, so later incremental
+    runs only treat images that arrived since as new.
+
+    Args:
+        path: Path from scanned_images_path
+        image_paths: Image paths considered by this run
+        root: Directory to record the paths relative to
+    """
+    path = Path(path)
+    rel_paths = set(json.loads(path.read_text())) if path.is_file() else set()
+    rel_paths.update(Path(os.path.relpath(image_path, root)).as_posix() for image_path in image_paths)
+    tmp_path = path.with_suffix('.tmp')
+    tmp_path.write_text(json.dumps(sorted(rel_paths), indent=0))
+    os.replace(tmp_path, path)
+
+def find_new_images(chunk, image_paths, scanned=()):
+    """
+    Diff a scan of the imagery directory against the photos already in the chunk
+    and the images considered by earlier runs.
+
+    Args:
+        chunk: Metashape chunk of an existing project
+        image_paths: Image paths found by scanning the imagery directory
+        scanned: Normalised paths considered by earlier runs (see load_scanned_images)
+
+    Returns:
+        List of image paths not yet in the chunk, in scan order
+    """
+    existing = {os.path.normpath(str(camera.photo.path))
+                for camera in chunk.cameras if camera.photo}
+    new_images = [path for path in image_paths
+                  if os.path.normpath(str(path)) not in existing and os.path.normpath(str(path)) not in scanned]
+    print(f"{chunk.label}: {len(existing)} images already in project, {len(new_images)} new")
+    return new_images
+
+def geocentric_position(chunk, camera):
+    """Return the camera position in geocentric coordinates, or None if unknown."""
+    if camera.transform and chunk.transform.matrix:
+        return chunk.transform.matrix.mulp(camera.center)
+    if camera.reference.location and chunk.crs:
+        return chunk.crs.unproject(camera.reference.location)
+    return None
+
+def find_neighbour_pairs(chunk, new_cameras, neighbours=10):
+    """
+    Build the list of camera pairs to match for newly added cameras.
+    Each new camera is paired with its nearest aligned cameras and its nearest
+    new cameras, so existing cameras are never matched against each other.
+
+    Args:
+        chunk: Metashape chunk
+        new_cameras: Newly added master cameras
+        neighbours: Number of nearest cameras to pair with in each set
+
+    Returns:
+        List of (camera key, camera key) tuples
+    """
+    new_keys = {camera.key for camera in new_cameras}
+    new_list, new_pos = [], []
+    for camera in new_cameras:
+        pos = geocentric_position(chunk, camera)
+        if pos is not None:
+            new_list.append(camera.key)
+            new_pos.append((pos.x, pos.y, pos.z))
+
+    old_list, old_pos = [], []
+    for camera in chunk.cameras:
+        if camera.master != camera or camera.key in new_keys or not camera.transform:
+            continue
+        pos = geocentric_position(chunk, camera)
+        old_list.append(camera.key)
+        old_pos.append((pos.x, pos.y, pos.z))
+
+    if not new_list:
+        print("Warning: new cameras have no positions. Cannot select spatial neighbours.")
+        return []
+
+    new_pos = np.array(new_pos)
+    new_list = np.array(new_list)
+    pairs = set()
+
+    def add_nearest(candidate_keys, candidate_pos, exclude_self=False):
+        if len(candidate_keys) == 0:
+            return
+        dist = np.linalg.norm(new_pos[:, None, :] - candidate_pos[None, :, :], axis=2)
+        if exclude_self:
+            np.fill_diagonal(dist, np.inf)
+        k = min(neighbours, len(candidate_keys) - (1 if exclude_self else 0))
+        if k <= 0:
+            return
+        nearest = np.argpartition(dist, k - 1, axis=1)[:, :k]
+        for i, row in enumerate(nearest):
+            for j in row:
+                a, b = int(new_list[i]), int(candidate_keys[j])
+                pairs.add((min(a, b), max(a, b)))
+
+    add_nearest(np.array(old_list), np.array(old_pos).reshape(-1, 3))
+    add_nearest(new_list, new_pos, exclude_self=True)
+
+    print(f"Selected {len(pairs)} camera pairs for {len(new_list)} new cameras")
+    return sorted(pairs)
+
+def new_capture_groups(captures, new_images):
+    """
+    Select the captures whose band files are all new. Captures only partly new (some
+    bands already in the project or considered earlier) are dropped instead of split.
+
+    Args:
+        captures: Validated captures (lists of band files) from validate_capture_sets
+        new_images: Paths from find_new_images
+
+    Returns:
+        List of new captures
+    """
+    new = {os.path.normpath(str(path)) for path in new_images}
+    groups, partial = [], 0
+    for capture in captures:
+        present = sum(1 for path in capture if os.path.normpath(str(path)) in new)
+        if present == len(capture):
+            groups.append(list(capture))
+        elif present:
+            partial += 1
+    if partial:
+        print(f"Warning: skipped {partial} captures only partly new")
+    return groups
+
+def align_new_images(chunk, image_paths, layout=None, neighbours=10, scanned=(), prepare=None, captures=None,
+                     keypoint_limit=50000, tiepoint_limit=5000):
+    """
+    Add images that are not yet in the chunk and align them into the existing
+    alignment without re-matching or resetting the cameras already aligned.
+
+    Args:
+        chunk: Aligned Metashape chunk
+        image_paths: Image paths found by scanning the imagery directory (ignored if captures is given)
+        layout: Optional Metashape.ImageLayout for addPhotos (e.g. MultiplaneLayout)
+        neighbours: Number of nearest cameras each new camera is matched against
+        scanned: Normalised paths considered by earlier runs, never treated as new
+        prepare: Optional callable(chunk, new_cameras) run after the images are added and
+                 before matching, e.g. to configure sensors or filter the new cameras
+        captures: Optional validated captures (lists of band files); new captures are added
+                  as explicit file groups (see new_capture_groups)
+        keypoint_limit: Keypoints per image, as used by the first run's alignment
+        tiepoint_limit: Tie points per image, as used by the first run's alignment
+
+    Returns:
+        List of newly added master cameras
+    """
+    kwargs = {} if layout is None else {'layout': layout}
+    if captures is not None:
+        paths = [path for capture in captures for path in capture]
+        groups = new_capture_groups(captures, find_new_images(chunk, paths, scanned))
+        new_images = [path for capture in groups for path in capture]
+        kwargs['filegroups'] = [len(capture) for capture in groups]
+    else:
+        new_images = find_new_images(chunk, image_paths, scanned)
+    if not new_images:
+        return []
+
+    existing_keys = {camera.key for camera in chunk.cameras}
+    print(f"Adding {len(new_images)} new images to {chunk.label}...")
+    chunk.addPhotos(new_images, **kwargs)
+    new_cameras = [camera for camera in chunk.cameras
+                   if camera.key not in existing_keys and camera.master == camera]
+    if prepare is not None:
+        prepare(chunk, new_cameras)
+        # Preparation may remove cameras or change the master band
+        new_cameras = [camera for camera in chunk.cameras
+                       if camera.key not in existing_keys and camera.master == camera]
+        if not new_cameras:
+            return []
+
+    pairs = find_neighbour_pairs(chunk, new_cameras, neighbours=neighbours)
+    if not pairs:
+        return new_cameras
+
+    print("Matching new images against their spatial neighbours...")
+    chunk.matchPhotos(
+        pairs=pairs,
+        downscale=1,
+        generic_preselection=False,
+        reference_preselection=False,
+        keypoint_limit=keypoint_limit,
+        tiepoint_limit=tiepoint_limit,
+        filter_stationary_points=True,
+        guided_matching=False,
+        keep_keypoints=True,
+        reset_matches=False,
+    )
+    chunk.alignCameras(cameras=[camera.key for camera in new_cameras], reset_alignment=False)
+
+    n_aligned = sum(1 for camera in new_cameras if camera.transform)
+    print(f"Aligned {n_aligned} of {len(new_cameras)} new cameras")
+    return new_cameras
@@ -0,0 +1,164 @@
+import json
+from pathlib import Path
+import numpy as np
+from osgeo import gdal
+from .utils import REFLECTANCE_SCALE, canonical_band_name
+
+NODATA = -32767
+
+# Vegetation indices computed from reflectance bands
+INDEX_FORMULAS = {
+    'ndvi': (('nir', 'red'), lambda b: (b['nir'] - b['red']) / (b['nir'] + b['red'])),
+    'ndre': (('nir', 'red_edge'), lambda b: (b['nir'] - b['red_edge']) / (b['nir'] + b['red_edge'])),
+    'gndvi': (('nir', 'green'), lambda b: (b['nir'] - b['green']) / (b['nir'] + b['green'])),
+    'savi': (('nir', 'red'), lambda b: 1.5 * (b['nir'] - b['red']) / (b['nir'] + b['red'] + 0.5)),
+    'osavi': (('nir', 'red'), lambda b: (b['nir'] - b['red']) / (b['nir'] + b['red'] + 0.16)),
+}
+
+def read_band_names(raster_path, band_names=None):
+    """
+    Resolve the canonical band order of an exported multispectral orthomosaic.
+
+    Args:
+        raster_path: Exported raster
+        band_names: Optional explicit band labels, in raster band order
+
+    Returns:
+        Dictionary of canonical band name -> 1-based raster band number
+    """
+    if band_names is None:
+        sidecar_path = Path(raster_path).with_name(f"{Path(raster_path).stem}_bands.json")
+        if not sidecar_path.is_file():
+            raise ValueError(f"No band sidecar found at {sidecar_path}; pass the band names explicitly")
+        with open(sidecar_path) as f:
+            band_names = json.load(f)['bands']
+
+    bands = {}
+    for number, label in enumerate(band_names, start=1):
+        canonical = canonical_band_name(label)
+        if canonical and canonical not in bands:
+            bands[canonical] = number
+    return bands
+
+def iter_windows(width, height, block_width, block_height):
+    """
+    Yield (x_off, y_off, x_size, y_size) windows covering a raster.
+
+    Args:
+        width: Raster width in pixels
+        height: Raster height in pixels
+        block_width: Window width in pixels
+        block_height: Window height in pixels
+    """
+    for y_off in range(0, height, block_height):
+        for x_off in range(0, width, block_width):
+            yield x_off, y_off, min(block_width, width - x_off), min(block_height, height - y_off)
+
+def window_size(band, target=1024):
+    """
+    Pick a read window aligned to the raster's internal blocks of about target pixels.
+
+    Args:
+        band: GDAL raster band
+        target: Approximate window size in pixels
+
+    Returns:
+        Tuple of (window width, window height)
+    """
+    block_x, block_y = band.GetBlockSize()
+    return max(block_x, target // block_x * block_x), max(block_y, target // block_y * block_y)
+
+def read_reflectance(band, x_off, y_off, x_size, y_size):
+    """
+    Read a window of a band as float32 reflectance with nodata as NaN.
+    Integer rasters hold raw DN and are scaled by REFLECTANCE_SCALE, matching the
+    B{n}/32768 raster transform; float rasters are already reflectance.
+    """
+    data = band.ReadAsArray(x_off, y_off, x_size, y_size).astype(np.float32, copy=False)
+    nodata = band.GetNoDataValue()
+    if nodata is not None:
+        data[data == nodata] = np.nan
+    if band.DataType not in (gdal.GDT_Float32, gdal.GDT_Float64):
+        data /= REFLECTANCE_SCALE
+    return data
+
+def index_output_path(raster_path, index_name):
+    """
+    Name an index raster after its source, e.g. 20250415_PLOT_multispec_ortho_05.tif
+    becomes 20250415_PLOT_ndvi_05.tif.
+    """
+    raster_path = Path(raster_path)
+    if 'multispec_ortho' in raster_path.stem:
+        stem = raster_path.stem.replace('multispec_ortho', index_name)
+    else:
+        stem = f"{raster_path.stem}_{index_name}"
+    return raster_path.with_name(f"{stem}{raster_path.suffix}")
+
+def compute_indices(raster_path, indices=('ndvi', 'ndre'), band_names=None, window=1024, out_dir=None):
+    """
+    Compute vegetation indices from an exported multispectral orthomosaic in a single
+    streaming pass. Only one window of the needed bands is held in memory at a time,
+    so peak memory does not grow with the size of the mosaic.
+
+    Args:
+        raster_path: Exported multispectral orthomosaic
+        indices: Names of indices to compute (keys of INDEX_FORMULAS)
+        band_names: Optional band labels in raster order (defaults to the band sidecar)
+        window: Approximate read window size in pixels
+        out_dir: Output directory (defaults to the raster directory)
+
+    Returns:
+        Dictionary of index name -> output path
+    """
+    unknown = [name for name in indices if name not in INDEX_FORMULAS]
+    if unknown:
+        raise ValueError(f"Unknown indices {unknown}, expected some of {sorted(INDEX_FORMULAS)}")
+
+    bands = read_band_names(raster_path, band_names)
+    needed = sorted({band for name in indices for band in INDEX_FORMULAS[name][0]})
+    missing = [band for band in needed if band not in bands]
+    if missing:
+        raise ValueError(f"Bands {missing} not found in {raster_path} (have {sorted(bands)})")
+
+    src = gdal.Open(str(raster_path))
+    width, height = src.RasterXSize, src.RasterYSize
+    src_bands = {name: src.GetRasterBand(bands[name]) for name in needed}
+    block_width, block_height = window_size(src_bands[needed[0]], target=window)
+
+    driver = gdal.GetDriverByName('GTiff')
+    options = ['TILED=YES', 'BLOCKXSIZE=256', 'BLOCKYSIZE=256', 'COMPRESS=DEFLATE', 'PREDICTOR=3', 'BIGTIFF=IF_SAFER']
+    outputs = {}
+    out_bands = {}
+    for name in indices:
+        out_path = index_output_path(raster_path, name)
+        if out_dir is not None:
+            out_path = Path(out_dir) / out_path.name
+        dst = driver.Create(str(out_path), width, height, 1, gdal.GDT_Float32, options=options)
+        dst.SetGeoTransform(src.GetGeoTransform())
+        dst.SetProjection(src.GetProjection())
+        band = dst.GetRasterBand(1)
+        band.SetNoDataValue(NODATA)
+        band.SetDescription(name.upper())
+        outputs[name] = (out_path, dst)
+        out_bands[name] = band
+
+    print(f"Computing {', '.join(indices)} over {width}x{height} pixels "
+          f"in {block_width}x{block_height} windows...")
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for x_off, y_off, x_size, y_size in iter_windows(width, height, block_width, block_height):
+            reflectance = {name: read_reflectance(src_bands[name], x_off, y_off, x_size, y_size)
+                           for name in needed}
+            for name in indices:
+                values = INDEX_FORMULAS[name][1](reflectance)
+                values[~np.isfinite(values)] = NODATA
+                out_bands[name].WriteArray(values, x_off, y_off)
+
+    paths = {}
+    for name, (out_path, dst) in outputs.items():
+        dst.FlushCache()
+        paths[name] = out_path
+        print(f"{name.upper()} saved to: {out_path}")
+    outputs.clear()
+    out_bands.clear()
+    src = None
+    return paths
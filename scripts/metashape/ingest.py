@@ -0,0 +1,464 @@
+import contextlib
+import ctypes
+import ctypes.util
+import datetime
+import fcntl
+import hashlib
+import json
+import os
+import select
+import shlex
+import socket
+import struct
+import subprocess
+import time
+from pathlib import Path
+
+QUEUE_NAME = "ingest_queue.json"
+STATE_NAME = "ingest_state.json"
+IMAGE_SUBDIRS = ("rgb/level0_raw", "multispec/level0_raw")
+
+# Seconds inotify events are collected for before a re-scan, so a busy upload
+# is not re-listed for every file
+EVENT_BATCH_SECONDS = 5
+
+# Files still being written by common upload tools
+PARTIAL_SUFFIXES = ('.part', '.partial', '.tmp', '.crdownload', '.filepart')
+
+# inotify event bits (linux/inotify.h). IN_MODIFY is left out, as it fires for every
+# written block; a file still growing is caught by the size check instead.
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+EVENT_HEADER = struct.Struct('iIII')
+
+def find_flights(root):
+    """
+    Find the flights below a watch root laid out as <root>/<plot>/YYYYMMDD/imagery/.
+
+    Args:
+        root: Directory holding the plot directories
+
+    Returns:
+        Sorted list of imagery directory paths
+    """
+    return sorted(path for path in Path(root).glob("*/*/imagery") if path.is_dir())
+
+def upload_signature(imagery_dir, subdirs=IMAGE_SUBDIRS):
+    """
+    Summarise the raw images of a flight by file count, total size and a digest of
+    every file name and size, so any added, removed or growing file changes it.
+    Hidden files and partial uploads make the signature incomplete.
+
+    Args:
+        imagery_dir: Path to <plot>/YYYYMMDD/imagery/
+        subdirs: Sub-directories of imagery_dir holding the raw images
+
+    Returns:
+        Dictionary with 'files', 'bytes', 'digest' and 'complete' (False while partial
+        files are present or a sub-directory is missing or empty)
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    files = total = 0
+    complete = True
+    for subdir in subdirs:
+        listing = []
+        for dirpath, _, names in os.walk(Path(imagery_dir) / subdir):
+            for name in names:
+                if name.startswith('.') or name.lower().endswith(PARTIAL_SUFFIXES):
+                    complete = False
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    size = os.path.getsize(path)
+                except OSError:
+                    # Renamed or removed while listing
+                    complete = False
+                    continue
+                listing.append((os.path.relpath(path, imagery_dir), size))
+        if not listing:
+            complete = False
+        for rel, size in sorted(listing):
+            digest.update(f"{rel}\0{size}\n".encode())
+            total += size
+        files += len(listing)
+    return {'files': files, 'bytes': total, 'digest': digest.hexdigest(), 'complete': complete}
+
+@contextlib.contextmanager
+def locked_queue(queue_path):
+    """
+    Open the job queue under an exclusive file lock, so the daemon and anything
+    taking jobs from the queue never overwrite each other's updates. The queue is
+    saved atomically when the block exits without an error.
+
+    Args:
+        queue_path: Path to the queue JSON
+
+    Yields:
+        Dictionary of job key (imagery directory) -> job dictionary
+    """
+    queue_path = Path(queue_path)
+    queue_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(queue_path.with_suffix('.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        jobs = {}
+        if queue_path.is_file():
+            with open(queue_path) as f:
+                jobs = json.load(f).get('jobs', {})
+        yield jobs
+        tmp_path = queue_path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump({'jobs': jobs}, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, queue_path)
+
+def _now():
+    return datetime.datetime.now().isoformat(timespec='seconds')
+
+def enqueue_flight(queue_path, imagery_dir, signature, status='pending'):
+    """
+    Add a flight to the job queue unless it is already queued with the same content.
+    A flight whose content changed since it was queued (e.g. a second upload into the
+    same date folder) is queued again.
+
+    Args:
+        queue_path: Path to the queue JSON
+        imagery_dir: Path to <plot>/YYYYMMDD/imagery/
+        signature: Signature from upload_signature
+        status: Status of the new job ('pending', or 'skipped' to only record the flight)
+
+    Returns:
+        True if the flight was queued, False if it was a duplicate
+    """
+    imagery_dir = Path(imagery_dir).resolve()
+    key = str(imagery_dir)
+    with locked_queue(queue_path) as jobs:
+        job = jobs.get(key)
+        if job and job['digest'] == signature['digest']:
+            return False
+        jobs[key] = {
+            'imagery_dir': key,
+            'plot': imagery_dir.parent.parent.name,
+            'date': imagery_dir.parent.name,
+            'files': signature['files'],
+            'bytes': signature['bytes'],
+            'digest': signature['digest'],
+            'status': status,
+            'queued': _now(),
+        }
+    return True
+
+def _runner():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def _runner_alive(runner):
+    # Jobs without a runner were started before runners were recorded; a runner on
+    # another host cannot be checked and is assumed alive
+    if not runner:
+        return False
+    host, _, pid = runner.rpartition(':')
+    if host != socket.gethostname():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def next_job(queue_path):
+    """
+    Take the oldest pending job from the queue and mark it running by this process.
+
+    Args:
+        queue_path: Path to the queue JSON
+
+    Returns:
+        Job dictionary, or None if no job is pending
+    """
+    with locked_queue(queue_path) as jobs:
+        pending = [job for job in jobs.values() if job['status'] == 'pending']
+        if not pending:
+            return None
+        job = min(pending, key=lambda j: j['queued'])
+        job.update(status='running', started=_now(), runner=_runner())
+        return dict(job)
+
+def requeue_interrupted_jobs(queue_path):
+    """
+    Mark running jobs whose runner process no longer exists (e.g. a daemon that was
+    killed or a host that rebooted mid-job) as pending again, so they are processed.
+    Jobs run by live processes, or by processes on other hosts, are left alone.
+
+    Args:
+        queue_path: Path to the queue JSON
+
+    Returns:
+        Number of jobs requeued
+    """
+    requeued = 0
+    with locked_queue(queue_path) as jobs:
+        for job in jobs.values():
+            if job['status'] == 'running' and not _runner_alive(job.get('runner')):
+                job.update(status='pending', requeued=_now())
+                job.pop('runner', None)
+                requeued += 1
+    return requeued
+
+def finish_job(queue_path, job, returncode):
+    """
+    Record the result of a job. If the flight was queued again while the job ran,
+    the new pending job is kept.
+
+    Args:
+        queue_path: Path to the queue JSON
+        job: Job dictionary from next_job
+        returncode: Exit code of the processing command
+    """
+    with locked_queue(queue_path) as jobs:
+        current = jobs.get(job['imagery_dir'])
+        if current is None or current['digest'] != job['digest']:
+            return
+        current.update(status='done' if returncode == 0 else 'failed', finished=_now(), returncode=returncode)
+
+def _inotify_init():
+    # inotify through libc, so the daemon needs no extra package; None where unavailable
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    return libc, fd
+
+def watched_dirs(root):
+    """
+    List the directories the daemon watches: the root, plot, date and imagery
+    directories for new flights, and the raw image directories with every
+    sub-directory below them (e.g. per-card folders) for uploads.
+
+    Args:
+        root: Watch root (<root>/<plot>/YYYYMMDD/imagery/)
+
+    Returns:
+        List of (directory, imagery directory of its flight or None)
+    """
+    dirs = [(Path(root), None)]
+    dirs += [(path, None) for path in Path(root).glob("*") if path.is_dir()]
+    dirs += [(path, None) for path in Path(root).glob("*/*") if path.is_dir()]
+    for imagery_dir in find_flights(root):
+        dirs.append((imagery_dir, str(imagery_dir)))
+        for subdir in IMAGE_SUBDIRS:
+            if (imagery_dir / subdir).parent.is_dir():
+                dirs.append(((imagery_dir / subdir).parent, str(imagery_dir)))
+            for dirpath, _, _ in os.walk(imagery_dir / subdir):
+                dirs.append((Path(dirpath), str(imagery_dir)))
+    return dirs
+
+def _watch_tree(inotify, root, watches):
+    # Re-adding an existing watch returns the same descriptor
+    libc, fd = inotify
+    for path, flight in watched_dirs(root):
+        wd = libc.inotify_add_watch(fd, str(path).encode(), WATCH_MASK)
+        if wd >= 0:
+            watches[wd] = flight
+
+def _read_events(inotify, watches, timeout):
+    # Wait for events and return the flights they touched; 'all' after a queue overflow
+    _, fd = inotify
+    ready, _, _ = select.select([fd], [], [], timeout)
+    if not ready:
+        return set()
+    time.sleep(EVENT_BATCH_SECONDS)
+    touched = set()
+    while True:
+        try:
+            data = os.read(fd, 64 * 1024)
+        except BlockingIOError:
+            break
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW:
+                return 'all'
+            touched.add(watches.get(wd))
+    return touched
+
+def _load_state(state_path):
+    if not Path(state_path).is_file():
+        return {}
+    with open(state_path) as f:
+        return json.load(f)
+
+def _save_state(state_path, tracker):
+    tmp_path = Path(state_path).with_suffix('.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(tracker, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, state_path)
+
+def check_uploads(root, tracker, settle, now, touched='all'):
+    """
+    Update the upload state of every flight and return the flights whose uploads
+    have finished, i.e. whose file count and sizes have not changed for settle seconds.
+
+    Args:
+        root: Watch root (<root>/<plot>/YYYYMMDD/imagery/)
+        tracker: Dictionary of imagery directory -> upload state, updated in place
+        settle: Seconds a flight must stay unchanged
+        now: Current time (time.time())
+        touched: Imagery directories to re-scan (from inotify events), or 'all'
+
+    Returns:
+        List of (imagery directory, signature) of finished uploads
+    """
+    flights = [str(path) for path in find_flights(root)]
+    for key in set(tracker) - set(flights):
+        del tracker[key]
+
+    finished = []
+    for key in flights:
+        state = tracker.get(key)
+        quiet = state is not None and now - state['changed'] >= settle
+        # Flights that look settled are re-scanned before queueing, in case events were missed
+        if state is None or touched == 'all' or key in touched or quiet:
+            signature = upload_signature(key)
+            if state is None or signature != state['signature']:
+                tracker[key] = {'signature': signature, 'changed': now, 'queued': None}
+                continue
+        if quiet and state['signature']['complete'] and state['queued'] != state['signature']['digest']:
+            state['queued'] = state['signature']['digest']
+            finished.append((key, state['signature']))
+    return finished
+
+def next_deadline(tracker, settle, now):
+    """
+    Seconds until the next flight needs a re-scan without an inotify event: when an
+    unqueued flight could have settled, or, for flights still incomplete after
+    settling (partial files or an empty image directory), every settle seconds,
+    as uploads written by other hosts do not raise events.
+
+    Args:
+        tracker: Dictionary from check_uploads
+        settle: Seconds a flight must stay unchanged
+        now: Current time (time.time())
+
+    Returns:
+        Seconds to wait, or None if no flight is waiting
+    """
+    waits = []
+    for state in tracker.values():
+        if state['queued'] == state['signature']['digest']:
+            continue
+        wait = state['changed'] + settle - now
+        if not state['signature']['complete'] and wait <= 0:
+            wait = settle - (now - state['changed']) % settle
+        waits.append(max(wait, 0))
+    return min(waits) if waits else None
+
+def _start_job(job, command, log_dir):
+    args = [arg.format(imagery_dir=job['imagery_dir'], plot=job['plot'], date=job['date'])
+            for arg in shlex.split(command)]
+    log_dir.mkdir(parents=True, exist_ok=True)
+    log_path = log_dir / f"{job['plot']}_{job['date']}.log"
+    print(f"Processing {job['plot']} {job['date']}: {' '.join(args)} (log: {log_path})")
+    with open(log_path, 'a') as log:
+        return subprocess.Popen(args, stdout=log, stderr=subprocess.STDOUT)
+
+def watch_uploads(root, queue_path=None, settle=300, poll=60, use_inotify=True, command=None,
+                  skip_existing=False, once=False):
+    """
+    Watch a root for new flights and queue each one as soon as its upload has finished.
+
+    inotify wakes the daemon on new, closed, moved and deleted files, so a flight is
+    re-scanned right after it changes and queued settle seconds after its last change.
+    Network filesystems do not deliver events for writes made on other hosts, so
+    without inotify (or with use_inotify=False) the tree is polled instead. The upload
+    state is kept next to the queue, so restarts and cron runs with once=True carry on
+    where the last run stopped.
+
+    Args:
+        root: Directory holding the plot directories (<root>/<plot>/YYYYMMDD/imagery/)
+        queue_path: Path to the persistent job queue (default: <root>/ingest_queue.json)
+        settle: Seconds file counts and sizes must stay unchanged before a flight is queued
+        poll: Polling interval in seconds (with inotify: while a job runs)
+        use_inotify: Use inotify when available
+        command: Processing command run for each queued job, one at a time, with {imagery_dir},
+                 {plot} and {date} placeholders (default: only queue jobs)
+        skip_existing: Record the flights already present as skipped instead of queueing them
+        once: Scan once, queue (and process) what has settled since the last run, then exit
+    """
+    root = Path(root).resolve()
+    queue_path = Path(queue_path).resolve() if queue_path else root / QUEUE_NAME
+    state_path = queue_path.parent / STATE_NAME
+    log_dir = queue_path.parent / "ingest_logs"
+    tracker = _load_state(state_path)
+
+    if command:
+        requeued = requeue_interrupted_jobs(queue_path)
+        if requeued:
+            print(f"Requeued {requeued} jobs interrupted by a previous run")
+
+    if skip_existing:
+        skipped = sum(enqueue_flight(queue_path, flight, upload_signature(flight), status='skipped')
+                      for flight in find_flights(root))
+        print(f"Recorded {skipped} existing flights as skipped")
+
+    inotify = None
+    if use_inotify and not once:
+        inotify = _inotify_init()
+        if not inotify:
+            print("Warning: inotify not available. Falling back to polling.")
+    if inotify:
+        print(f"Watching {root} with inotify (settle {settle}s)")
+    elif not once:
+        print(f"Polling {root} every {poll}s (settle {settle}s)")
+
+    watches = {}
+    running = None
+    touched = 'all'
+    while True:
+        if inotify and touched:
+            # New plot, date or image directories need their own watches
+            _watch_tree(inotify, root, watches)
+        for imagery_dir, signature in check_uploads(root, tracker, settle, time.time(), touched):
+            if enqueue_flight(queue_path, imagery_dir, signature):
+                print(f"Queued {imagery_dir} ({signature['files']} files, {signature['bytes'] / 1e9:.1f} GB)")
+        _save_state(state_path, tracker)
+
+        if running and running[1].poll() is not None:
+            job, process = running
+            finish_job(queue_path, job, process.returncode)
+            print(f"Finished {job['plot']} {job['date']} (exit code {process.returncode})")
+            running = None
+        while command and not running:
+            job = next_job(queue_path)
+            if not job:
+                break
+            try:
+                running = (job, _start_job(job, command, log_dir))
+            except OSError as e:
+                print(f"Could not start processing of {job['imagery_dir']}: {e}")
+                finish_job(queue_path, job, -1)
+                continue
+            if once:
+                job, process = running
+                finish_job(queue_path, job, process.wait())
+                print(f"Finished {job['plot']} {job['date']} (exit code {process.returncode})")
+                running = None
+
+        if once:
+            return
+
+        if inotify:
+            deadline = next_deadline(tracker, settle, time.time())
+            waits = [wait for wait in (deadline, poll if running else None) if wait is not None]
+            touched = _read_events(inotify, watches, min(waits) if waits else None)
+        else:
+            time.sleep(poll)
+            touched = 'all'
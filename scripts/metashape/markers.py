@@ -1,6 +1,24 @@
+import math
 import os
+import re
 import Metashape
 
+# One exposure of a DJI RTK timestamp file (*_Timestamp.MRK), e.g.
+# 1	369321.510478	[2160]	   -12,N	    19,E	    75,V	-27.12345678,Lat	153.12345678,Lon	45.123,Ellh	0.012345, 0.012345, 0.023456	50,Q
+DJI_MRK_PATTERN = re.compile(
+    r'^\s*(?P<seq>\d+)\s+(?P<gps_time>[\d.]+)\s+\[(?P<week>\d+)\]\s+'
+    r'(?P<north>-?[\d.]+),N\s+(?P<east>-?[\d.]+),E\s+(?P<vertical>-?[\d.]+),V\s+'
+    r'(?P<lat>-?[\d.]+),Lat\s+(?P<lon>-?[\d.]+),Lon\s+(?P<height>-?[\d.]+),Ellh\s+'
+    r'(?P<std_n>[\d.]+),\s*(?P<std_e>[\d.]+),\s*(?P<std_v>[\d.]+)\s+(?P<quality>\d+),Q')
+
+# Image sequence number in DJI file names: DJI_0001.JPG or DJI_20240101120000_0001_D.JPG
+DJI_SEQUENCE_PATTERN = re.compile(r'^DJI_(?:\d{14}_)?(\d{4})(?:_\w+)?$', re.IGNORECASE)
+
+# RTK solution quality flags in DJI timestamp files
+DJI_RTK_QUALITY = {50: 'fixed', 34: 'float', 16: 'single'}
+
+EARTH_RADIUS = 6378137.0
+
 def find_marker_files(folder):
     """
     Find .mrk marker files in a directory
@@ -18,6 +36,110 @@ def find_marker_files(folder):
                 marker_files.append(os.path.join(root, fname))
     return marker_files
 
+def is_dji_timestamp_file(path):
+    """
+    Check whether a .mrk file is a DJI RTK timestamp log rather than a GCP list.
+    
+    Args:
+        path: Path to .mrk file
+        
+    Returns:
+        True if the first data line follows the DJI timestamp format
+    """
+    with open(path, 'r', errors='replace') as f:
+        for line in f:
+            if line.strip():
+                return bool(DJI_MRK_PATTERN.match(line))
+    return False
+
+def iter_dji_timestamps(path):
+    """
+    Stream the exposures of a DJI RTK timestamp file without reading it into memory.
+    
+    Args:
+        path: Path to *_Timestamp.MRK file
+        
+    Yields:
+        Tuple of (sequence number, (lon, lat, ellipsoidal height), (std east, std north, std vertical),
+                  (north, east, vertical) lever arm offsets in mm, quality flag)
+    """
+    match_line = DJI_MRK_PATTERN.match
+    with open(path, 'r', errors='replace') as f:
+        for line in f:
+            match = match_line(line)
+            if not match:
+                if line.strip():
+                    print(f"Warning: Could not parse line in timestamp file: {line.strip()}")
+                continue
+            yield (int(match['seq']),
+                   (float(match['lon']), float(match['lat']), float(match['height'])),
+                   (float(match['std_e']), float(match['std_n']), float(match['std_v'])),
+                   (float(match['north']), float(match['east']), float(match['vertical'])),
+                   int(match['quality']))
+
+def apply_lever_arm(location, offsets_mm):
+    """
+    Move an antenna position to the camera using the lever arm offsets of a DJI timestamp file.
+    
+    Args:
+        location: (lon, lat, ellipsoidal height) of the antenna
+        offsets_mm: (north, east, vertical) offsets in mm, vertical positive down
+        
+    Returns:
+        (lon, lat, ellipsoidal height) of the camera
+    """
+    lon, lat, height = location
+    north, east, vertical = (offset / 1000 for offset in offsets_mm)
+    lat_shift = math.degrees(north / EARTH_RADIUS)
+    lon_shift = math.degrees(east / (EARTH_RADIUS * math.cos(math.radians(lat))))
+    return lon + lon_shift, lat + lat_shift, height - vertical
+
+def load_dji_timestamps(chunk, mrk_file, lever_arm=True):
+    """
+    Apply a DJI RTK timestamp file to the reference locations and accuracies of the
+    cameras it belongs to. Exposures are matched to images in the same directory by
+    their sequence number.
+    
+    Args:
+        chunk: Metashape chunk with WGS84 camera references
+        mrk_file: Path to *_Timestamp.MRK file
+        lever_arm: Whether to apply the antenna to camera lever arm offsets
+        
+    Returns:
+        Number of cameras updated
+    """
+    mrk_dir = os.path.normpath(os.path.dirname(mrk_file))
+    cameras = {}
+    for camera in chunk.cameras:
+        if not camera.photo or os.path.normpath(os.path.dirname(camera.photo.path)) != mrk_dir:
+            continue
+        match = DJI_SEQUENCE_PATTERN.match(camera.label)
+        if match:
+            cameras[int(match.group(1))] = camera
+    
+    updated = 0
+    exposures = 0
+    quality_counts = {}
+    for seq, location, accuracy, offsets, quality in iter_dji_timestamps(mrk_file):
+        exposures += 1
+        quality_name = DJI_RTK_QUALITY.get(quality, str(quality))
+        quality_counts[quality_name] = quality_counts.get(quality_name, 0) + 1
+        camera = cameras.get(seq)
+        if camera is None:
+            continue
+        if lever_arm:
+            location = apply_lever_arm(location, offsets)
+        camera.reference.location = Metashape.Vector(location)
+        camera.reference.location_accuracy = Metashape.Vector(accuracy)
+        camera.reference.location_enabled = True
+        updated += 1
+    
+    summary = ', '.join(f"{count} {name}" for name, count in sorted(quality_counts.items()))
+    print(f"Applied {updated} of {exposures} RTK exposures from {os.path.basename(mrk_file)} ({summary})")
+    if updated < len(cameras):
+        print(f"Warning: {len(cameras) - updated} images in {mrk_dir} have no RTK exposure")
+    return updated
+
 def read_marker_file(marker_file):
     """
     Read Agisoft marker file and return markers with their coordinates.
@@ -66,7 +188,8 @@ def read_marker_file(marker_file):
 
 def load_markers(chunk, mrk_files):
     """
-    Load markers from .mrk files into the chunk
+    Load markers from .mrk files into the chunk. DJI RTK timestamp files are
+    applied as camera reference locations instead (see load_dji_timestamps).
     
     Args:
         chunk: Metashape chunk
@@ -84,6 +207,11 @@ def load_markers(chunk, mrk_files):
     
     for mrk_file in mrk_files:
         try:
+            # DJI RTK timestamp logs hold camera positions, not ground control
+            if is_dji_timestamp_file(mrk_file):
+                load_dji_timestamps(chunk, mrk_file)
+                continue
+            
             markers = read_marker_file(mrk_file)
             if not markers:
                 print(f"No markers found in {mrk_file}")
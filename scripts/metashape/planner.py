@@ -0,0 +1,198 @@
+import os
+import time
+from pathlib import Path
+from .utils import find_images, DICT_ORTHO_SURFACE
+from .image_utils import find_filtered_images, read_capture_time, select_band_files, validate_capture_sets
+from .dedup import MANIFEST_NAME, load_scan_manifest, scan_entries
+
+# Approximate seconds per camera (RGB image or multispectral capture) on the processing
+# nodes, used to predict stage runtimes in dry runs
+STAGE_COST_PER_CAMERA = {
+    'add_photos': 0.01,
+    'match_and_align': 0.6,
+    'surface': 0.05,
+    'orthomosaic': 0.4,
+}
+
+# Runtime factors of the alignment modes and orthorectification surfaces
+ALIGN_MODE_FACTOR = {'single': 1.0, 'two_pass': 0.6}
+SURFACE_FACTOR = {'model': 1.0, 'dem': 0.5}
+
+def _total_gb(paths):
+    return sum(os.path.getsize(path) for path in paths) / 1e9
+
+def predict_time_filter(rgb_images, multispec_captures, time_buffer=0):
+    """
+    Predict how many multispectral captures fall outside the RGB capture window,
+    from capture times read from the image headers. Whole-hour clock offsets
+    between the cameras are removed first.
+
+    Args:
+        rgb_images: RGB image paths
+        multispec_captures: Multispectral captures (lists of band files)
+        time_buffer: Buffer in seconds added to each end of the RGB window
+
+    Returns:
+        Tuple of (captures outside the window, captures with a capture time), or None if
+        no capture times were found
+    """
+    rgb_times = [t.timestamp() for t in map(read_capture_time, rgb_images) if t]
+    ms_times = [t.timestamp() for t in (read_capture_time(capture[0]) for capture in multispec_captures) if t]
+    if not rgb_times or not ms_times:
+        return None
+    rgb_center = (min(rgb_times) + max(rgb_times)) / 2
+    ms_center = (min(ms_times) + max(ms_times)) / 2
+    offset = round((ms_center - rgb_center) / 3600) * 3600
+    low, high = min(rgb_times) - time_buffer, max(rgb_times) + time_buffer
+    outside = sum(1 for t in ms_times if not low <= t - offset <= high)
+    return outside, len(ms_times)
+
+def predict_duplicates(image_paths, root, manifest_path):
+    """
+    Predict the duplicate check from the scan manifest without hashing anything.
+
+    Args:
+        image_paths: Image paths below root
+        root: Imagery directory the image paths are below
+        manifest_path: Scan manifest of the flight
+
+    Returns:
+        Tuple of (known duplicates from cached hashes, files that would need hashing)
+    """
+    entries = scan_entries(image_paths, root, load_scan_manifest(manifest_path))
+    sizes = {}
+    for _, entry in entries:
+        sizes[entry['size']] = sizes.get(entry['size'], 0) + 1
+    candidates = [entry for _, entry in entries if sizes[entry['size']] > 1]
+    hashes = {}
+    for entry in candidates:
+        if 'hash' in entry:
+            hashes[entry['hash']] = hashes.get(entry['hash'], 0) + 1
+    known = sum(count - 1 for count in hashes.values())
+    to_hash = sum(1 for entry in candidates if 'quick' not in entry)
+    return known, to_hash
+
+def predict_quality_screen(image_paths, root, manifest_path, min_sharpness, max_clipped):
+    """
+    Predict the quality pre-screen from scores cached in the scan manifest.
+
+    Returns:
+        Tuple of (images that would be excluded, images with cached scores)
+    """
+    entries = [entry for _, entry in scan_entries(image_paths, root, load_scan_manifest(manifest_path))
+               if 'sharpness' in entry]
+    if not entries:
+        return 0, 0
+    scores = sorted(entry['sharpness'] for entry in entries)
+    threshold = min_sharpness * scores[len(scores) // 2]
+    excluded = sum(1 for entry in entries
+                   if entry['sharpness'] < threshold
+                   or max(entry['clipped_dark'], entry['clipped_bright']) > max_clipped)
+    return excluded, len(entries)
+
+def predict_runtimes(rgb_cameras, multispec_cameras, align_mode='single', surface='model'):
+    """
+    Predict stage runtimes from the camera counts.
+
+    Returns:
+        Dictionary of stage -> predicted seconds
+    """
+    cameras = rgb_cameras + multispec_cameras
+    runtimes = {stage: cost * cameras for stage, cost in STAGE_COST_PER_CAMERA.items()}
+    runtimes['match_and_align'] *= ALIGN_MODE_FACTOR.get(align_mode, 1.0)
+    runtimes['surface'] *= SURFACE_FACTOR.get(surface, 1.0)
+    return runtimes
+
+def plan_run(args, script, started=None):
+    """
+    Report what a processing run would do without Metashape: discovered images,
+    expected filter outcomes from header metadata and cached scan results, the chosen
+    parameters and predicted stage runtimes.
+
+    Args:
+        args: Parsed arguments of the entry script
+        script: 'coalign' or 'load_multispec'
+        started: time.perf_counter() value at script start, to report startup time
+
+    Returns:
+        Plan dictionary
+    """
+    plan_start = time.perf_counter()
+    imagery_dir = Path(args.imagery_dir).resolve()
+    if imagery_dir.name != "imagery":
+        raise ValueError("The --imagery_dir must point to the 'imagery' directory (e.g., <plot>/YYYYMMDD/imagery/)")
+    rgb_dir = imagery_dir / "rgb" / "level0_raw"
+    multispec_dir = imagery_dir / "multispec" / "level0_raw"
+    manifest_path = imagery_dir / MANIFEST_NAME
+
+    if script == 'coalign':
+        rgb_images = find_images(rgb_dir)
+        multispec_images = find_images(multispec_dir)
+    else:
+        rgb_images = find_filtered_images(rgb_dir, extensions=('.jpg', '.jpeg'))
+        multispec_images = find_filtered_images(multispec_dir, extensions=('.tif', '.tiff'),
+                                                exclude_patterns=('_6.tif',))
+
+    print(f"Dry run for {imagery_dir.parent.parent.name} {imagery_dir.parent.name} ({script})")
+    print(f"RGB: {len(rgb_images)} images ({_total_gb(rgb_images):.1f} GB) in {rgb_dir}")
+    print(f"Multispec: {len(multispec_images)} files ({_total_gb(multispec_images):.1f} GB) in {multispec_dir}")
+    plan = {'rgb_images': len(rgb_images), 'multispec_files': len(multispec_images)}
+
+    if getattr(args, 'bands', None):
+        multispec_images, _ = select_band_files(multispec_images, args.bands)
+
+    if getattr(args, 'dedup', 'none') != 'none':
+        known, to_hash = predict_duplicates(rgb_images + multispec_images, imagery_dir, manifest_path)
+        print(f"Dedup: {known} known duplicates from cached hashes, {to_hash} same-size files still to hash")
+        plan['known_duplicates'] = known
+
+    if getattr(args, 'quality_screen', False):
+        excluded, cached = predict_quality_screen(rgb_images, imagery_dir, manifest_path,
+                                                  args.min_sharpness, args.max_clipped)
+        print(f"Quality screen: {excluded} of {cached} cached RGB scores below threshold, "
+              f"{len(rgb_images) - cached} images still to score")
+
+    captures = validate_capture_sets(multispec_images)
+    plan['multispec_captures'] = len(captures)
+
+    # coalign always applies the time filter; load_multispec applies the one chosen with -filter_method
+    filter_method = getattr(args, 'filter_method', 'time')
+    if filter_method in ('spatial', 'both'):
+        print("Spatial filter: needs camera positions from Metashape, not predicted")
+        plan['spatial_filter'] = 'not predicted'
+    if filter_method in ('time', 'both'):
+        time_filter = predict_time_filter(rgb_images, captures, getattr(args, 'time_buffer', 0))
+        if time_filter:
+            outside, timed = time_filter
+            after = " (counted without the spatial filter that runs first)" if filter_method == 'both' else ""
+            print(f"Time filter: {outside} of {timed} multispectral captures outside the RGB capture window{after}")
+            plan['outside_rgb_window'] = outside
+        else:
+            print("Time filter: no capture times found in image headers")
+
+    marker_files = find_images(rgb_dir, extensions=('.mrk',))
+    if marker_files:
+        print(f"Marker files: {len(marker_files)} .mrk files in {rgb_dir}")
+
+    smooth = getattr(args, 'smooth', 'low')
+    surface = getattr(args, 'ortho_surface', 'model')
+    if surface == 'preset':
+        surface = DICT_ORTHO_SURFACE[smooth]
+    parameters = {key: value for key, value in sorted(vars(args).items()) if key != 'dry_run'}
+    print("Parameters:")
+    for key, value in parameters.items():
+        print(f"  {key}: {value}")
+
+    runtimes = predict_runtimes(len(rgb_images), len(captures), getattr(args, 'align_mode', 'single'), surface)
+    print("Predicted stage runtimes:")
+    for stage, seconds in runtimes.items():
+        print(f"  {stage}: {seconds / 60:.1f} min")
+    print(f"  total: {sum(runtimes.values()) / 60:.1f} min")
+    plan['predicted_runtime_s'] = runtimes
+
+    plan_time = time.perf_counter() - plan_start
+    if started is not None:
+        print(f"Startup {plan_start - started:.2f} s, planning {plan_time:.2f} s")
+    else:
+        print(f"Planning {plan_time:.2f} s")
+    return plan
@@ -1,5 +1,7 @@
+import time
+import numpy as np
 import Metashape
-from .utils import DICT_SMOOTH_STRENGTH
+from .utils import DICT_SMOOTH_STRENGTH, DEM_RESOLUTION, REFLECTANCE_SCALE
 
 def detect_reflectance_panels(chunk):
     """
@@ -10,7 +12,7 @@ def detect_reflectance_panels(chunk):
     chunk.locateReflectancePanels()
     print("Reflectance panel detection complete.")
 
-def align_images(chunk):
+def align_images(chunk, keep_keypoints=False, downscale=1, keypoint_limit=50000, tiepoint_limit=5000):
     """
     Align images with specified settings:
     - Accuracy: High
@@ -20,25 +22,44 @@ def align_images(chunk):
     - Tie Points: 5,000
     - Exclude stationary points: Enabled
     - Guided Image Matching: Disabled
+    
+    Args:
+        chunk: Metashape chunk containing the images
+        keep_keypoints: Store keypoints in the project for incremental alignment
+        downscale: Image downscale factor for matching (1 = High accuracy, 2 = Medium)
+        keypoint_limit: Key points limit
+        tiepoint_limit: Tie points limit
     """
     print("Aligning images...")
     
     # Match photos with specified settings
     chunk.matchPhotos(
-        downscale=1,  # High accuracy
+        downscale=downscale,  # High accuracy by default
         generic_preselection=True,  # Enable generic preselection
         reference_preselection=True,  # Enable reference preselection
         reference_preselection_mode=Metashape.ReferencePreselectionSource,  # Source mode
-        keypoint_limit=50000,  # Key points limit
-        tiepoint_limit=5000,  # Tie points limit
+        keypoint_limit=keypoint_limit,  # Key points limit
+        tiepoint_limit=tiepoint_limit,  # Tie points limit
         filter_stationary_points=True,  # Exclude stationary points
         guided_matching=False,  # Disable guided image matching,
+        keep_keypoints=keep_keypoints,  # Store keypoints for incremental alignment
     )
     
     # Align cameras
     chunk.alignCameras()
     
     # Optimize cameras with specified parameters
+    optimize_cameras(chunk)
+    
+    print("Image alignment complete!")
+
+def optimize_cameras(chunk):
+    """
+    Optimize camera alignment fitting all calibration parameters and additional corrections.
+    
+    Args:
+        chunk: Metashape chunk containing the aligned images
+    """
     chunk.optimizeCameras(
         fit_f=True,  # Fit focal length
         fit_cx=True,  # Fit principal point x
@@ -52,10 +73,156 @@ def align_images(chunk):
         fit_b2=True,  # Fit affinity b2
         fit_corrections=True,  # Fit additional corrections
     )
+
+# Tie point quality criteria used by gradual selection, with the default
+# percentile of points kept for each criterion (the worst remainder is removed)
+GRADUAL_SELECTION_PERCENTILES = {
+    'reprojection_error': 90,
+    'reconstruction_uncertainty': 90,
+    'projection_accuracy': 90,
+}
+
+def gradual_selection(chunk, percentiles=None, iterations=2):
+    """
+    Remove the worst tie points and re-optimize cameras, iteratively.
+    Per-point values for each criterion are fetched in bulk and thresholds are
+    taken from their distribution, so each pass removes at most the configured
+    share of points per criterion.
+    
+    Args:
+        chunk: Metashape chunk containing the aligned images
+        percentiles: Dictionary of criterion -> percentile of points to keep
+                     (defaults to GRADUAL_SELECTION_PERCENTILES)
+        iterations: Number of selection + optimization passes
+        
+    Returns:
+        List of per-iteration dictionaries with point counts and optimization time
+    """
+    if percentiles is None:
+        percentiles = GRADUAL_SELECTION_PERCENTILES
+    
+    criteria = {
+        'reprojection_error': Metashape.TiePoints.Filter.ReprojectionError,
+        'reconstruction_uncertainty': Metashape.TiePoints.Filter.ReconstructionUncertainty,
+        'projection_accuracy': Metashape.TiePoints.Filter.ProjectionAccuracy,
+    }
+    
+    print("Running tie point gradual selection...")
+    report = []
+    for iteration in range(1, iterations + 1):
+        points_before = len(chunk.tie_points.points)
+        thresholds = {}
+        
+        for name, criterion in criteria.items():
+            if name not in percentiles:
+                continue
+            point_filter = Metashape.TiePoints.Filter()
+            point_filter.init(chunk, criterion=criterion)
+            values = np.asarray(point_filter.values, dtype=np.float64)
+            values = values[np.isfinite(values)]
+            if values.size == 0:
+                continue
+            threshold = float(np.percentile(values, percentiles[name]))
+            point_filter.removePoints(threshold)
+            thresholds[name] = threshold
+        
+        points_after = len(chunk.tie_points.points)
+        
+        start = time.perf_counter()
+        optimize_cameras(chunk)
+        optimize_time = time.perf_counter() - start
+        
+        report.append({
+            'iteration': iteration,
+            'points_before': points_before,
+            'points_after': points_after,
+            'thresholds': thresholds,
+            'optimize_time_s': optimize_time,
+        })
+        threshold_str = ", ".join(f"{k}<={v:.3f}" for k, v in thresholds.items())
+        print(f"Iteration {iteration}: {points_before} -> {points_after} tie points "
+              f"({threshold_str}), optimizeCameras {optimize_time:.1f}s")
+    
+    print("Gradual selection complete!")
+    return report
+
+def align_images_two_pass(chunk, coarse_downscale=4, coarse_keypoint_limit=10000, downscale=1,
+                          keypoint_limit=50000, tiepoint_limit=5000):
+    """
+    Coarse-to-fine alignment:
+    - Pass 1: match and align at a coarser downscale to get approximate poses quickly
+    - Cameras that fail to align in pass 1 are disabled
+    - Pass 2: re-match the remaining cameras at full resolution, preselecting pairs
+      from the coarse (estimated) poses, keeping keypoints in the project, and refine
+      the existing alignment instead of starting over
+    
+    Args:
+        chunk: Metashape chunk containing the images
+        coarse_downscale: Image downscale factor for the coarse pass (default: 4 = Low accuracy)
+        coarse_keypoint_limit: Key point limit for the coarse pass
+        downscale: Image downscale factor for the fine pass
+        keypoint_limit: Key point limit for the fine pass
+        tiepoint_limit: Tie point limit of both passes
+        
+    Returns:
+        Number of cameras rejected after the coarse pass
+    """
+    print(f"Aligning images (coarse pass, downscale={coarse_downscale})...")
+    chunk.matchPhotos(
+        downscale=coarse_downscale,
+        generic_preselection=True,
+        reference_preselection=True,
+        reference_preselection_mode=Metashape.ReferencePreselectionSource,
+        keypoint_limit=coarse_keypoint_limit,
+        tiepoint_limit=tiepoint_limit,
+        filter_stationary_points=True,
+        guided_matching=False,
+    )
+    chunk.alignCameras()
+    
+    # Reject cameras that could not be aligned at the coarse level
+    rejected = 0
+    for camera in chunk.cameras:
+        if camera.master != camera or not camera.enabled:
+            continue
+        if camera.group and camera.group.label == 'Calibration images':
+            continue
+        if not camera.transform:
+            camera.enabled = False
+            rejected += 1
+    print(f"Coarse pass rejected {rejected} cameras that failed to align")
+    
+    aligned = [camera.key for camera in chunk.cameras if camera.enabled and camera.transform]
+    
+    print(f"Aligning images (fine pass, downscale={downscale})...")
+    chunk.matchPhotos(
+        cameras=aligned,
+        downscale=downscale,
+        generic_preselection=False,
+        reference_preselection=True,
+        reference_preselection_mode=Metashape.ReferencePreselectionEstimated,  # Use coarse poses
+        keypoint_limit=keypoint_limit,
+        tiepoint_limit=tiepoint_limit,
+        filter_stationary_points=True,
+        guided_matching=False,
+        keep_keypoints=True,
+        reset_matches=True,
+    )
+    chunk.alignCameras(cameras=aligned, reset_alignment=False)
+    
+    optimize_cameras(chunk)
     
     print("Image alignment complete!")
+    return rejected
+
+# Metashape face count presets of the tie point model
+FACE_COUNTS = {
+    'low': Metashape.LowFaceCount,
+    'medium': Metashape.MediumFaceCount,
+    'high': Metashape.HighFaceCount,
+}
 
-def build_model(chunk, smooth_strength='low'):
+def build_model(chunk, smooth_strength='low', face_count='medium'):
     """
     Build and optimize model using tie points data.
     This is more efficient and sufficient for orthomosaic generation.
@@ -63,6 +230,7 @@ def build_model(chunk, smooth_strength='low'):
     Args:
         chunk: Metashape chunk containing the aligned images
         smooth_strength: Smoothing strength ('low', 'medium', or 'high')
+        face_count: Model face count ('low', 'medium', or 'high')
     """
     print("Building model from tie points...")
     
@@ -70,7 +238,7 @@ def build_model(chunk, smooth_strength='low'):
     chunk.buildModel(
         surface_type=Metashape.HeightField,
         source_data=Metashape.TiePointsData,
-        face_count=Metashape.MediumFaceCount,
+        face_count=FACE_COUNTS[face_count],
         interpolation=Metashape.EnabledInterpolation,
         build_texture=False
     )
@@ -82,6 +250,73 @@ def build_model(chunk, smooth_strength='low'):
     
     print("Model building and smoothing complete!")
 
+def build_dem(chunk, resolution=DEM_RESOLUTION):
+    """
+    Build a coarse DEM from tie points to use as orthorectification surface.
+    Faster than building and smoothing a mesh and adequate for flat plots.
+    
+    Args:
+        chunk: Metashape chunk containing the aligned images
+        resolution: DEM resolution in metres
+    """
+    print(f"Building {resolution} m DEM from tie points...")
+    chunk.buildDem(
+        source_data=Metashape.TiePointsData,
+        interpolation=Metashape.EnabledInterpolation,
+        resolution=resolution
+    )
+    print("DEM building complete!")
+
+def build_surface(chunk, surface='model', smooth_strength='low', dem_resolution=DEM_RESOLUTION, face_count='medium'):
+    """
+    Build the orthorectification surface.
+    
+    Args:
+        chunk: Metashape chunk containing the aligned images
+        surface: 'model' (smoothed tie point mesh) or 'dem' (coarse tie point DEM)
+        smooth_strength: Smoothing strength for the model ('low', 'medium', or 'high')
+        dem_resolution: DEM resolution in metres
+        face_count: Model face count ('low', 'medium', or 'high')
+        
+    Returns:
+        Metashape.DataSource to pass as surface_data to buildOrthomosaic
+    """
+    if surface == 'dem':
+        build_dem(chunk, resolution=dem_resolution)
+        return Metashape.DataSource.ElevationData
+    if surface == 'model':
+        build_model(chunk, smooth_strength=smooth_strength, face_count=face_count)
+        return Metashape.DataSource.ModelData
+    raise ValueError(f"Unknown orthorectification surface '{surface}', expected 'model' or 'dem'")
+
+def ortho_surface_data(chunk):
+    """
+    Pick the orthorectification surface available in a chunk, preferring the model.
+    
+    Args:
+        chunk: Metashape chunk
+        
+    Returns:
+        Metashape.DataSource to pass as surface_data to buildOrthomosaic
+    """
+    if not chunk.model and chunk.elevation:
+        return Metashape.DataSource.ElevationData
+    return Metashape.DataSource.ModelData
+
+def reflectance_band_sensors(multispec_sensors):
+    """
+    Get the sensors exported as reflectance bands, in raster transform order.
+    Panchro (moved to layer index 10 by configure_multispectral_camera) is excluded.
+    
+    Args:
+        multispec_sensors: List of multispectral sensors
+        
+    Returns:
+        List of sensors sorted by layer_index
+    """
+    return sorted([sensor for sensor in multispec_sensors if sensor.layer_index < 10], 
+                  key=lambda x: x.layer_index)
+
 def calibrate_reflectance_and_transform(multispec_chunk, multispec_sensors, doc, use_sun_sensor=False):
     """
     Calibrate reflectance and update raster transform for multispectral images.
@@ -100,14 +335,13 @@ def calibrate_reflectance_and_transform(multispec_chunk, multispec_sensors, doc,
     raster_transform_formula = []
     
     # Get sensors sorted by layer_index
-    sorted_sensors = sorted([sensor for sensor in multispec_sensors if sensor.layer_index < 10], 
-                          key=lambda x: x.layer_index)
+    sorted_sensors = reflectance_band_sensors(multispec_sensors)
     
     # Create transform formula for first 10 bands only, excluding panchro
     for sensor in sorted_sensors:
         # Use the actual layer index for the band reference
         band_idx = sensor.layer_index
-        raster_transform_formula.append(f"B{band_idx}/32768")
+        raster_transform_formula.append(f"B{band_idx}/{REFLECTANCE_SCALE}")
 
     multispec_chunk.raster_transform.formula = raster_transform_formula
     multispec_chunk.raster_transform.calibrateRange()
@@ -0,0 +1,200 @@
+import json
+from pathlib import Path
+import numpy as np
+from osgeo import gdal
+from .indices import iter_windows, window_size, read_reflectance
+
+# Fixed histogram range for reflectance; values outside land in the under/overflow counts
+HIST_RANGE = (-0.5, 1.5)
+HIST_BINS = 2000
+
+# Default limits used to flag a bad reflectance calibration
+QA_LIMITS = {
+    'max_out_of_range_fraction': 0.01,  # Share of valid pixels with reflectance < 0 or > 1
+    'max_p99': 1.0,                     # 99th percentile reflectance
+    'min_p50': 0.005,                   # Median reflectance (all dark suggests bad panel values)
+}
+
+def new_band_stats(bins=HIST_BINS, value_range=HIST_RANGE):
+    """
+    Create empty streaming statistics for one band.
+
+    Args:
+        bins: Number of histogram bins
+        value_range: (low, high) histogram range
+
+    Returns:
+        Dictionary of running statistics
+    """
+    return {
+        'count': 0, 'mean': 0.0, 'm2': 0.0, 'min': np.inf, 'max': -np.inf,
+        'below_zero': 0, 'above_one': 0,
+        'edges': np.linspace(value_range[0], value_range[1], bins + 1),
+        'hist': np.zeros(bins, dtype=np.int64), 'underflow': 0, 'overflow': 0,
+    }
+
+def update_band_stats(stats, values):
+    """
+    Add the finite values of a window to running band statistics.
+    Mean and variance use Welford's method, combining each window's moments
+    with the running ones (Chan's parallel update) so no pixels are kept.
+
+    Args:
+        stats: Dictionary from new_band_stats
+        values: Array of reflectance values
+    """
+    values = values[np.isfinite(values)].astype(np.float64, copy=False)
+    n = values.size
+    if n == 0:
+        return
+
+    block_mean = values.mean()
+    block_m2 = np.square(values - block_mean).sum()
+    total = stats['count'] + n
+    delta = block_mean - stats['mean']
+    stats['mean'] += delta * n / total
+    stats['m2'] += block_m2 + delta * delta * stats['count'] * n / total
+    stats['count'] = total
+
+    stats['min'] = min(stats['min'], values.min())
+    stats['max'] = max(stats['max'], values.max())
+    stats['below_zero'] += int(np.count_nonzero(values < 0))
+    stats['above_one'] += int(np.count_nonzero(values > 1))
+
+    edges = stats['edges']
+    stats['hist'] += np.histogram(values, bins=edges)[0]
+    stats['underflow'] += int(np.count_nonzero(values < edges[0]))
+    stats['overflow'] += int(np.count_nonzero(values > edges[-1]))
+
+def histogram_percentile(stats, q):
+    """
+    Approximate a percentile by linear interpolation within histogram bins.
+
+    Args:
+        stats: Dictionary from new_band_stats
+        q: Percentile in [0, 100]
+
+    Returns:
+        Approximate percentile value
+    """
+    if stats['count'] == 0:
+        return float('nan')
+    target = q / 100 * stats['count']
+    if target <= stats['underflow']:
+        return float(stats['min'])
+    hist, edges = stats['hist'], stats['edges']
+    cumulative = stats['underflow'] + np.cumsum(hist)
+    idx = int(np.searchsorted(cumulative, target))
+    if idx >= len(hist):
+        return float(stats['max'])
+    before = cumulative[idx] - hist[idx]
+    fraction = (target - before) / hist[idx] if hist[idx] else 0.0
+    return float(edges[idx] + fraction * (edges[idx + 1] - edges[idx]))
+
+def summarize_band_stats(stats):
+    """
+    Summarise running band statistics.
+
+    Args:
+        stats: Dictionary from new_band_stats
+
+    Returns:
+        JSON-serialisable dictionary
+    """
+    count = stats['count']
+    if not count:
+        return {'count': 0}
+    out_of_range = stats['below_zero'] + stats['above_one']
+    return {
+        'count': count,
+        'min': float(stats['min']),
+        'max': float(stats['max']),
+        'mean': float(stats['mean']),
+        'std': float(np.sqrt(stats['m2'] / (count - 1))) if count > 1 else 0.0,
+        'p01': histogram_percentile(stats, 1),
+        'p50': histogram_percentile(stats, 50),
+        'p99': histogram_percentile(stats, 99),
+        'below_zero_fraction': stats['below_zero'] / count,
+        'above_one_fraction': stats['above_one'] / count,
+        'out_of_range_fraction': out_of_range / count,
+    }
+
+def check_band(name, stats, limits=QA_LIMITS):
+    """
+    Compare band statistics against calibration limits.
+
+    Args:
+        name: Band name
+        stats: Band summary from summarize_band_stats
+        limits: Dictionary of QA limits
+
+    Returns:
+        List of problem descriptions, empty if the band passes
+    """
+    if not stats['count']:
+        return [f"{name}: no valid pixels"]
+    problems = []
+    if stats['out_of_range_fraction'] > limits['max_out_of_range_fraction']:
+        problems.append(f"{name}: {stats['out_of_range_fraction']:.2%} of pixels outside [0, 1]")
+    if stats['p99'] > limits['max_p99']:
+        problems.append(f"{name}: 99th percentile reflectance {stats['p99']:.3f} > {limits['max_p99']}")
+    if stats['p50'] < limits['min_p50']:
+        problems.append(f"{name}: median reflectance {stats['p50']:.4f} < {limits['min_p50']}")
+    return problems
+
+def reflectance_qa(raster_path, band_names=None, window=1024, limits=QA_LIMITS, report_path=None):
+    """
+    Compute per-band reflectance statistics of an exported multispectral orthomosaic
+    in one streaming pass and write a JSON QA report.
+
+    Args:
+        raster_path: Exported multispectral orthomosaic
+        band_names: Optional band labels in raster order (defaults to the band sidecar)
+        window: Approximate read window size in pixels
+        limits: Dictionary of QA limits used to flag bad calibrations
+        report_path: Output JSON path (defaults to '<raster>_qa.json')
+
+    Returns:
+        QA report dictionary; report['passed'] is False if any band was flagged
+    """
+    raster_path = Path(raster_path)
+    if band_names is None:
+        sidecar_path = raster_path.with_name(f"{raster_path.stem}_bands.json")
+        if sidecar_path.is_file():
+            with open(sidecar_path) as f:
+                band_names = json.load(f)['bands']
+
+    src = gdal.Open(str(raster_path))
+    width, height = src.RasterXSize, src.RasterYSize
+    bands = [src.GetRasterBand(i) for i in range(1, src.RasterCount + 1)]
+    if band_names is None or len(band_names) != len(bands):
+        band_names = [f"band_{i}" for i in range(1, len(bands) + 1)]
+    block_width, block_height = window_size(bands[0], target=window)
+
+    stats = [new_band_stats() for _ in bands]
+    for x_off, y_off, x_size, y_size in iter_windows(width, height, block_width, block_height):
+        for band, band_stats in zip(bands, stats):
+            update_band_stats(band_stats, read_reflectance(band, x_off, y_off, x_size, y_size))
+    src = None
+
+    report = {'raster': str(raster_path), 'width': width, 'height': height, 'limits': dict(limits),
+              'bands': {}, 'problems': []}
+    for name, band_stats in zip(band_names, stats):
+        summary = summarize_band_stats(band_stats)
+        report['bands'][name] = summary
+        report['problems'] += check_band(name, summary, limits)
+    report['passed'] = not report['problems']
+
+    if report_path is None:
+        report_path = raster_path.with_name(f"{raster_path.stem}_qa.json")
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    for name, summary in report['bands'].items():
+        if summary['count']:
+            print(f"{name}: mean {summary['mean']:.4f}, p01 {summary['p01']:.4f}, p99 {summary['p99']:.4f}, "
+                  f"out of range {summary['out_of_range_fraction']:.2%}")
+    for problem in report['problems']:
+        print(f"Warning: {problem}")
+    print(f"QA report saved to: {report_path} ({'passed' if report['passed'] else 'FAILED'})")
+    return report
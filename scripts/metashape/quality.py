@@ -0,0 +1,185 @@
+import io
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from .dedup import load_scan_manifest, save_scan_manifest, scan_entries
+
+# Grey levels counted as clipped shadows / highlights
+CLIP_LOW = 2
+CLIP_HIGH = 253
+
+# Longest side of the downsampled decode used when an image has no EXIF thumbnail
+DRAFT_SIZE = 640
+
+def exif_thumbnail(path, max_header=128 * 1024):
+    """
+    Extract the JPEG thumbnail embedded in the EXIF block (IFD1) of a JPEG.
+    Only the start of the file is read.
+
+    Args:
+        path: JPEG image path
+        max_header: Number of bytes to read from the start of the file
+
+    Returns:
+        Thumbnail JPEG bytes, or None if there is none
+    """
+    with open(path, 'rb') as f:
+        data = f.read(max_header)
+    start = data.find(b'Exif\x00\x00')
+    if start < 0:
+        return None
+    tiff = data[start + 6:]
+    try:
+        order = '<' if tiff[:2] == b'II' else '>'
+        ifd0 = struct.unpack(order + 'I', tiff[4:8])[0]
+        count = struct.unpack(order + 'H', tiff[ifd0:ifd0 + 2])[0]
+        ifd1 = struct.unpack(order + 'I', tiff[ifd0 + 2 + 12 * count:ifd0 + 6 + 12 * count])[0]
+        if not ifd1:
+            return None
+        count = struct.unpack(order + 'H', tiff[ifd1:ifd1 + 2])[0]
+        tags = {}
+        for i in range(count):
+            entry = tiff[ifd1 + 2 + 12 * i:ifd1 + 14 + 12 * i]
+            tag = struct.unpack(order + 'H', entry[:2])[0]
+            tags[tag] = struct.unpack(order + 'I', entry[8:12])[0]
+    except struct.error:
+        return None
+    # JPEGInterchangeFormat and JPEGInterchangeFormatLength
+    offset, length = tags.get(0x0201), tags.get(0x0202)
+    if not offset or not length or offset + length > len(tiff):
+        return None
+    return tiff[offset:offset + length]
+
+def load_preview(path, source='thumbnail'):
+    """
+    Decode a small greyscale preview of an image without a full-resolution decode.
+
+    Args:
+        path: JPEG image path
+        source: 'thumbnail' to use the EXIF thumbnail (falling back to a draft decode), or 'draft'
+
+    Returns:
+        Tuple of (uint8 greyscale array, source actually used)
+    """
+    from PIL import Image
+
+    if source == 'thumbnail':
+        thumbnail = exif_thumbnail(path)
+        if thumbnail:
+            with Image.open(io.BytesIO(thumbnail)) as image:
+                return np.asarray(image.convert('L')), 'thumbnail'
+
+    with Image.open(path) as image:
+        # JPEG draft mode decodes at 1/2, 1/4 or 1/8 scale in the DCT
+        image.draft('L', (DRAFT_SIZE, DRAFT_SIZE))
+        image.thumbnail((DRAFT_SIZE, DRAFT_SIZE))
+        return np.asarray(image.convert('L')), 'draft'
+
+def laplacian_variance(gray):
+    """
+    Sharpness score: variance of the 4-neighbour Laplacian.
+
+    Args:
+        gray: 2D greyscale array
+
+    Returns:
+        Variance of the Laplacian
+    """
+    gray = gray.astype(np.float32)
+    laplacian = (gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:]
+                 - 4 * gray[1:-1, 1:-1])
+    return float(laplacian.var())
+
+def score_images(paths, source='thumbnail'):
+    """
+    Compute sharpness and exposure clipping scores of images (run in worker threads).
+
+    Args:
+        paths: JPEG image paths
+        source: Preview source passed to load_preview
+
+    Returns:
+        List of score dictionaries, or None for images that could not be decoded
+    """
+    scores = []
+    for path in paths:
+        try:
+            gray, used = load_preview(path, source)
+        except OSError as e:
+            print(f"Could not decode preview of {path}: {e}")
+            scores.append(None)
+            continue
+        scores.append({
+            'sharpness': laplacian_variance(gray),
+            'clipped_dark': float(np.count_nonzero(gray <= CLIP_LOW) / gray.size),
+            'clipped_bright': float(np.count_nonzero(gray >= CLIP_HIGH) / gray.size),
+            'preview': used,
+        })
+    return scores
+
+def screen_images(image_paths, root, manifest_path, min_sharpness=0.5, max_clipped=0.25,
+                  source='thumbnail', workers=None, batch_size=64):
+    """
+    Exclude blurred and badly exposed images before they are added to Metashape.
+    Scores are computed on embedded thumbnails (or a downsampled decode) in worker
+    threads and cached in the scan manifest. Sharpness is compared with the
+    median of the flight, so the threshold does not depend on the scene.
+
+    Args:
+        image_paths: JPEG image paths below root
+        root: Imagery directory the image paths are below
+        manifest_path: Scan manifest of the flight
+        min_sharpness: Minimum sharpness as a fraction of the flight median
+        max_clipped: Maximum fraction of clipped shadow or highlight pixels
+        source: 'thumbnail' or 'draft' (see load_preview)
+        workers: Number of worker threads (default: CPU count)
+        batch_size: Images scored per worker job
+
+    Returns:
+        List of image paths that pass the screen, in the original order
+    """
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        print("Warning: Pillow not available. Skipping image quality pre-screen.")
+        return image_paths
+
+    files = load_scan_manifest(manifest_path)
+    entries = scan_entries(image_paths, root, files)
+
+    todo = [(path, entry) for path, entry in entries if entry.get('screen_source') != source]
+    if todo:
+        print(f"Scoring {len(todo)} image previews ({len(entries) - len(todo)} cached)...")
+        jobs = [([path for path, _ in todo[i:i + batch_size]], source) for i in range(0, len(todo), batch_size)]
+        # Threads rather than processes: decoding small previews is light, and spawned processes
+        # would not start inside the Metashape-hosted interpreter
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+            results = list(executor.map(lambda job: score_images(*job), jobs))
+        for (_, entry), score in zip(todo, (score for batch in results for score in batch)):
+            if score:
+                entry.update(score, screen_source=source)
+        save_scan_manifest(manifest_path, files)
+
+    scored = [entry['sharpness'] for _, entry in entries if 'sharpness' in entry]
+    if not scored:
+        return image_paths
+    median = float(np.median(scored))
+    threshold = min_sharpness * median
+    print(f"Median preview sharpness {median:.1f}, excluding images below {threshold:.1f} "
+          f"or with more than {max_clipped:.0%} clipped pixels")
+
+    kept = []
+    for path, entry in entries:
+        if 'sharpness' not in entry:
+            kept.append(path)
+            continue
+        clipped = max(entry['clipped_dark'], entry['clipped_bright'])
+        if entry['sharpness'] < threshold:
+            print(f"Excluding blurred image {os.path.basename(path)} (sharpness {entry['sharpness']:.1f})")
+        elif clipped > max_clipped:
+            print(f"Excluding badly exposed image {os.path.basename(path)} ({clipped:.0%} clipped)")
+        else:
+            kept.append(path)
+    print(f"Quality pre-screen kept {len(kept)} of {len(image_paths)} images")
+    return kept
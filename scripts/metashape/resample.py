@@ -0,0 +1,143 @@
+import math
+from pathlib import Path
+import numpy as np
+from osgeo import gdal
+
+def area_weights(n_in, factor, out_start, out_stop):
+    """
+    Build the area-overlap weights mapping input pixels to output pixels along one axis.
+
+    Output pixel j covers input coordinates [j * factor, (j + 1) * factor); each weight
+    is the length of overlap with input pixel i, so any (also non-integer) factor
+    gives an exact area average.
+
+    Args:
+        n_in: Number of input pixels along the axis
+        factor: Output pixel size in input pixels
+        out_start: First output pixel of the window
+        out_stop: Output pixel after the last one of the window
+
+    Returns:
+        Tuple of (weights array [out, in], first input pixel, input pixel after the last)
+    """
+    in_start = int(math.floor(out_start * factor))
+    in_stop = min(n_in, int(math.ceil(out_stop * factor)))
+    out_edges = np.arange(out_start, out_stop + 1, dtype=np.float64) * factor
+    in_edges = np.arange(in_start, in_stop + 1, dtype=np.float64)
+    lo = np.maximum(out_edges[:-1, None], in_edges[None, :-1])
+    hi = np.minimum(out_edges[1:, None], in_edges[None, 1:])
+    return np.clip(hi - lo, 0, None), in_start, in_stop
+
+def area_average_raster(src_path, dst_path, resolution, window=2048, creation_options=None):
+    """
+    Write a coarser copy of a north-up raster by block-wise area averaging.
+    Each output window is computed from only the input pixels it covers, as
+    Wy @ band @ Wx.T with area-overlap weights; pixels masked by nodata or an
+    alpha band are excluded, and the alpha band marks the output pixels with data.
+
+    Args:
+        src_path: Native-resolution raster
+        dst_path: Output raster
+        resolution: Output pixel size in the raster's CRS units
+        window: Approximate input window size in pixels
+        creation_options: GDAL GTiff creation options
+
+    Returns:
+        Path of the output raster
+    """
+    if creation_options is None:
+        creation_options = ['TILED=YES', 'COMPRESS=DEFLATE', 'PREDICTOR=2', 'BIGTIFF=IF_SAFER']
+
+    src = gdal.Open(str(src_path))
+    geo = src.GetGeoTransform()
+    factor = resolution / geo[1]
+    if factor < 1:
+        raise ValueError(f"Target resolution {resolution} is finer than the source ({geo[1]})")
+
+    width, height = src.RasterXSize, src.RasterYSize
+    out_width = int(math.ceil(width / factor))
+    out_height = int(math.ceil(height / factor))
+    data_type = src.GetRasterBand(1).DataType
+    is_integer = data_type not in (gdal.GDT_Float32, gdal.GDT_Float64)
+
+    dst = gdal.GetDriverByName('GTiff').Create(str(dst_path), out_width, out_height, src.RasterCount,
+                                               data_type, options=creation_options)
+    dst.SetGeoTransform((geo[0], resolution, 0.0, geo[3], 0.0, -resolution))
+    dst.SetProjection(src.GetProjection())
+
+    out_block = max(1, int(window // factor))
+    for band_number in range(1, src.RasterCount + 1):
+        src_band = src.GetRasterBand(band_number)
+        dst_band = dst.GetRasterBand(band_number)
+        nodata = src_band.GetNoDataValue()
+        if nodata is not None:
+            dst_band.SetNoDataValue(nodata)
+        # The alpha band is not valid data itself; it takes the validity of the colour bands
+        is_alpha = src_band.GetColorInterpretation() == gdal.GCI_AlphaBand
+        if is_alpha:
+            dst_band.SetColorInterpretation(gdal.GCI_AlphaBand)
+        mask_source = src.GetRasterBand(1) if is_alpha else src_band
+        mask_band = None if mask_source.GetMaskFlags() & gdal.GMF_ALL_VALID else mask_source.GetMaskBand()
+
+        for oy in range(0, out_height, out_block):
+            oy_stop = min(out_height, oy + out_block)
+            wy, y0, y1 = area_weights(height, factor, oy, oy_stop)
+            for ox in range(0, out_width, out_block):
+                ox_stop = min(out_width, ox + out_block)
+                wx, x0, x1 = area_weights(width, factor, ox, ox_stop)
+
+                data = src_band.ReadAsArray(x0, y0, x1 - x0, y1 - y0).astype(np.float64)
+                if mask_band is None:
+                    valid = np.ones_like(data)
+                else:
+                    valid = (mask_band.ReadAsArray(x0, y0, x1 - x0, y1 - y0) > 0).astype(np.float64)
+                total = wy @ (data * valid) @ wx.T
+                weight = wy @ valid @ wx.T
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    out = total / weight
+                # Output pixels with no valid input area stay nodata
+                empty = weight <= 0
+                if is_alpha:
+                    out = np.where(empty, 0, 255)
+                elif is_integer:
+                    out = np.rint(out)
+                if nodata is not None:
+                    out[empty] = nodata
+                else:
+                    out[empty] = 0
+                dst_band.WriteArray(out, ox, oy)
+
+    dst.FlushCache()
+    dst = None
+    src = None
+    return Path(dst_path)
+
+def build_resolution_ladder(native_path, resolutions, output_path_for, window=2048):
+    """
+    Produce coarser versions of a native-resolution orthomosaic without re-rendering it.
+    The native raster needs an alpha band or nodata value, otherwise the background
+    around the orthomosaic is averaged into its edge pixels.
+
+    Args:
+        native_path: Native-resolution raster written by the exporter
+        resolutions: Output resolutions in the raster's CRS units
+        output_path_for: Function mapping a resolution to its output path
+        window: Approximate input window size in pixels
+
+    Returns:
+        Dictionary of resolution -> output path
+    """
+    src = gdal.Open(str(native_path))
+    native_res = src.GetGeoTransform()[1]
+    src = None
+
+    outputs = {}
+    for resolution in sorted(resolutions):
+        if resolution <= native_res:
+            print(f"Skipping {resolution}: not coarser than the native resolution {native_res}")
+            continue
+        out_path = output_path_for(resolution)
+        print(f"Area averaging {Path(native_path).name} to {resolution}...")
+        outputs[resolution] = area_average_raster(native_path, out_path, resolution, window=window)
+        print(f"Saved to: {out_path}")
+    return outputs
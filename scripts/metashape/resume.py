@@ -1,13 +1,14 @@
 import Metashape
 from .processing import calibrate_reflectance_and_transform
 
-def resume_proc(doc, multispec_chunk, args):
+def resume_proc(doc, multispec_chunk, args, finish=None):
     """Resume processing after manual steps are completed.
     
     Args:
         doc: Metashape document
         multispec_chunk: Multispectral chunk to process
         args: Script arguments containing processing parameters
+        finish: Optional callable run once processing is done, e.g. to point photos back at network storage
     """
     if not multispec_chunk:
         raise ValueError("Multispectral chunk not found")
@@ -16,5 +17,7 @@ def resume_proc(doc, multispec_chunk, args):
     
     # Execute the processing steps
     calibrate_reflectance_and_transform(multispec_chunk, multispec_sensors, doc, args.sun_sensor)
+    if finish:
+        finish()
     
     print("Processing completed successfully!") 
\ No newline at end of file
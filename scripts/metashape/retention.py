@@ -0,0 +1,192 @@
+import time
+from pathlib import Path
+from .utils import RETENTION_POLICIES
+
+# Chunk attributes holding each kind of intermediate product
+INTERMEDIATE_ITEMS = {
+    'depth_maps': ('depth_maps_sets',),
+    'point_clouds': ('point_clouds',),
+    'surfaces': ('models', 'elevations'),
+    'orthomosaics': ('orthomosaics',),
+}
+
+def project_bytes(project_path):
+    """
+    Size of a project on disk: the .psz archive, or the .psx file and its .files directory.
+
+    Args:
+        project_path: Path of the .psx or .psz project
+
+    Returns:
+        Size in bytes
+    """
+    project_path = Path(project_path)
+    total = project_path.stat().st_size if project_path.is_file() else 0
+    data_dir = project_path.with_suffix('.files')
+    if data_dir.is_dir():
+        total += sum(path.stat().st_size for path in data_dir.rglob('*') if path.is_file())
+    return total
+
+def timed_save(doc, path=None):
+    """
+    Save a document and time the save.
+
+    Args:
+        doc: Metashape document
+        path: Optional new project path
+
+    Returns:
+        Save time in seconds
+    """
+    start = time.perf_counter()
+    if path is None:
+        doc.save()
+    else:
+        doc.save(str(path))
+    return time.perf_counter() - start
+
+def drop_keypoints(chunks):
+    """
+    Remove stored keypoints, which are only needed to add images to an alignment later.
+
+    Args:
+        chunks: Metashape chunks
+
+    Returns:
+        List of descriptions of the removed data
+    """
+    removed = []
+    for chunk in chunks:
+        if chunk.tie_points:
+            chunk.tie_points.removeKeypoints()
+            removed.append(f"keypoints of {chunk.label}")
+    return removed
+
+def drop_intermediates(chunks, items):
+    """
+    Remove intermediate products from chunks.
+
+    Args:
+        chunks: Metashape chunks
+        items: Kinds of products to remove (keys of INTERMEDIATE_ITEMS)
+
+    Returns:
+        List of descriptions of the removed data
+    """
+    removed = []
+    for chunk in chunks:
+        for item in items:
+            for attribute in INTERMEDIATE_ITEMS.get(item, ()):
+                data = list(getattr(chunk, attribute))
+                if data:
+                    chunk.remove(data)
+                    removed.append(f"{len(data)} {attribute} of {chunk.label}")
+    return removed
+
+def compact_project(doc, drop, stage):
+    """
+    Apply a retention step at a stage boundary: save, remove data, save again, and
+    report the bytes freed and the save time before and after.
+
+    Args:
+        doc: Metashape document saved as a project
+        drop: Callable removing data from the document and returning descriptions of it
+        stage: Stage name for the report
+
+    Returns:
+        Dictionary with the removed data, project sizes and save times
+    """
+    save_before = timed_save(doc)
+    bytes_before = project_bytes(doc.path)
+    removed = drop()
+    if not removed:
+        print(f"Retention after {stage}: nothing to remove")
+        return {'stage': stage, 'removed': [], 'bytes_before': bytes_before, 'bytes_after': bytes_before,
+                'save_before_s': save_before, 'save_after_s': save_before}
+
+    save_after = timed_save(doc)
+    bytes_after = project_bytes(doc.path)
+    print(f"Retention after {stage}: removed {', '.join(removed)}")
+    print(f"  Project {bytes_before / 1e9:.2f} GB -> {bytes_after / 1e9:.2f} GB "
+          f"({(bytes_before - bytes_after) / 1e9:.2f} GB freed), save {save_before:.1f}s -> {save_after:.1f}s")
+    return {'stage': stage, 'removed': removed, 'bytes_before': bytes_before, 'bytes_after': bytes_after,
+            'save_before_s': save_before, 'save_after_s': save_after}
+
+def retention_policy(chunk, policy=None):
+    """
+    Resolve the retention policy of a run, falling back to the one recorded in the chunk.
+
+    Args:
+        chunk: Metashape chunk
+        policy: Explicit policy name (key of RETENTION_POLICIES), or None
+
+    Returns:
+        Policy dictionary
+    """
+    if policy is None:
+        policy = chunk.meta['retention'] if 'retention' in chunk.meta else 'keep'
+    if policy not in RETENTION_POLICIES:
+        raise ValueError(f"Unknown retention policy '{policy}', expected one of {', '.join(RETENTION_POLICIES)}")
+    return RETENTION_POLICIES[policy]
+
+def retain_after_alignment(doc, chunks, policy=None):
+    """
+    Drop keypoints after alignment if the retention policy says so.
+
+    Args:
+        doc: Metashape document saved as a project
+        chunks: Aligned chunks
+        policy: Retention policy name (defaults to the one recorded in the first chunk)
+
+    Returns:
+        Report dictionary from compact_project, or None if nothing is dropped at this stage
+    """
+    if not retention_policy(chunks[0], policy)['keypoints']:
+        return None
+    return compact_project(doc, lambda: drop_keypoints(chunks), 'alignment')
+
+def retain_after_export(doc, chunks, policy=None, tile_chunks=()):
+    """
+    Drop intermediate products once the orthomosaics are exported.
+
+    Args:
+        doc: Metashape document saved as a project
+        chunks: Chunks whose products have been exported
+        policy: Retention policy name (defaults to the one recorded in the first chunk)
+        tile_chunks: Tile chunks added to this document by create_tile_chunks
+
+    Returns:
+        Report dictionary from compact_project, or None if nothing is dropped at this stage
+    """
+    items = retention_policy(chunks[0], policy)['intermediates']
+    if not items:
+        return None
+
+    def drop():
+        removed = drop_intermediates(chunks, items)
+        if 'tiles' in items and tile_chunks:
+            doc.remove(list(tile_chunks))
+            removed.append(f"{len(tile_chunks)} tile chunks")
+        return removed
+
+    return compact_project(doc, drop, 'export')
+
+def archive_project(doc, psz_path=None):
+    """
+    Save the project as a single-file .psz archive. The document continues on the
+    archive; the .psx project is left in place.
+
+    Args:
+        doc: Metashape document saved as a project
+        psz_path: Archive path (defaults to the project path with a .psz suffix)
+
+    Returns:
+        Archive path
+    """
+    psx_path = Path(doc.path)
+    psz_path = Path(psz_path) if psz_path else psx_path.with_suffix('.psz')
+    bytes_before = project_bytes(psx_path)
+    save_time = timed_save(doc, psz_path)
+    print(f"Archived project to {psz_path}: {bytes_before / 1e9:.2f} GB -> "
+          f"{project_bytes(psz_path) / 1e9:.2f} GB in {save_time:.1f}s")
+    return psz_path
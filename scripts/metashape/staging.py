@@ -0,0 +1,354 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+INDEX_NAME = "staging_index.json"
+LOCK_NAME = "staging_index.lock"
+LEASE_DIR = "leases"
+COPY_BUFFER = 8 * 1024 * 1024
+
+# Serialises index updates between the staging of the current plot and a prefetch thread;
+# the lock file next to the index serialises them between processes
+_index_lock = threading.Lock()
+
+# Open lease file and use count of each entry leased by this process, keyed by entry name
+_leases = {}
+
+def staging_key(imagery_dir):
+    """
+    Name the cache entry of an imagery directory, e.g. '<plot>_<YYYYMMDD>_<hash>'.
+
+    Args:
+        imagery_dir: Path to <plot>/YYYYMMDD/imagery/
+
+    Returns:
+        Cache entry name
+    """
+    imagery_dir = Path(imagery_dir).resolve()
+    digest = hashlib.blake2b(str(imagery_dir).encode(), digest_size=4).hexdigest()
+    return f"{imagery_dir.parent.parent.name}_{imagery_dir.parent.name}_{digest}"
+
+def _load_index(cache_root):
+    index_path = Path(cache_root) / INDEX_NAME
+    if not index_path.is_file():
+        return {}
+    with open(index_path) as f:
+        return json.load(f)
+
+def _save_index(cache_root, index):
+    index_path = Path(cache_root) / INDEX_NAME
+    tmp_path = index_path.with_suffix('.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f, indent=2)
+    os.replace(tmp_path, index_path)
+
+def _lock_file(f, blocking=True):
+    """Take an exclusive lock on an open file; returns False if it is held elsewhere and blocking is False."""
+    try:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+    except OSError:
+        if blocking:
+            raise
+        return False
+    return True
+
+def _unlock_file(f):
+    if fcntl:
+        fcntl.flock(f, fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+@contextmanager
+def _locked_index(cache_root):
+    """Hold the index lock of a cache, both between threads and between processes."""
+    with _index_lock, open(Path(cache_root) / LOCK_NAME, 'a+') as f:
+        _lock_file(f)
+        try:
+            yield
+        finally:
+            _unlock_file(f)
+
+def _lease_in_use(cache_root, key):
+    """
+    Check whether any live process holds a lease on a cache entry. A lease file whose
+    lock can be taken belongs to a process that exited without releasing it, and is removed.
+    Must be called with the index lock held.
+    """
+    in_use = False
+    for path in (Path(cache_root) / LEASE_DIR).glob(f"{key}.*.lease"):
+        with open(path, 'a+') as f:
+            if not _lock_file(f, blocking=False):
+                in_use = True
+                continue
+            _unlock_file(f)
+        path.unlink()
+    return in_use
+
+def acquire_lease(cache_root, key):
+    """
+    Pin a cache entry so no process evicts it while its imagery is in use. The lease
+    is a locked file, so it is released by the operating system if the process dies.
+    Leases taken more than once by a process are counted.
+
+    Args:
+        cache_root: Staging cache directory
+        key: Cache entry name (see staging_key)
+    """
+    lease_dir = Path(cache_root) / LEASE_DIR
+    lease_dir.mkdir(parents=True, exist_ok=True)
+    with _locked_index(cache_root):
+        if key in _leases:
+            _leases[key][1] += 1
+            return
+        f = open(lease_dir / f"{key}.{os.getpid()}.lease", 'a+')
+        _lock_file(f)
+        _leases[key] = [f, 1]
+
+def release_lease(cache_root, key):
+    """
+    Release the lease of this process on a cache entry (see acquire_lease).
+
+    Args:
+        cache_root: Staging cache directory
+        key: Cache entry name
+    """
+    with _locked_index(cache_root):
+        if key not in _leases:
+            return
+        _leases[key][1] -= 1
+        if _leases[key][1] > 0:
+            return
+        f = _leases.pop(key)[0]
+        path = f.name
+        _unlock_file(f)
+        f.close()
+        os.remove(path)
+
+def _is_staged(src_stat, dst):
+    if not os.path.isfile(dst):
+        return False
+    dst_stat = os.stat(dst)
+    return dst_stat.st_size == src_stat.st_size and int(dst_stat.st_mtime) == int(src_stat.st_mtime)
+
+def _file_digest(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(COPY_BUFFER), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def copy_verified(src, dst, retries=2):
+    """
+    Copy a file, hashing the source while it is read and verifying the copy.
+    Files already staged with the same size and modification time are skipped.
+
+    Args:
+        src: Source file
+        dst: Destination file
+        retries: Number of retries after a checksum mismatch
+
+    Returns:
+        Number of bytes copied (0 if the file was already staged)
+    """
+    src_stat = os.stat(src)
+    if _is_staged(src_stat, dst):
+        return 0
+
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    tmp = f"{dst}.part"
+    for attempt in range(retries + 1):
+        digest = hashlib.blake2b(digest_size=16)
+        with open(src, 'rb') as fin, open(tmp, 'wb') as fout:
+            for block in iter(lambda: fin.read(COPY_BUFFER), b''):
+                digest.update(block)
+                fout.write(block)
+        if _file_digest(tmp) == digest.hexdigest():
+            os.utime(tmp, (src_stat.st_atime, src_stat.st_mtime))
+            os.replace(tmp, dst)
+            return src_stat.st_size
+        print(f"Warning: checksum mismatch copying {src} (attempt {attempt + 1})")
+    os.remove(tmp)
+    raise IOError(f"Could not copy {src} to {dst} without corruption")
+
+def evict_lru(cache_root, max_bytes, needed_bytes=0, keep=()):
+    """
+    Remove least recently used cache entries until the needed space fits under the cap.
+    Entries leased by any process (see acquire_lease) are never evicted.
+
+    Args:
+        cache_root: Staging cache directory
+        max_bytes: Size cap of the cache
+        needed_bytes: Bytes about to be added
+        keep: Entry names that must not be evicted
+
+    Returns:
+        List of evicted entry names
+    """
+    with _locked_index(cache_root):
+        index = _load_index(cache_root)
+        used = sum(entry['bytes'] for entry in index.values())
+        evicted = []
+        for key in sorted(index, key=lambda k: index[k]['last_used']):
+            if used + needed_bytes <= max_bytes:
+                break
+            if key in keep or _lease_in_use(cache_root, key):
+                continue
+            shutil.rmtree(Path(cache_root) / key, ignore_errors=True)
+            used -= index[key]['bytes']
+            evicted.append(key)
+            del index[key]
+        _save_index(cache_root, index)
+
+    if evicted:
+        print(f"Evicted {len(evicted)} staged plots: {', '.join(evicted)}")
+    if used + needed_bytes > max_bytes:
+        print(f"Warning: staging cache will exceed its cap ({(used + needed_bytes) / 1e9:.1f} GB)")
+    return evicted
+
+def stage_imagery(imagery_dir, cache_root, max_bytes, subdirs=("rgb/level0_raw", "multispec/level0_raw"), workers=8):
+    """
+    Copy a plot's raw imagery to local scratch with parallel, checksummed copies.
+
+    The staged tree mirrors the source, so pointing the image scan at the staged
+    directories rewrites every path passed to Metashape. The entry is leased until
+    release_imagery is called (or the process exits), so concurrent runs and
+    prefetches do not evict it while Metashape reads from it.
+
+    Args:
+        imagery_dir: Path to <plot>/YYYYMMDD/imagery/ on network storage
+        cache_root: Local staging cache directory
+        max_bytes: Size cap of the cache; least recently used plots are evicted
+        subdirs: Sub-directories of imagery_dir to stage
+        workers: Number of parallel copy threads
+
+    Returns:
+        Path of the staged imagery directory
+    """
+    imagery_dir = Path(imagery_dir).resolve()
+    cache_root = Path(cache_root)
+    cache_root.mkdir(parents=True, exist_ok=True)
+    key = staging_key(imagery_dir)
+    staged_dir = cache_root / key / "imagery"
+
+    acquire_lease(cache_root, key)
+
+    files = []
+    for subdir in subdirs:
+        for root, _, names in os.walk(imagery_dir / subdir):
+            for name in names:
+                src = os.path.join(root, name)
+                files.append((src, str(staged_dir / os.path.relpath(src, imagery_dir))))
+    total_bytes = 0
+    missing_bytes = 0
+    for src, dst in files:
+        src_stat = os.stat(src)
+        total_bytes += src_stat.st_size
+        if not _is_staged(src_stat, dst):
+            missing_bytes += src_stat.st_size
+
+    # Files of this entry that are already staged are counted in the index, only the rest is added
+    evict_lru(cache_root, max_bytes, needed_bytes=missing_bytes, keep=(key,))
+
+    print(f"Staging {len(files)} files ({total_bytes / 1e9:.1f} GB) from {imagery_dir} to {staged_dir}...")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        copied = sum(executor.map(lambda job: copy_verified(*job), files))
+    elapsed = time.perf_counter() - start
+    print(f"Staged {copied / 1e9:.1f} GB in {elapsed:.1f}s ({total_bytes - copied} bytes already cached)")
+
+    with _locked_index(cache_root):
+        index = _load_index(cache_root)
+        index[key] = {'source': str(imagery_dir), 'bytes': total_bytes, 'last_used': time.time()}
+        _save_index(cache_root, index)
+
+    return staged_dir
+
+def release_imagery(imagery_dir, cache_root):
+    """
+    Release the lease taken by stage_imagery once the run no longer reads the staged copy.
+
+    Args:
+        imagery_dir: Path to <plot>/YYYYMMDD/imagery/ on network storage
+        cache_root: Local staging cache directory
+    """
+    release_lease(cache_root, staging_key(imagery_dir))
+
+def _prefetch(imagery_dir, cache_root, max_bytes, workers):
+    staged_dir = stage_imagery(imagery_dir, cache_root, max_bytes, workers=workers)
+    # The run that processes the plot takes its own lease when it stages it
+    release_imagery(imagery_dir, cache_root)
+    return staged_dir
+
+def prefetch_imagery(imagery_dir, cache_root, max_bytes, workers=4):
+    """
+    Stage the next queued plot in a background thread while the current one is processed.
+    The plot is leased only while it is copied.
+
+    Args:
+        imagery_dir: Path to the next plot's <plot>/YYYYMMDD/imagery/
+        cache_root: Local staging cache directory
+        max_bytes: Size cap of the cache
+        workers: Number of parallel copy threads (fewer than the foreground stage)
+
+    Returns:
+        Future resolving to the staged imagery directory
+    """
+    executor = ThreadPoolExecutor(max_workers=1)
+    future = executor.submit(_prefetch, imagery_dir, cache_root, max_bytes, workers)
+    executor.shutdown(wait=False)
+    print(f"Prefetching {imagery_dir} in the background...")
+    return future
+
+def repoint_photos(chunk, from_dir, to_dir):
+    """
+    Rewrite camera photo paths from one imagery root to another, e.g. back from
+    local scratch to network storage so the project stays valid after eviction.
+
+    Args:
+        chunk: Metashape chunk
+        from_dir: Imagery root currently referenced by the photos
+        to_dir: Imagery root to reference instead
+
+    Returns:
+        Number of photos repointed
+    """
+    from_dir = os.path.normpath(str(from_dir))
+    to_dir = os.path.normpath(str(to_dir))
+    repointed = 0
+    for camera in chunk.cameras:
+        if not camera.photo:
+            continue
+        path = os.path.normpath(camera.photo.path)
+        if path.startswith(from_dir + os.sep):
+            camera.photo.path = to_dir + path[len(from_dir):]
+            repointed += 1
+    return repointed
+
+def repoint_document(doc, from_dir, to_dir):
+    """
+    Rewrite photo paths in every chunk of a document (see repoint_photos).
+
+    Args:
+        doc: Metashape document
+        from_dir: Imagery root currently referenced by the photos
+        to_dir: Imagery root to reference instead
+    """
+    repointed = sum(repoint_photos(chunk, from_dir, to_dir) for chunk in doc.chunks)
+    print(f"Repointed {repointed} photos from {from_dir} to {to_dir}")
@@ -0,0 +1,207 @@
+import math
+from collections import defaultdict
+import numpy as np
+import Metashape
+from .incremental import geocentric_position
+
+def ground_control_markers(chunk):
+    """
+    Get the markers with an enabled reference location (ground control from load_markers).
+
+    Args:
+        chunk: Metashape chunk
+
+    Returns:
+        List of markers
+    """
+    return [marker for marker in chunk.markers if marker.reference.location and marker.reference.enabled]
+
+def footprint_radius(camera, height):
+    """
+    Radius of the ground footprint of a nadir camera, from the half image diagonal.
+
+    Args:
+        camera: Metashape camera
+        height: Height of the camera above the ground point
+
+    Returns:
+        Footprint radius in the units of height
+    """
+    sensor = camera.sensor
+    focal = sensor.calibration.f if sensor.calibration and sensor.calibration.f else None
+    if not focal and sensor.focal_length and sensor.pixel_width:
+        focal = sensor.focal_length / sensor.pixel_width
+    if not focal:
+        return 0.0
+    return abs(height) * math.hypot(sensor.width, sensor.height) / 2 / focal
+
+def sees_point(chunk, camera, point):
+    """
+    Check whether an aligned camera images a geocentric point inside its frame.
+
+    Args:
+        chunk: Metashape chunk
+        camera: Aligned Metashape camera
+        point: Geocentric Metashape.Vector
+
+    Returns:
+        True if the point projects inside the image
+    """
+    local = chunk.transform.matrix.inv().mulp(point)
+    projection = camera.project(local)
+    if projection is None:
+        return False
+    # Reject points behind the camera, which also project
+    if (camera.transform.inv().mulp(local)).z <= 0:
+        return False
+    return 0 <= projection.x < camera.sensor.width and 0 <= projection.y < camera.sensor.height
+
+def cameras_seeing_gcps(chunk, gcps, cameras, margin=1.2):
+    """
+    Find the cameras whose footprint covers each ground control point.
+    Camera positions are bucketed in a horizontal grid of footprint size, so each
+    GCP is only tested against cameras in its own and neighbouring cells. Aligned
+    cameras are confirmed by projecting the GCP; unaligned cameras are treated as
+    nadir cameras at their reference positions.
+
+    Args:
+        chunk: Metashape chunk
+        gcps: Ground control markers
+        cameras: Cameras to consider
+        margin: Factor applied to footprint radii of unaligned cameras
+
+    Returns:
+        Dictionary of marker key -> list of cameras
+    """
+    gcp_points = {gcp.key: chunk.crs.unproject(gcp.reference.location) for gcp in gcps}
+    origin = next(iter(gcp_points.values()))
+    frame = chunk.crs.localframe(origin)
+
+    def local(point):
+        p = frame.mulp(point)
+        return np.array([p.x, p.y, p.z])
+
+    gcp_local = {key: local(point) for key, point in gcp_points.items()}
+    ground = float(np.median([p[2] for p in gcp_local.values()]))
+
+    positioned = []
+    for camera in cameras:
+        position = geocentric_position(chunk, camera)
+        if position is None:
+            continue
+        position = local(position)
+        radius = footprint_radius(camera, position[2] - ground) * margin
+        if radius > 0:
+            positioned.append((camera, position, radius))
+    if not positioned:
+        return {key: [] for key in gcp_points}
+
+    cell = max(radius for _, _, radius in positioned)
+    grid = defaultdict(list)
+    for item in positioned:
+        grid[(int(item[1][0] // cell), int(item[1][1] // cell))].append(item)
+
+    seen_by = {}
+    for key, point in gcp_local.items():
+        cx, cy = int(point[0] // cell), int(point[1] // cell)
+        seen = []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for camera, position, radius in grid.get((cx + dx, cy + dy), ()):
+                    if np.hypot(*(position[:2] - point[:2])) > radius:
+                        continue
+                    if camera.transform and not sees_point(chunk, camera, gcp_points[key]):
+                        continue
+                    seen.append(camera)
+        seen_by[key] = seen
+    return seen_by
+
+def detect_gcp_targets(chunk, target_type=Metashape.CircularTarget12bit, tolerance=50, label_prefix="DJI_",
+                       margin=1.2, max_distance=3.0, min_overlap=0.8):
+    """
+    Detect coded targets only on the images whose footprint covers a ground control
+    point, and pin the detections onto the ground control markers.
+
+    Each detected target is assigned to the GCP it lies closest to (by its estimated
+    position when the cameras are aligned, otherwise to the one GCP whose footprint cameras
+    include most of its cameras); its projections are copied to the GCP marker and the detected marker is removed.
+
+    Args:
+        chunk: Metashape chunk with ground control markers and approximate camera poses
+        target_type: Metashape.TargetType to detect
+        tolerance: Detector tolerance (0-100)
+        label_prefix: Only search cameras whose label starts with this prefix (RGB images)
+        margin: Factor applied to footprint radii of unaligned cameras
+        max_distance: Maximum distance in metres between a detected target and its GCP
+                      (aligned cameras only; None for no limit). Targets further from every
+                      GCP, e.g. unsurveyed targets, are kept as separate markers
+        min_overlap: Fraction of a target's cameras that must cover its GCP to pin it
+                     without aligned cameras. Targets covered as much by another GCP, or
+                     seen mostly from cameras covering no GCP, are kept as separate markers
+
+    Returns:
+        Dictionary of GCP label -> number of projections
+    """
+    gcps = ground_control_markers(chunk)
+    if not gcps:
+        print("No ground control markers found. Skipping target detection.")
+        return {}
+    if not chunk.crs:
+        print("Chunk has no coordinate system. Skipping target detection.")
+        return {}
+
+    cameras = [c for c in chunk.cameras if c.enabled and c.label.startswith(label_prefix)]
+    seen_by = cameras_seeing_gcps(chunk, gcps, cameras, margin=margin)
+    candidates = {camera.key: camera for seen in seen_by.values() for camera in seen}
+    if not candidates:
+        print("No cameras cover the ground control points. Skipping target detection.")
+        return {}
+    reduction = 1 - len(candidates) / len(cameras)
+    print(f"Detecting targets on {len(candidates)} of {len(cameras)} images ({reduction:.1%} less detection work)")
+
+    existing = {marker.key for marker in chunk.markers}
+    chunk.detectMarkers(target_type=target_type, tolerance=tolerance, cameras=list(candidates.values()))
+    detected = [marker for marker in chunk.markers if marker.key not in existing]
+    print(f"Detected {len(detected)} targets")
+
+    gcp_by_key = {gcp.key: gcp for gcp in gcps}
+    cameras_by_gcp = {key: {camera.key for camera in seen} for key, seen in seen_by.items()}
+    gcp_points = {gcp.key: chunk.crs.unproject(gcp.reference.location) for gcp in gcps}
+    assigned = []
+    for marker in detected:
+        marker_cameras = {camera.key for camera in marker.projections.keys()}
+        target = None
+        if marker.position is not None and chunk.transform.matrix:
+            position = chunk.transform.matrix.mulp(marker.position)
+            distances = {key: (position - point).norm() for key, point in gcp_points.items()}
+            key = min(distances, key=distances.get)
+            if max_distance is None or distances[key] <= max_distance:
+                target = key
+        else:
+            # Footprints are approximate before alignment: only pin targets that unambiguously
+            # lie within one GCP's footprint, e.g. not unsurveyed targets next to a GCP
+            overlaps = sorted(((len(marker_cameras & cams), key) for key, cams in cameras_by_gcp.items()),
+                              reverse=True)
+            best, key = overlaps[0]
+            runner_up = overlaps[1][0] if len(overlaps) > 1 else 0
+            if marker_cameras and best >= min_overlap * len(marker_cameras) and best > runner_up:
+                target = key
+
+        if target is None:
+            continue
+        gcp = gcp_by_key[target]
+        for camera in marker.projections.keys():
+            if gcp.projections[camera] is None:
+                gcp.projections[camera] = marker.projections[camera]
+        assigned.append(marker)
+
+    if assigned:
+        chunk.remove(assigned)
+    unassigned = len(detected) - len(assigned)
+    if unassigned:
+        print(f"{unassigned} detected targets could not be matched to a GCP and were kept")
+
+    counts = {gcp.label: len(gcp.projections.keys()) for gcp in gcps}
+    for label, count in counts.items():
+        print(f"GCP {label}: {count} projections")
+    return counts
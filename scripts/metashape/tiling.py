@@ -0,0 +1,287 @@
+import math
+import os
+from pathlib import Path
+from xml.sax.saxutils import escape
+import numpy as np
+import Metashape
+from .processing import align_images, build_surface
+from .workers import save_chunk_projects, open_chunk_project, run_in_workers
+from .image_utils import read_tiff_size, read_geotiff_origin
+from .utils import DEM_RESOLUTION
+
+def get_camera_positions(chunk):
+    """
+    Get one position per capture in the chunk CRS.
+    Aligned cameras use their estimated centre, unaligned cameras fall back to
+    their reference location. Multispectral band cameras are represented by
+    their master camera.
+
+    Args:
+        chunk: Metashape chunk
+
+    Returns:
+        Tuple of (array of master camera keys, Nx3 array of positions)
+    """
+    keys = []
+    positions = []
+    for camera in chunk.cameras:
+        if camera.master != camera:
+            continue
+        if camera.group and camera.group.label == 'Calibration images':
+            continue
+
+        if camera.transform and chunk.transform.matrix:
+            pos = chunk.transform.matrix.mulp(camera.center)
+            if chunk.crs:
+                pos = chunk.crs.project(pos)
+        elif camera.reference.location:
+            pos = camera.reference.location
+        else:
+            continue
+
+        keys.append(camera.key)
+        positions.append((pos.x, pos.y, pos.z))
+
+    return np.array(keys, dtype=np.int64), np.array(positions, dtype=np.float64).reshape(-1, 3)
+
+def compute_camera_tiles(chunk, max_cameras=1500, overlap=0.2):
+    """
+    Partition the chunk into overlapping tiles using a regular grid over camera positions.
+
+    Each tile has a core extent (the grid cell, which tiles the survey without gaps)
+    used to clip its orthomosaic, and a padded extent used to select its cameras so
+    neighbouring tiles share images along their seams.
+
+    Args:
+        chunk: Metashape chunk, aligned or holding raw captures with reference locations
+        max_cameras: Target number of captures per tile before overlap is added
+        overlap: Padding on each side of a tile as a fraction of the tile size
+
+    Returns:
+        List of tile dictionaries with 'label', 'bounds' (x_min, y_min, x_max, y_max)
+        and 'camera_keys' (set of master camera keys)
+    """
+    keys, positions = get_camera_positions(chunk)
+    if len(keys) == 0:
+        print("No camera positions available. Cannot compute tiles.")
+        return []
+
+    xy = positions[:, :2]
+    x_min, y_min = xy.min(axis=0)
+    x_max, y_max = xy.max(axis=0)
+    width = max(x_max - x_min, 1e-9)
+    height = max(y_max - y_min, 1e-9)
+
+    # Choose a grid shape that follows the aspect ratio of the survey
+    n_tiles = max(1, math.ceil(len(keys) / max_cameras))
+    cols = max(1, min(n_tiles, round(math.sqrt(n_tiles * width / height))))
+    rows = max(1, math.ceil(n_tiles / cols))
+    tile_w = width / cols
+    tile_h = height / rows
+    pad_x = tile_w * overlap
+    pad_y = tile_h * overlap
+
+    print(f"Partitioning {len(keys)} captures into a {rows}x{cols} grid "
+          f"({tile_w:.2f} x {tile_h:.2f} per tile, {overlap:.0%} overlap)")
+
+    tiles = []
+    for row in range(rows):
+        for col in range(cols):
+            core_x_min = x_min + col * tile_w
+            core_y_min = y_min + row * tile_h
+            core_x_max = core_x_min + tile_w
+            core_y_max = core_y_min + tile_h
+
+            in_tile = ((xy[:, 0] >= core_x_min - pad_x) & (xy[:, 0] <= core_x_max + pad_x) &
+                       (xy[:, 1] >= core_y_min - pad_y) & (xy[:, 1] <= core_y_max + pad_y))
+            if not in_tile.any():
+                continue
+
+            # Outer tiles extend past the outermost camera centres to keep their footprints
+            bounds = (core_x_min - (tile_w if col == 0 else 0),
+                      core_y_min - (tile_h if row == 0 else 0),
+                      core_x_max + (tile_w if col == cols - 1 else 0),
+                      core_y_max + (tile_h if row == rows - 1 else 0))
+
+            tiles.append({
+                'label': f"tile_{row}_{col}",
+                'bounds': bounds,
+                'camera_keys': set(keys[in_tile].tolist()),
+            })
+
+    for tile in tiles:
+        print(f"{tile['label']}: {len(tile['camera_keys'])} captures")
+
+    return tiles
+
+def create_tile_chunks(doc, chunk, tiles):
+    """
+    Create one chunk per tile holding only that tile's captures.
+    Calibration images are kept in every tile.
+
+    Args:
+        doc: Metashape document
+        chunk: Source Metashape chunk
+        tiles: Tiles from compute_camera_tiles
+
+    Returns:
+        List of (tile, tile_chunk) tuples
+    """
+    tile_chunks = []
+    for tile in tiles:
+        cameras = [cam for cam in chunk.cameras
+                   if cam.master.key in tile['camera_keys']
+                   or (cam.group and cam.group.label == 'Calibration images')]
+        # Keypoints are not needed to process a tile and would be duplicated in every copy
+        tile_chunk = chunk.copy(cameras=cameras, keypoints=False)
+        tile_chunk.label = f"{chunk.label}_{tile['label']}"
+        tile_chunks.append((tile, tile_chunk))
+        print(f"Created chunk {tile_chunk.label} with {len(tile_chunk.cameras)} cameras")
+
+    doc.save()
+    return tile_chunks
+
+def process_tile(chunk, bounds, smooth_strength='low', align=False, surface='model', dem_resolution=DEM_RESOLUTION,
+                 face_count='medium'):
+    """
+    Build the surface and an orthomosaic clipped to the tile core extent.
+
+    Args:
+        chunk: Tile chunk
+        bounds: (x_min, y_min, x_max, y_max) core extent in chunk CRS units
+        smooth_strength: Smoothing strength passed to build_model
+        align: Whether to align the tile first (tiles created from raw captures)
+        surface: Orthorectification surface, 'model' or 'dem'
+        dem_resolution: DEM resolution in metres (surface 'dem')
+        face_count: Model face count ('low', 'medium', or 'high'; surface 'model')
+    """
+    if align:
+        align_images(chunk)
+
+    surface_data = build_surface(chunk, surface=surface, smooth_strength=smooth_strength,
+                                 dem_resolution=dem_resolution, face_count=face_count)
+
+    projection = Metashape.OrthoProjection()
+    projection.crs = chunk.crs
+    region = Metashape.BBox()
+    region.min = Metashape.Vector([bounds[0], bounds[1]])
+    region.max = Metashape.Vector([bounds[2], bounds[3]])
+
+    print(f"Building orthomosaic for {chunk.label}...")
+    chunk.buildOrthomosaic(surface_data=surface_data, refine_seamlines=True,
+                           projection=projection, region=region)
+
+def _process_tile_project(project_path, bounds, smooth_strength, align, surface, dem_resolution, face_count):
+    """Worker entry point: open a single-tile project, process it and save it."""
+    doc, chunk = open_chunk_project(project_path, read_only=False)
+    process_tile(chunk, bounds, smooth_strength=smooth_strength, align=align, surface=surface,
+                 dem_resolution=dem_resolution, face_count=face_count)
+    doc.save()
+    return str(project_path)
+
+def process_tiles(doc, tile_chunks, smooth_strength='low', align=False, workers=1, work_dir=None,
+                  surface='model', dem_resolution=DEM_RESOLUTION, face_count='medium'):
+    """
+    Process tile chunks in this process or in parallel worker processes.
+
+    With more than one worker, each tile chunk is saved as its own project in
+    work_dir, processed by a worker process and re-opened for export.
+
+    Args:
+        doc: Metashape document holding the tile chunks
+        tile_chunks: List of (tile, tile_chunk) tuples from create_tile_chunks
+        smooth_strength: Smoothing strength passed to build_model
+        align: Whether to align each tile (tiles created from raw captures)
+        workers: Number of parallel worker processes
+        work_dir: Directory for per-tile projects (defaults to '<project>_tiles')
+        surface: Orthorectification surface, 'model' or 'dem'
+        dem_resolution: DEM resolution in metres (surface 'dem')
+        face_count: Model face count (surface 'model')
+
+    Returns:
+        List of (tile, chunk) tuples with orthomosaics built
+    """
+    if workers <= 1:
+        for tile, tile_chunk in tile_chunks:
+            process_tile(tile_chunk, tile['bounds'], smooth_strength=smooth_strength, align=align,
+                         surface=surface, dem_resolution=dem_resolution, face_count=face_count)
+            doc.save()
+        return tile_chunks
+
+    if work_dir is None:
+        work_dir = Path(doc.path).with_suffix('').as_posix() + "_tiles"
+
+    project_paths = save_chunk_projects(doc, [tile_chunk for _, tile_chunk in tile_chunks], work_dir)
+    jobs = [(path, tile['bounds'], smooth_strength, align, surface, dem_resolution, face_count)
+            for (tile, _), path in zip(tile_chunks, project_paths)]
+
+    print(f"Processing {len(jobs)} tiles with {workers} worker processes...")
+    for path in run_in_workers(_process_tile_project, jobs, workers):
+        print(f"Finished tile project {path}")
+
+    return [(tile, open_chunk_project(path)[1]) for (tile, _), path in zip(tile_chunks, project_paths)]
+
+def write_mosaic_vrt(tile_rasters, vrt_path, crs_wkt, resolution, band_count, data_type='Byte', nodata=None):
+    """
+    Stitch exported tile rasters into a single GDAL virtual mosaic.
+
+    Tiles are clipped to non-overlapping core extents, so the mosaic is a plain
+    placement of each tile on a common north-up grid.
+
+    Args:
+        tile_rasters: List of (path, (x_min, y_min, x_max, y_max)) tuples
+        vrt_path: Output .vrt path
+        crs_wkt: WKT of the tile coordinate system
+        resolution: Pixel size shared by all tiles
+        band_count: Number of bands in each tile
+        data_type: GDAL data type name ('Byte' for RGB, 'Float32' for reflectance)
+        nodata: Optional nodata value
+
+    Returns:
+        Path of the written VRT
+    """
+    vrt_path = Path(vrt_path)
+    bounds = np.array([b for _, b in tile_rasters], dtype=np.float64)
+    x_min, y_min = bounds[:, 0].min(), bounds[:, 1].min()
+    x_max, y_max = bounds[:, 2].max(), bounds[:, 3].max()
+
+    # Place each tile by its actual size and origin, as Metashape rounds export extents to
+    # whole pixels; the requested bounds are only used if the GeoTIFF header cannot be read
+    placements = []
+    for path, (t_x_min, t_y_min, t_x_max, t_y_max) in tile_rasters:
+        size = read_tiff_size(path)
+        origin = read_geotiff_origin(path)
+        if size is None:
+            size = (int(round((t_x_max - t_x_min) / resolution)), int(round((t_y_max - t_y_min) / resolution)))
+        if origin is None:
+            origin = (t_x_min, t_y_max)
+        x_off = int(round((origin[0] - x_min) / resolution))
+        y_off = int(round((y_max - origin[1]) / resolution))
+        placements.append((path, x_off, y_off, size[0], size[1]))
+
+    width = int(round((x_max - x_min) / resolution))
+    height = int(round((y_max - y_min) / resolution))
+
+    lines = [f'<VRTDataset rasterXSize="{width}" rasterYSize="{height}">',
+             f'  <SRS>{escape(crs_wkt)}</SRS>',
+             f'  <GeoTransform>{x_min!r}, {resolution!r}, 0.0, {y_max!r}, 0.0, {-resolution!r}</GeoTransform>']
+    for band in range(1, band_count + 1):
+        lines.append(f'  <VRTRasterBand dataType="{data_type}" band="{band}">')
+        if nodata is not None:
+            lines.append(f'    <NoDataValue>{nodata}</NoDataValue>')
+        for path, x_off, y_off, x_size, y_size in placements:
+            rel_path = os.path.relpath(path, vrt_path.parent)
+            lines += ['    <SimpleSource>',
+                      f'      <SourceFilename relativeToVRT="1">{escape(rel_path)}</SourceFilename>',
+                      f'      <SourceBand>{band}</SourceBand>',
+                      f'      <SrcRect xOff="0" yOff="0" xSize="{x_size}" ySize="{y_size}"/>',
+                      f'      <DstRect xOff="{x_off}" yOff="{y_off}" xSize="{x_size}" ySize="{y_size}"/>',
+                      '    </SimpleSource>']
+        lines.append('  </VRTRasterBand>')
+    lines.append('</VRTDataset>')
+
+    vrt_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(vrt_path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    print(f"Stitched {len(tile_rasters)} tiles into: {vrt_path}")
+    return vrt_path
@@ -0,0 +1,164 @@
+import datetime
+import numpy as np
+import Metashape
+
+def camera_time(camera):
+    """
+    Get the capture time of a camera from its EXIF metadata, including sub-seconds if recorded.
+
+    Args:
+        camera: Metashape camera
+
+    Returns:
+        Tuple of (POSIX timestamp, whether sub-seconds were recorded), or (None, False)
+    """
+    meta = camera.photo.meta if camera.photo else None
+    if not meta or 'Exif/DateTimeOriginal' not in meta:
+        return None, False
+    try:
+        dt = datetime.datetime.strptime(meta['Exif/DateTimeOriginal'], "%Y:%m:%d %H:%M:%S")
+    except ValueError:
+        return None, False
+    timestamp = dt.replace(tzinfo=datetime.timezone.utc).timestamp()
+    subsec = meta['Exif/SubSecTimeOriginal'] if 'Exif/SubSecTimeOriginal' in meta else None
+    if subsec and subsec.strip().isdigit():
+        digits = subsec.strip()
+        return timestamp + int(digits) / 10 ** len(digits), True
+    return timestamp, False
+
+def _camera_track(chunk, cameras):
+    """Collect (times, geocentric positions, sub-second flags) of cameras with a time and a reference location."""
+    times, positions, subsec, kept = [], [], [], []
+    for camera in cameras:
+        timestamp, has_subsec = camera_time(camera)
+        if timestamp is None or not camera.reference.location:
+            continue
+        position = chunk.crs.unproject(camera.reference.location)
+        times.append(timestamp)
+        positions.append((position.x, position.y, position.z))
+        subsec.append(has_subsec)
+        kept.append(camera)
+    return np.array(times), np.array(positions).reshape(-1, 3), np.array(subsec, dtype=bool), kept
+
+def interpolate_track(track_times, track_positions, times):
+    """
+    Interpolate positions along a time-sorted trajectory, one np.interp per axis.
+
+    Args:
+        track_times: Sorted trajectory times, shape (n,)
+        track_positions: Trajectory positions, shape (n, 3)
+        times: Query times, shape (m,)
+
+    Returns:
+        Interpolated positions, shape (m, 3)
+    """
+    return np.column_stack([np.interp(times, track_times, track_positions[:, axis]) for axis in range(3)])
+
+def estimate_clock_offset(track_times, track_positions, times, positions, max_offset=60.0, step=0.1):
+    """
+    Estimate the clock offset of a second camera against a trajectory by minimising the
+    median distance between its own (consumer GPS) positions and the trajectory positions
+    interpolated at its shifted capture times. Whole hours (time zone settings) are removed
+    first, then offsets within +-max_offset seconds are searched on a grid.
+
+    Args:
+        track_times: Sorted trajectory times
+        track_positions: Trajectory positions, shape (n, 3)
+        times: Capture times of the second camera
+        positions: Positions recorded by the second camera, shape (m, 3)
+        max_offset: Search range in seconds around the whole-hour offset
+        step: Search step in seconds
+
+    Returns:
+        Tuple of (offset in seconds to subtract from the second camera's times, median distance in metres)
+    """
+    hour_offset = round((np.median(times) - np.median(track_times)) / 3600) * 3600
+    candidates = hour_offset + np.arange(-max_offset, max_offset + step / 2, step)
+
+    best_offset, best_distance = hour_offset, np.inf
+    for offset in candidates:
+        shifted = times - offset
+        inside = (shifted >= track_times[0]) & (shifted <= track_times[-1])
+        if inside.sum() < max(3, 0.5 * len(times)):
+            continue
+        predicted = interpolate_track(track_times, track_positions, shifted[inside])
+        distance = np.median(np.linalg.norm(predicted - positions[inside], axis=1))
+        if distance < best_distance:
+            best_offset, best_distance = offset, distance
+    return float(best_offset), float(best_distance)
+
+def refine_multispec_geotags(chunk, rgb_prefix="DJI_", multispec_prefix="IMG_", max_offset=60.0, timing_error=None,
+                             max_distance=30.0):
+    """
+    Replace the consumer GPS positions of multispectral captures with positions
+    interpolated from the time-sorted RGB (RTK) trajectory, after estimating the clock
+    offset between the cameras. Refined positions and accuracies are written to the
+    camera references before alignment. The lever arm between the two cameras is not modelled.
+
+    Args:
+        chunk: Metashape chunk containing both RGB and multispectral cameras
+        rgb_prefix: Label prefix of RGB cameras
+        multispec_prefix: Label prefix of multispectral cameras
+        max_offset: Clock offset search range in seconds around the whole-hour offset
+        timing_error: Capture time uncertainty in seconds (default: 0.05 with sub-second
+                      timestamps on both cameras, otherwise 0.5)
+        max_distance: Largest median distance in metres between the consumer GPS positions and
+                      the shifted RGB trajectory for the offset to be trusted; beyond it (or if
+                      no offset overlaps the trajectory) the GPS positions are kept
+
+    Returns:
+        Number of multispectral cameras refined
+    """
+    print("Refining multispectral geotags from the RGB trajectory...")
+    if not chunk.crs:
+        print("Chunk has no coordinate system. Skipping geotag refinement.")
+        return 0
+    rgb_cameras = [c for c in chunk.cameras if c.enabled and c.label.startswith(rgb_prefix)]
+    ms_cameras = [c for c in chunk.cameras
+                  if c.enabled and c.label.startswith(multispec_prefix) and c.label == c.master.label]
+
+    track_times, track_positions, rgb_subsec, rgb_kept = _camera_track(chunk, rgb_cameras)
+    times, positions, ms_subsec, ms_kept = _camera_track(chunk, ms_cameras)
+    if len(track_times) < 2 or len(times) == 0:
+        print("Not enough timed RGB or multispectral cameras with positions. Skipping geotag refinement.")
+        return 0
+
+    order = np.argsort(track_times, kind='stable')
+    track_times, track_positions = track_times[order], track_positions[order]
+    rgb_accuracy = []
+    for i in order:
+        acc = rgb_kept[i].reference.location_accuracy or chunk.camera_location_accuracy
+        rgb_accuracy.append((acc.x, acc.y, acc.z))
+    rgb_accuracy = np.array(rgb_accuracy)
+
+    offset, distance = estimate_clock_offset(track_times, track_positions, times, positions, max_offset=max_offset)
+    if not np.isfinite(distance):
+        print(f"No clock offset within +-{max_offset:.0f} s puts the multispectral captures on the RGB trajectory. "
+              "Skipping geotag refinement, keeping the GPS positions.")
+        return 0
+    print(f"Estimated multispectral clock offset: {offset:.1f} s (median distance to RGB track {distance:.2f} m)")
+    if distance > max_distance:
+        print(f"Median distance exceeds {max_distance:.0f} m, the clock offset is unreliable "
+              "(different flights or a wrong clock). Skipping geotag refinement, keeping the GPS positions.")
+        return 0
+
+    if timing_error is None:
+        timing_error = 0.05 if rgb_subsec.all() and ms_subsec.all() else 0.5
+
+    shifted = times - offset
+    inside = (shifted >= track_times[0]) & (shifted <= track_times[-1])
+    refined = interpolate_track(track_times, track_positions, shifted[inside])
+    # Accuracy: interpolated RGB accuracy plus the distance flown within the timing uncertainty
+    speed = np.linalg.norm(np.diff(track_positions, axis=0), axis=1) / np.maximum(np.diff(track_times), 1e-3)
+    speed_at = np.interp(shifted[inside], track_times[1:], speed)
+    accuracy = np.column_stack([np.interp(shifted[inside], track_times, rgb_accuracy[:, axis]) for axis in range(3)])
+    accuracy += (speed_at * timing_error)[:, None]
+
+    refined_cameras = [camera for camera, ok in zip(ms_kept, inside) if ok]
+    for camera, position, acc in zip(refined_cameras, refined, accuracy):
+        camera.reference.location = chunk.crs.project(Metashape.Vector([float(v) for v in position]))
+        camera.reference.location_accuracy = Metashape.Vector([float(v) for v in acc])
+
+    print(f"Refined {int(inside.sum())} of {len(ms_kept)} multispectral geotags "
+          f"({int((~inside).sum())} outside the RGB trajectory kept their GPS positions)")
+    return int(inside.sum())
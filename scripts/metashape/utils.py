@@ -23,4 +23,147 @@ DICT_SMOOTH_STRENGTH = {
     'low': 50,      # For low-lying vegetation (grasslands, shrublands)
     'medium': 100,  # For mixed vegetation
     'high': 200     # For forested sites
-} 
\ No newline at end of file
+}
+
+# Orthorectification surface per plot type ('model' = smoothed tie point mesh, 'dem' = coarse tie point DEM)
+DICT_ORTHO_SURFACE = {
+    'low': 'dem',       # Flat low-lying vegetation, a coarse DEM is sufficient and faster
+    'medium': 'model',  # For mixed vegetation
+    'high': 'model'     # For forested sites
+}
+
+# Raw multispectral DN corresponding to a reflectance of 1 (raster transform B{n}/32768)
+REFLECTANCE_SCALE = 32768
+
+# Resolution in metres of the tie point DEM used as orthorectification surface
+DEM_RESOLUTION = 0.5 
+
+# Processing profiles trading runtime for accuracy. 'balanced' matches the defaults of
+# the processing functions; options given on the command line override profile values.
+PROCESSING_PROFILES = {
+    'fast': {
+        'align_mode': 'two_pass',     # Coarse pass rejects unalignable cameras early
+        'align_downscale': 2,         # Medium accuracy matching
+        'keypoint_limit': 20000,
+        'tiepoint_limit': 3000,
+        'gradual_selection': 0,
+        'face_count': 'low',
+        'ortho_surface': 'dem',       # Coarse tie point DEM instead of a smoothed mesh
+        'dem_resolution': 1.0,
+        'refine_seamlines': False,
+    },
+    'balanced': {
+        'align_mode': 'single',
+        'align_downscale': 1,         # High accuracy matching
+        'keypoint_limit': 50000,
+        'tiepoint_limit': 5000,
+        'gradual_selection': 0,
+        'face_count': 'medium',
+        'ortho_surface': 'model',
+        'dem_resolution': DEM_RESOLUTION,
+        'refine_seamlines': True,
+    },
+    'quality': {
+        'align_mode': 'single',
+        'align_downscale': 1,
+        'keypoint_limit': 60000,
+        'tiepoint_limit': 10000,
+        'gradual_selection': 2,       # Remove poor tie points before the final optimization
+        'face_count': 'high',
+        'ortho_surface': 'model',
+        'dem_resolution': 0.25,
+        'refine_seamlines': True,
+    },
+}
+
+def resolve_profile(name='balanced', **overrides):
+    """
+    Get the parameters of a processing profile, with explicitly set options taking precedence.
+
+    Args:
+        name: Profile name (key of PROCESSING_PROFILES)
+        **overrides: Profile parameters to override; None values are ignored
+
+    Returns:
+        Dictionary of processing parameters
+    """
+    if name not in PROCESSING_PROFILES:
+        raise ValueError(f"Unknown processing profile '{name}', expected one of {', '.join(PROCESSING_PROFILES)}")
+    profile = dict(PROCESSING_PROFILES[name])
+    profile.update({key: value for key, value in overrides.items() if value is not None})
+    return profile
+
+# Data removed from projects at stage boundaries by each retention policy: keypoints
+# after alignment, and the listed intermediate products once the orthomosaics are exported
+RETENTION_POLICIES = {
+    'keep': {'keypoints': False, 'intermediates': ()},
+    'compact': {'keypoints': True, 'intermediates': ('depth_maps', 'point_clouds', 'tiles')},
+    'minimal': {'keypoints': True,
+                'intermediates': ('depth_maps', 'point_clouds', 'tiles', 'surfaces', 'orthomosaics')},
+}
+
+# Processing stages that can run on different compute devices
+DEVICE_STAGES = ('matching', 'depth', 'ortho')
+
+# Compute devices per stage. 'gpus' selects GPUs by capability ('discrete', 'all', 'none',
+# or 'fastest' from the device probe) or by a case-insensitive name substring (e.g. 'nvidia');
+# 'cpu' enables the CPU alongside the GPUs (True, False, or 'auto' to follow the device probe)
+DEVICE_POLICIES = {
+    'gpu': {
+        'matching': {'gpus': 'discrete', 'cpu': False},
+        'depth': {'gpus': 'discrete', 'cpu': False},
+        'ortho': {'gpus': 'discrete', 'cpu': False},
+    },
+    'hybrid': {
+        'matching': {'gpus': 'discrete', 'cpu': False},
+        'depth': {'gpus': 'discrete', 'cpu': True},   # Model and DEM steps are partly CPU-bound
+        'ortho': {'gpus': 'discrete', 'cpu': True},   # Orthomosaic blending runs on the CPU
+    },
+    'probe': {
+        'matching': {'gpus': 'fastest', 'cpu': 'auto'},
+        'depth': {'gpus': 'fastest', 'cpu': 'auto'},
+        'ortho': {'gpus': 'fastest', 'cpu': True},
+    },
+    'cpu': {
+        'matching': {'gpus': 'none', 'cpu': True},
+        'depth': {'gpus': 'none', 'cpu': True},
+        'ortho': {'gpus': 'none', 'cpu': True},
+    },
+}
+
+# Canonical band names matched against sensor labels (checked in order)
+BAND_ALIASES = (
+    ('panchro', ('panchro', 'pan')),
+    ('nir', ('nir', 'near')),
+    ('red_edge', ('edge', 're')),
+    ('red', ('red', 'r')),
+    ('green', ('green', 'g')),
+    ('blue', ('blue', 'b')),
+)
+
+# MicaSense band number (IMG_XXXX_<n>.tif) of each canonical band
+MICASENSE_BANDS = {
+    'blue': 1,
+    'green': 2,
+    'red': 3,
+    'nir': 4,
+    'red_edge': 5,
+    'panchro': 6,
+}
+
+def canonical_band_name(label):
+    """
+    Map a sensor label (e.g. 'NIR', 'Red edge', 'RedEdge') to a canonical band name.
+
+    Args:
+        label: Sensor or band label
+
+    Returns:
+        Canonical band name, or None if unknown
+    """
+    name = label.lower().replace('-', ' ').replace('_', ' ')
+    words = name.replace('edge', ' edge').split()
+    for canonical, aliases in BAND_ALIASES:
+        if any(alias in words or (len(alias) > 2 and alias in name) for alias in aliases):
+            return canonical
+    return None
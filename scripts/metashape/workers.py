@@ -0,0 +1,91 @@
+import multiprocessing
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import Metashape
+
+# Interpreter names accepted as worker executables
+PYTHON_NAME = re.compile(r'^python(3(\.\d+)?)?(\.exe)?$', re.IGNORECASE)
+
+def save_chunk_projects(doc, chunks, work_dir):
+    """
+    Save each chunk into its own project so worker processes never share a document.
+
+    Args:
+        doc: Metashape document holding the chunks
+        chunks: Chunks to save
+        work_dir: Directory for the per-chunk projects
+
+    Returns:
+        List of per-chunk project paths, in the order of chunks
+    """
+    work_dir = Path(work_dir)
+    work_dir.mkdir(parents=True, exist_ok=True)
+
+    main_path = doc.path
+    project_paths = []
+    for chunk in chunks:
+        project_path = work_dir / f"{chunk.label}.psx"
+        doc.save(str(project_path), chunks=[chunk])
+        project_paths.append(project_path)
+    # Saving to another path re-targets the document, so point it back at the main project
+    doc.save(main_path)
+    return project_paths
+
+def open_chunk_project(project_path, read_only=True):
+    """
+    Open a per-chunk project written by save_chunk_projects.
+
+    Args:
+        project_path: Path of the per-chunk project
+        read_only: Open the project read-only
+
+    Returns:
+        Tuple of (document, chunk)
+    """
+    doc = Metashape.Document()
+    doc.open(str(project_path), read_only=read_only)
+    return doc, doc.chunk
+
+def worker_python():
+    """
+    Find the Python interpreter to spawn worker processes with. Inside Metashape,
+    sys.executable is the Metashape binary, so its bundled interpreter is used.
+
+    Returns:
+        Path of the Python executable
+
+    Raises:
+        RuntimeError: If no Python interpreter can be found
+    """
+    executable = Path(sys.executable)
+    if PYTHON_NAME.match(executable.name):
+        return str(executable)
+    # Bundled interpreter: <install>/python/bin/python3.x on Linux and macOS, <install>/python/python.exe on Windows
+    install_dir = executable.parent
+    candidates = sorted(install_dir.glob('python/bin/python*')) + [install_dir / 'python' / 'python.exe']
+    for candidate in candidates:
+        if candidate.is_file() and PYTHON_NAME.match(candidate.name):
+            return str(candidate)
+    raise RuntimeError(f"No Python interpreter found next to {executable} to start worker processes with")
+
+def run_in_workers(func, jobs, workers):
+    """
+    Run func(*job) for every job in separate spawned worker processes.
+    Metashape holds per-process state, so workers are spawned rather than forked,
+    with the Python interpreter from worker_python.
+
+    Args:
+        func: Module-level function to run in the workers
+        jobs: List of argument tuples
+        workers: Maximum number of worker processes
+
+    Returns:
+        List of results, in the order of jobs
+    """
+    context = multiprocessing.get_context('spawn')
+    context.set_executable(worker_python())
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        futures = [executor.submit(func, *job) for job in jobs]
+        return [future.result() for future in futures]
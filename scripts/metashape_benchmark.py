@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Script to benchmark processing alternatives on an existing Metashape project.
+Each benchmark runs on copies of the selected chunk so the project's own
+products are left untouched.
+User provides:
+    --project: path to an existing .psx project (not needed for the mrk benchmark)
+    --chunk: label of the chunk to benchmark (defaults to the active chunk)
+    --benchmark: which benchmark to run
+"""
+
+import argparse
+import sys
+from pathlib import Path
+import Metashape
+
+from metashape.gpu_setup import setup_gpu
+from metashape.utils import PROCESSING_PROFILES
+from metashape.markers import load_markers
+from metashape.benchmark import (benchmark_alignment_modes, benchmark_ortho_surfaces, benchmark_export_codecs,
+                                 benchmark_mrk_parser, benchmark_profiles)
+
+def main():
+    # Set up GPU acceleration
+    setup_gpu()
+
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description="Benchmark processing alternatives on a Metashape project.")
+    parser.add_argument('-project', default=None, help='Path to the Metashape project (.psx)')
+    parser.add_argument('-chunk', default=None, help='Label of the chunk to benchmark (default: active chunk)')
+    parser.add_argument('-benchmark', choices=['align', 'surface', 'codec', 'mrk', 'profiles'], required=True,
+                      help='Benchmark to run (align: single-pass vs two-pass alignment, '
+                           'surface: tie point mesh vs coarse DEM orthorectification, '
+                           'codec: orthomosaic export codecs, mrk: DJI RTK timestamp file parsing, '
+                           'profiles: processing profiles, runtime vs accuracy)')
+    parser.add_argument('-out', default=None,
+                      help='Scratch directory for benchmark exports (codec benchmark) or the comparison CSV (profiles benchmark)')
+    parser.add_argument('-profiles', nargs='+', choices=list(PROCESSING_PROFILES), default=list(PROCESSING_PROFILES),
+                      help='Processing profiles to compare in the profiles benchmark (default: all)')
+    parser.add_argument('-checkpoints', nargs='+', default=None,
+                      help='Marker files to load as check points (reference disabled) in the profiles benchmark')
+    parser.add_argument('-no_ortho', action='store_true',
+                      help='Skip the orthomosaic stage in the profiles benchmark')
+    parser.add_argument('-product', choices=['rgb', 'multispec'], default='rgb',
+                      help='Orthomosaic to export in the codec benchmark (default: rgb)')
+    parser.add_argument('-block_size', type=int, default=0,
+                      help='Split exports into blocks of this many pixels in the codec benchmark (default: 0)')
+    parser.add_argument('-smooth', choices=['low', 'medium', 'high'], default='low',
+                      help='Smoothing strength for the model in the surface benchmark (default: low)')
+    parser.add_argument('-keep_chunks', action='store_true',
+                      help='Keep the benchmark chunks (or exported files) for inspection')
+    parser.add_argument('-lines', type=int, default=100000,
+                      help='Number of exposures in the synthetic timestamp file of the mrk benchmark (default: 100000)')
+    args = parser.parse_args()
+
+    if args.benchmark == 'mrk':
+        benchmark_mrk_parser(lines=args.lines, out_dir=args.out)
+        return
+
+    if not args.project:
+        sys.exit("-project is required for this benchmark")
+    project_path = Path(args.project).resolve()
+    if not project_path.is_file():
+        sys.exit(f"Project not found: {project_path}")
+
+    doc = Metashape.app.document
+    doc.open(str(project_path))
+
+    chunk = doc.chunk
+    if args.chunk:
+        chunk = next((c for c in doc.chunks if c.label == args.chunk), None)
+        if chunk is None:
+            sys.exit(f"Chunk '{args.chunk}' not found in {project_path}")
+
+    if args.benchmark == 'align':
+        benchmark_alignment_modes(doc, chunk, keep_chunks=args.keep_chunks)
+    elif args.benchmark == 'surface':
+        benchmark_ortho_surfaces(doc, chunk, smooth_strength=args.smooth, keep_chunks=args.keep_chunks)
+    elif args.benchmark == 'codec':
+        if not chunk.orthomosaic:
+            sys.exit(f"Chunk '{chunk.label}' has no orthomosaic to export")
+        out_dir = Path(args.out) if args.out else project_path.parent / "codec_benchmark"
+        benchmark_export_codecs(chunk, out_dir, product=args.product, block_size=args.block_size,
+                                keep_files=args.keep_chunks)
+    elif args.benchmark == 'profiles':
+        if args.checkpoints:
+            existing = {marker.key for marker in chunk.markers}
+            load_markers(chunk, args.checkpoints)
+            for marker in chunk.markers:
+                if marker.key not in existing:
+                    marker.reference.enabled = False
+        out_csv = Path(args.out) / f"{chunk.label}_profiles.csv" if args.out else None
+        benchmark_profiles(doc, chunk, profiles=args.profiles, smooth_strength=args.smooth, ortho=not args.no_ortho,
+                           keep_chunks=args.keep_chunks, out_csv=out_csv)
+
+    if args.keep_chunks:
+        doc.save()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Daemon that watches the TERN imagery root for new flights and queues each one for
+processing as soon as its upload has finished.
+Assumes TERN directory structure:
+    <root>/<plot>/YYYYMMDD/imagery/
+        ├── rgb/level0_raw/
+        └── multispec/level0_raw/
+User provides:
+    --root: directory holding the plot directories
+    --queue: path of the persistent job queue (optional, defaults to <root>/ingest_queue.json)
+    --command: processing command to run for each queued flight (optional)
+An upload counts as finished once the file counts and sizes of both raw image
+directories have not changed for -settle seconds. Does not need Metashape.
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+from metashape.ingest import watch_uploads
+
+def main():
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description="Queue new flights for processing when their uploads finish.")
+    parser.add_argument('-root', required=True, help='Directory holding the <plot>/YYYYMMDD/imagery/ directories')
+    parser.add_argument('-queue', default=None, help='Path of the job queue JSON (default: <root>/ingest_queue.json)')
+    parser.add_argument('-settle', type=float, default=300,
+                      help='Seconds file counts and sizes must stay unchanged before a flight is queued (default: 300)')
+    parser.add_argument('-poll', type=float, default=60,
+                      help='Polling interval in seconds when inotify is not used (default: 60)')
+    parser.add_argument('-no_inotify', action='store_true',
+                      help='Poll instead of using inotify (needed for uploads written by other hosts to network storage)')
+    parser.add_argument('-command', default=None,
+                      help='Command run for each queued flight, one at a time, e.g. '
+                           '"metashape.sh -r metashape_load_multispec.py -imagery_dir {imagery_dir} -out /data/{plot}". '
+                           'Placeholders: {imagery_dir}, {plot}, {date} (default: only queue flights)')
+    parser.add_argument('-skip_existing', action='store_true',
+                      help='Record the flights already under the root as skipped instead of queueing them')
+    parser.add_argument('-once', action='store_true',
+                      help='Scan once, queue (and process) flights settled since the previous run, then exit (for cron)')
+    args = parser.parse_args()
+
+    root = Path(args.root).resolve()
+    if not root.is_dir():
+        sys.exit(f"Root directory not found: {root}")
+
+    try:
+        watch_uploads(root, queue_path=args.queue, settle=args.settle, poll=args.poll,
+                      use_inotify=not args.no_inotify, command=args.command,
+                      skip_existing=args.skip_existing, once=args.once)
+    except KeyboardInterrupt:
+        print("Stopped watching.")
+
+if __name__ == "__main__":
+    main()
@@ -12,25 +12,22 @@ User provides:
     --crs: EPSG code for target CRS (optional, defaults to 4326)
     --out: output directory for Metashape project
 Project will be named as "YYYYMMDD-plot.psx"
+With -dry_run the run is only planned, which does not need Metashape.
 """
 
 import argparse
 import os
 import sys
+import time
 from pathlib import Path
-import Metashape
 
-from metashape.gpu_setup import setup_gpu
-from metashape.utils import find_images
-from metashape.camera_ops import configure_multispectral_camera
-from metashape.processing import detect_reflectance_panels, merge_chunks
-from metashape.markers import find_marker_files, load_markers
-from metashape.image_utils import find_filtered_images, filter_images_by_timestamp, filter_multispec_by_flight_pattern
+# Script start, to report startup time in dry runs
+STARTED = time.perf_counter()
+
+from metashape.utils import find_images, MICASENSE_BANDS
+from metashape.planner import plan_run
 
 def main():
-    # Set up GPU acceleration
-    setup_gpu()
-    
     # Parse command line arguments
     parser = argparse.ArgumentParser(description="Initialize Metashape project with RGB and multispectral images.")
     parser.add_argument('-imagery_dir', required=True, help='Path to YYYYMMDD/imagery/ directory')
@@ -42,10 +39,47 @@ def main():
                       help='Skip loading markers even if .mrk files are found')
     parser.add_argument('-filter_method', choices=['time', 'spatial', 'both'], default='spatial',
                       help='Method to filter multispectral images (default: spatial)')
+    parser.add_argument('-dedup', choices=['none', 'flight', 'plot'], default='none',
+                      help='Exclude duplicate images by content: within this flight, or also against the '
+                           "plot's other date folders, keeping each image in the folder of its capture "
+                           'date (default: none)')
+    parser.add_argument('-bands', nargs='+', choices=sorted(MICASENSE_BANDS), default=None,
+                      help='Multispectral bands to load, e.g. red red_edge nir (default: all). '
+                           'An alignment reference band (Panchro if captured) is always loaded')
+    parser.add_argument('-quality_screen', action='store_true', default=False,
+                      help='Exclude blurred or badly exposed RGB images, scored on their embedded thumbnails')
+    parser.add_argument('-min_sharpness', type=float, default=0.5,
+                      help='Minimum RGB preview sharpness as a fraction of the flight median (default: 0.5)')
+    parser.add_argument('-max_clipped', type=float, default=0.25,
+                      help='Maximum fraction of clipped shadow or highlight pixels in RGB previews (default: 0.25)')
+    parser.add_argument('-refine_geotags', action='store_true', default=False,
+                      help='Interpolate multispectral positions from the RGB RTK trajectory before alignment')
     parser.add_argument('-spatial_threshold', type=float, default=0.2,
                       help='Spatial threshold for flight pattern filtering (default: 0.2)')
+    parser.add_argument('-dry_run', action='store_true', default=False,
+                      help='Report discovered images, expected filter outcomes, parameters and predicted '
+                           'stage runtimes without Metashape, then exit')
     args = parser.parse_args()
 
+    if args.dry_run:
+        plan_run(args, script='load_multispec', started=STARTED)
+        return
+
+    # Metashape and the processing modules are only needed for a real run
+    import Metashape
+    from metashape.gpu_setup import setup_gpu
+    from metashape.camera_ops import configure_multispectral_camera
+    from metashape.processing import detect_reflectance_panels, merge_chunks
+    from metashape.markers import find_marker_files, load_markers
+    from metashape.image_utils import (find_filtered_images, filter_images_by_timestamp,
+                                       filter_multispec_by_flight_pattern, validate_capture_sets, select_band_files)
+    from metashape.dedup import deduplicate_images, other_flight_images, MANIFEST_NAME
+    from metashape.quality import screen_images
+    from metashape.trajectory import refine_multispec_geotags
+
+    # Set up GPU acceleration
+    setup_gpu()
+
     # Extract YYYYMMDD and plot from input path
     imagery_dir = Path(args.imagery_dir).resolve()
     if imagery_dir.name != "imagery":
@@ -81,9 +115,35 @@ def main():
     if not multispec_images:
         sys.exit(f"No multispectral images found in {multispec_dir}")
 
+    # Load only the selected bands plus the alignment reference band
+    reference_band = None
+    if args.bands:
+        multispec_images, reference_band = select_band_files(multispec_images, args.bands)
+
+    # Exclude duplicate uploads before adding images to Metashape; hashes are kept in the scan manifest
+    if args.dedup != 'none':
+        manifest_path = imagery_dir / MANIFEST_NAME
+        other_rgb = other_ms = ()
+        if args.dedup == 'plot':
+            other_rgb = other_flight_images(imagery_dir, "rgb/level0_raw", lambda folder: find_filtered_images(folder, extensions=('.jpg', '.jpeg')))
+            other_ms = other_flight_images(imagery_dir, "multispec/level0_raw", lambda folder: find_filtered_images(folder, extensions=('.tif', '.tiff'), exclude_patterns=('_6.tif',)))
+        rgb_images = deduplicate_images(rgb_images, imagery_dir, manifest_path, other_rgb)
+        multispec_images = deduplicate_images(multispec_images, imagery_dir, manifest_path, other_ms)
+
     print(f"Found {len(rgb_images)} RGB images")
     print(f"Found {len(multispec_images)} multispectral images (excluding Panchro band)")
 
+    # Exclude blurred or badly exposed RGB frames, scored on their embedded thumbnails
+    if args.quality_screen:
+        rgb_images = screen_images(rgb_images, imagery_dir, imagery_dir / MANIFEST_NAME,
+                                   min_sharpness=args.min_sharpness, max_clipped=args.max_clipped)
+
+    # Group multispectral band files into validated captures for the MultiplaneLayout load
+    capture_sets = validate_capture_sets(multispec_images)
+    if not capture_sets:
+        sys.exit(f"No complete multispectral captures found in {multispec_dir}")
+    multispec_images = [path for capture in capture_sets for path in capture]
+
     # Initialize Metashape project and create output directory
     doc = Metashape.app.document
     out_dir = Path(args.out)
@@ -107,7 +167,8 @@ def main():
     rgb_chunk.addPhotos(rgb_images)
 
     print(f"Adding {len(multispec_images)} multispectral images to the project...")
-    multispec_chunk.addPhotos(multispec_images, layout=Metashape.MultiplaneLayout)
+    multispec_chunk.addPhotos(multispec_images, filegroups=[len(capture) for capture in capture_sets],
+                              layout=Metashape.MultiplaneLayout)
 
     if len(rgb_chunk.cameras) == 0:
         sys.exit("RGB chunk is empty after adding images.")
@@ -115,7 +176,7 @@ def main():
         sys.exit("Multispectral chunk is empty after adding images.")
 
     # Configure multispectral camera band indices
-    configure_multispectral_camera(multispec_chunk)
+    configure_multispectral_camera(multispec_chunk, master_band=reference_band)
     
     # Load markers if available
     if marker_files and not args.skip_markers:
@@ -150,6 +211,11 @@ def main():
     # Save project after merging
     doc.save()
     print("Chunks merged successfully into 'all_images' chunk")
+
+    # Replace consumer GPS positions of multispectral captures with positions on the RGB trajectory
+    if args.refine_geotags:
+        refine_multispec_geotags(merged_chunk)
+        doc.save()
     
     #-------------------------------------------
     # Step 2: Filter multispectral images based on chosen method
@@ -11,33 +11,98 @@ User provides:
     --crs: EPSG code for target CRS (optional, defaults to 4326)
     --out: output directory for Metashape project
 Project will be named as "YYYYMMDD-plot.psx"
+With -dry_run the run is only planned, which does not need Metashape.
 """
 
 import argparse
 import os
 import sys
+import time
 from pathlib import Path
-import Metashape
-
-from metashape.gpu_setup import setup_gpu
-from metashape.utils import find_images
-from metashape.camera_ops import (
-    configure_multispectral_camera,
-    remove_images_outside_rgb_times,
-    camera_filtering
-)
-from metashape.processing import (
-    detect_reflectance_panels,
-    align_images,
-    build_model,
-    merge_chunks
-)
-from metashape.resume import resume_proc
 
-def main():
-    # Set up GPU acceleration
-    setup_gpu()
+# Script start, to report startup time in dry runs
+STARTED = time.perf_counter()
+
+from metashape.utils import (find_images, DICT_ORTHO_SURFACE, MICASENSE_BANDS, PROCESSING_PROFILES, resolve_profile,
+                             RETENTION_POLICIES, DEVICE_POLICIES)
+from metashape.planner import plan_run
+
+def incremental_update(doc, args, imagery_dir, yyyymmdd, plot, rgb_images, multispec_captures, devices=None,
+                       scanned=(), reference_band=None):
+    """
+    Add late-arriving images to a project processed by this script, rebuild the affected
+    products without re-matching the existing cameras, and re-export them.
+    
+    Args:
+        doc: Metashape document opened on the existing project
+        args: Script arguments
+        imagery_dir: Path to the YYYYMMDD/imagery/ directory the products are exported to
+        yyyymmdd: Flight date
+        plot: Plot name
+        rgb_images: RGB image paths found in level0_raw
+        multispec_captures: Validated multispectral captures (lists of band files) found in level0_raw
+        devices: Per-stage device settings from setup_gpu
+        scanned: Normalised image paths considered by earlier runs, which are never re-added
+        reference_band: Alignment reference band when only a subset of bands is loaded
+    """
+    import Metashape
+    from metashape.processing import (build_surface, optimize_cameras, calibrate_reflectance_and_transform,
+                                      detect_reflectance_panels)
+    from metashape.camera_ops import configure_multispectral_camera, remove_images_outside_rgb_times
+    from metashape.incremental import align_new_images
+    from metashape.gpu_setup import use_stage_devices
+    from resume_functions import export_rgb_orthomosaic, export_multispec_orthomosaic, export_settings
     
+    chunks = {chunk.label: chunk for chunk in doc.chunks}
+    if 'rgb' not in chunks or 'multispec' not in chunks:
+        sys.exit("Incremental mode needs a project with 'rgb' and 'multispec' chunks from a previous run")
+    
+    def prepare_multispec(chunk, new_cameras):
+        # New captures get the band configuration, panel detection and time filter of the first run
+        configure_multispectral_camera(chunk, master_band=reference_band)
+        detect_reflectance_panels(chunk)
+        remove_images_outside_rgb_times(chunk, rgb_chunk=chunks['rgb'], cameras=new_cameras)
+    
+    # Multispectral captures are added as explicit file groups, as in the first run
+    for label, images, captures, layout, prepare in (('rgb', rgb_images, None, None, None),
+                                                     ('multispec', None, multispec_captures,
+                                                      Metashape.MultiplaneLayout, prepare_multispec)):
+        chunk = chunks[label]
+        # Match with the limits of the profile the project was aligned with, not this run's -profile
+        name = chunk.meta['processing_profile'] if 'processing_profile' in chunk.meta else 'balanced'
+        profile = resolve_profile(name)
+        use_stage_devices(devices, 'matching')
+        new_cameras = align_new_images(chunk, images, layout=layout, scanned=scanned, prepare=prepare,
+                                       captures=captures, keypoint_limit=profile['keypoint_limit'],
+                                       tiepoint_limit=profile['tiepoint_limit'])
+        if not new_cameras:
+            print(f"No new images for {label} chunk")
+            continue
+        
+        optimize_cameras(chunk)
+        doc.save()
+        
+        # Rebuild the products that depend on the alignment, on the same surface type
+        surface = 'dem' if chunk.elevation and not chunk.model else 'model'
+        use_stage_devices(devices, 'depth')
+        surface_data = build_surface(chunk, surface=surface, smooth_strength=args.smooth,
+                                     dem_resolution=args.dem_resolution, face_count=args.face_count)
+        if label == 'multispec' and chunk.raster_transform.enabled:
+            calibrate_reflectance_and_transform(chunk, chunk.sensors, doc, args.sun_sensor)
+        if chunk.orthomosaic:
+            print(f"Rebuilding {label} orthomosaic...")
+            use_stage_devices(devices, 'ortho')
+            chunk.buildOrthomosaic(surface_data=surface_data, refine_seamlines=args.refine_seamlines)
+            doc.save()
+            # Replace the level1 product and its catalog entry, with the export settings of the first run
+            print(f"Re-exporting {label} orthomosaic...")
+            export = export_rgb_orthomosaic if label == 'rgb' else export_multispec_orthomosaic
+            export(chunk, imagery_dir, yyyymmdd, plot, **export_settings(chunk, label))
+        doc.save()
+    
+    print("Incremental update complete.")
+
+def main():
     # Parse command line arguments
     parser = argparse.ArgumentParser(description="Initialize Metashape project with all images in one chunk.")
     parser.add_argument('-imagery_dir', required=True, help='Path to YYYYMMDD/imagery/ directory')
@@ -45,10 +110,123 @@ def main():
     parser.add_argument('-out', required=True, help='Directory to save the Metashape project')
     parser.add_argument('-smooth', choices=['low', 'medium', 'high'], default='low',
                       help='Smoothing strength for the model (default: low)')
+    parser.add_argument('-profile', choices=list(PROCESSING_PROFILES), default='balanced',
+                      help='Processing profile bundling alignment, model and orthomosaic settings '
+                           '(PROCESSING_PROFILES in metashape/utils.py; default: balanced)')
+    parser.add_argument('-align_mode', choices=['single', 'two_pass'], default=None,
+                      help='Alignment mode: single full-resolution pass or coarse-to-fine two-pass (default: from -profile)')
+    parser.add_argument('-ortho_surface', choices=['preset', 'model', 'dem'], default=None,
+                      help='Orthorectification surface: tie point mesh, coarse tie point DEM, '
+                           'or the per plot type preset in DICT_ORTHO_SURFACE (default: from -profile)')
+    parser.add_argument('-gradual_selection', type=int, default=None, metavar='ITERATIONS',
+                      help='Number of tie point gradual selection + optimization passes after alignment '
+                           '(default: from -profile)')
+    parser.add_argument('-keep_keypoints', action='store_true', default=False,
+                      help='Store keypoints in the project so late images can be added with -incremental')
+    parser.add_argument('-incremental', action='store_true', default=False,
+                      help='Add only new images to an existing project and rebuild its products')
+    parser.add_argument('-retention', choices=list(RETENTION_POLICIES), default='compact',
+                      help='Data removed from the project at stage boundaries: keypoints after alignment '
+                           '(unless -keep_keypoints) and, when exporting, intermediate products '
+                           '(RETENTION_POLICIES in metashape/utils.py; default: compact)')
+    parser.add_argument('-codec', choices=['lzw', 'deflate', 'packbits', 'none', 'jpeg'], default='lzw',
+                      help='TIFF codec of the exported orthomosaics; jpeg applies to RGB only, '
+                           'multispectral products use lzw instead (default: lzw)')
+    parser.add_argument('-block_size', type=int, default=0,
+                      help='Split exported orthomosaics into square blocks of this many pixels, '
+                           'listed in a manifest (default: 0, a single file)')
+    parser.add_argument('-cog_codec', choices=['zstd', 'deflate', 'lzw', 'jpeg', 'none'], default=None,
+                      help='Re-write exported orthomosaics as Cloud-Optimized GeoTIFFs with this codec using GDAL; '
+                           'jpeg applies to RGB only (default: keep the Metashape layout)')
+    parser.add_argument('-stage_dir', default=None,
+                      help='Local scratch directory to stage raw imagery in before processing (default: read from imagery_dir)')
+    parser.add_argument('-stage_max_gb', type=float, default=500,
+                      help='Size cap of the staging directory in GB, least recently used plots are evicted (default: 500)')
+    parser.add_argument('-prefetch_next', default=None,
+                      help='imagery/ directory of the next queued plot to stage in the background')
+    parser.add_argument('-dedup', choices=['none', 'flight', 'plot'], default='none',
+                      help='Exclude duplicate images by content: within this flight, or also against the '
+                           "plot's other date folders, keeping each image in the folder of its capture "
+                           'date (default: none)')
+    parser.add_argument('-bands', nargs='+', choices=sorted(MICASENSE_BANDS), default=None,
+                      help='Multispectral bands to load, e.g. red red_edge nir (default: all). '
+                           'An alignment reference band (Panchro if captured) is always loaded')
+    parser.add_argument('-quality_screen', action='store_true', default=False,
+                      help='Exclude blurred or badly exposed RGB images, scored on their embedded thumbnails')
+    parser.add_argument('-min_sharpness', type=float, default=0.5,
+                      help='Minimum RGB preview sharpness as a fraction of the flight median (default: 0.5)')
+    parser.add_argument('-max_clipped', type=float, default=0.25,
+                      help='Maximum fraction of clipped shadow or highlight pixels in RGB previews (default: 0.25)')
+    parser.add_argument('-refine_geotags', action='store_true', default=False,
+                      help='Interpolate multispectral positions from the RGB RTK trajectory before alignment')
+    parser.add_argument('-gcps', nargs='+', default=None,
+                      help='Ground control marker files (name,x,y,z per line) to load after alignment')
+    parser.add_argument('-detect_targets', action='store_true', default=False,
+                      help='Detect coded targets on the images covering a GCP and pin them to the GCP markers')
+    parser.add_argument('-target_max_distance', type=float, default=3.0,
+                      help='Maximum distance in metres between a detected target and the GCP it is pinned to (default: 3)')
+    parser.add_argument('-diagnostics', action='store_true', default=False,
+                      help='Write per-camera alignment diagnostics (<project>_camera_diagnostics.npz) and an outlier summary')
+    parser.add_argument('-drop_outliers', action='store_true', default=False,
+                      help='Disable outlier cameras found by the diagnostics and re-optimize (implies -diagnostics)')
     parser.add_argument('-sun_sensor', action='store_true', default=False,
                       help='Whether to use sun sensor data for reflectance calibration (default: False)')
+    parser.add_argument('-device_policy', choices=list(DEVICE_POLICIES), default='gpu',
+                      help='Compute devices of the matching, depth/model and ortho stages '
+                           '(DEVICE_POLICIES in metashape/utils.py; default: gpu, discrete GPUs with CPU off)')
+    parser.add_argument('-devices', nargs='+', default=None, metavar='STAGE=GPUS[:cpu|:nocpu|:auto]',
+                      help='Per-stage device overrides selecting GPUs by name substring or capability, '
+                           'e.g. ortho=nvidia:cpu depth=fastest')
+    parser.add_argument('-device_probe', action='store_true', default=False,
+                      help='Time a small matching workload on each device (cached per host) to pick the '
+                           "fastest GPU and whether the CPU helps ('fastest' and 'auto' in device policies)")
+    parser.add_argument('-dry_run', action='store_true', default=False,
+                      help='Report discovered images, expected filter outcomes, parameters and predicted '
+                           'stage runtimes without Metashape, then exit')
     args = parser.parse_args()
 
+    # Fill processing parameters not given on the command line from the profile
+    vars(args).update(resolve_profile(args.profile, align_mode=args.align_mode, ortho_surface=args.ortho_surface,
+                                      gradual_selection=args.gradual_selection))
+
+    if args.dry_run:
+        plan_run(args, script='coalign', started=STARTED)
+        return
+
+    # Metashape and the processing modules are only needed for a real run
+    import Metashape
+    from metashape.gpu_setup import setup_gpu, parse_device_overrides, use_stage_devices
+    from metashape.image_utils import validate_capture_sets, select_band_files
+    from metashape.camera_ops import (
+        configure_multispectral_camera,
+        remove_images_outside_rgb_times,
+        camera_filtering
+    )
+    from metashape.processing import (
+        detect_reflectance_panels,
+        align_images,
+        align_images_two_pass,
+        gradual_selection,
+        build_surface,
+        merge_chunks,
+        optimize_cameras
+    )
+    from metashape.dedup import deduplicate_images, other_flight_images, MANIFEST_NAME
+    from metashape.quality import screen_images
+    from metashape.trajectory import refine_multispec_geotags
+    from metashape.markers import load_markers
+    from metashape.targets import detect_gcp_targets
+    from metashape.diagnostics import write_camera_diagnostics, drop_outlier_cameras
+    from metashape.retention import retain_after_alignment
+    from metashape.incremental import scanned_images_path, load_scanned_images, record_scanned_images
+    from metashape.staging import stage_imagery, prefetch_imagery, release_imagery, repoint_document
+    from metashape.resume import resume_proc
+
+    try:
+        device_overrides = parse_device_overrides(args.devices)
+    except ValueError as e:
+        sys.exit(str(e))
+
     # Extract YYYYMMDD and plot from input path
     imagery_dir = Path(args.imagery_dir).resolve()
     if imagery_dir.name != "imagery":
@@ -66,21 +244,88 @@ def main():
     if not multispec_dir.is_dir():
         sys.exit(f"Multispec directory not found: {multispec_dir}")
 
+    # Stage raw imagery on local scratch and read it from there
+    staged_dir = None
+    prefetch = None
+    if args.stage_dir:
+        max_bytes = int(args.stage_max_gb * 1e9)
+        staged_dir = stage_imagery(imagery_dir, args.stage_dir, max_bytes)
+        rgb_dir = staged_dir / "rgb" / "level0_raw"
+        multispec_dir = staged_dir / "multispec" / "level0_raw"
+        if args.prefetch_next:
+            prefetch = prefetch_imagery(Path(args.prefetch_next).resolve(), args.stage_dir, max_bytes)
+
     # Find all image files in both directories
     rgb_images = find_images(rgb_dir)
     multispec_images = find_images(multispec_dir)
+    scanned_rgb, scanned_multispec = list(rgb_images), list(multispec_images)
 
     if not rgb_images:
         sys.exit(f"No RGB images found in {rgb_dir}")
     if not multispec_images:
         sys.exit(f"No multispectral images found in {multispec_dir}")
 
+    # Load only the selected bands plus the alignment reference band
+    reference_band = None
+    if args.bands:
+        multispec_images, reference_band = select_band_files(multispec_images, args.bands)
+
+    # Exclude duplicate uploads before adding images to Metashape; hashes are kept in the scan manifest
+    if args.dedup != 'none':
+        manifest_path = imagery_dir / MANIFEST_NAME
+        image_root = staged_dir or imagery_dir
+        other_rgb = other_ms = ()
+        if args.dedup == 'plot':
+            other_rgb = other_flight_images(imagery_dir, "rgb/level0_raw", find_images)
+            other_ms = other_flight_images(imagery_dir, "multispec/level0_raw", find_images)
+        rgb_images = deduplicate_images(rgb_images, image_root, manifest_path, other_rgb)
+        multispec_images = deduplicate_images(multispec_images, image_root, manifest_path, other_ms)
+
+    # Exclude blurred or badly exposed RGB frames, scored on their embedded thumbnails
+    if args.quality_screen:
+        rgb_images = screen_images(rgb_images, staged_dir or imagery_dir, imagery_dir / MANIFEST_NAME,
+                                   min_sharpness=args.min_sharpness, max_clipped=args.max_clipped)
+
+    # Group multispectral band files into validated captures for the MultiplaneLayout load
+    capture_sets = validate_capture_sets(multispec_images)
+    if not capture_sets:
+        sys.exit(f"No complete multispectral captures found in {multispec_dir}")
+    incomplete = set(multispec_images)
+    multispec_images = [path for capture in capture_sets for path in capture]
+    incomplete.difference_update(multispec_images)
+    # Everything scanned is recorded as considered, except incomplete captures that may still be uploading
+    scanned_images = scanned_rgb + [path for path in scanned_multispec if path not in incomplete]
+
+    # Set up the compute devices of each stage, probing them on a few of this flight's RGB images
+    devices = setup_gpu(args.device_policy, device_overrides, probe_images=rgb_images if args.device_probe else None)
+
     # Initialize Metashape project and create output directory
     doc = Metashape.app.document
     out_dir = Path(args.out)
     out_dir.mkdir(parents=True, exist_ok=True)
     project_path = out_dir / project_name
+
+    if args.incremental:
+        if not project_path.is_file():
+            sys.exit(f"Incremental mode needs an existing project: {project_path}")
+        doc.open(str(project_path))
+        if staged_dir:
+            repoint_document(doc, imagery_dir, staged_dir)
+        scanned_path = scanned_images_path(project_path)
+        scanned = load_scanned_images(scanned_path, staged_dir or imagery_dir)
+        incremental_update(doc, args, imagery_dir, yyyymmdd, plot, rgb_images, capture_sets, devices,
+                           scanned=scanned, reference_band=reference_band)
+        record_scanned_images(scanned_path, scanned_images, staged_dir or imagery_dir)
+        if staged_dir:
+            repoint_document(doc, staged_dir, imagery_dir)
+            doc.save()
+            release_imagery(imagery_dir, args.stage_dir)
+        if prefetch:
+            prefetch.result()
+        return
+
     doc.save(str(project_path))
+    record_scanned_images(scanned_images_path(project_path), scanned_images, staged_dir or imagery_dir)
 
     # Remove default empty chunk if it exists
     if len(doc.chunks) == 1 and doc.chunks[0].label == "Chunk 1" and len(doc.chunks[0].cameras) == 0:
@@ -98,7 +343,8 @@ def main():
     rgb_chunk.addPhotos(rgb_images)
 
     print(f"Adding {len(multispec_images)} multispectral images to the project...")
-    multispec_chunk.addPhotos(multispec_images, layout=Metashape.MultiplaneLayout)
+    multispec_chunk.addPhotos(multispec_images, filegroups=[len(capture) for capture in capture_sets],
+                              layout=Metashape.MultiplaneLayout)
 
     if len(rgb_chunk.cameras) == 0:
         sys.exit("RGB chunk is empty after adding images.")
@@ -106,7 +352,7 @@ def main():
         sys.exit("Multispectral chunk is empty after adding images.")
 
     # Configure multispectral camera band indices
-    configure_multispectral_camera(multispec_chunk)
+    configure_multispectral_camera(multispec_chunk, master_band=reference_band)
     
     # Detect reflectance panels in multispectral chunk
     detect_reflectance_panels(multispec_chunk)
@@ -119,18 +365,64 @@ def main():
 
     # Merge chunks into one (RGB into multispec)
     chunk = merge_chunks(doc, rgb_chunk, multispec_chunk, rgb_images)
+    # Recorded with the products in the level1 catalog at export time
+    chunk.meta['processing_profile'] = args.profile
+    # Read by the exporters in resume_functions.py to drop intermediate products
+    chunk.meta['retention'] = args.retention
+    # Read by build_and_export_orthomosaics in resume_functions.py as the default export settings
+    chunk.meta['export_codec'] = args.codec
+    chunk.meta['export_block_size'] = str(args.block_size)
+    chunk.meta['export_cog_codec'] = args.cog_codec or ''
     doc.save()
 
     # Remove images outside RGB capture times
     remove_images_outside_rgb_times(chunk)
     doc.save()
 
+    # Replace consumer GPS positions of multispectral captures with positions on the RGB trajectory
+    if args.refine_geotags:
+        refine_multispec_geotags(chunk)
+        doc.save()
+
     # Align and optimize images with specified settings
-    align_images(chunk)
-    doc.save()
+    if args.align_mode == 'two_pass':
+        align_images_two_pass(chunk, downscale=args.align_downscale, keypoint_limit=args.keypoint_limit,
+                              tiepoint_limit=args.tiepoint_limit)
+    else:
+        align_images(chunk, keep_keypoints=args.keep_keypoints, downscale=args.align_downscale,
+                     keypoint_limit=args.keypoint_limit, tiepoint_limit=args.tiepoint_limit)
+
+    # Keypoints are only needed to add late images with -incremental; retention saves the project itself
+    report = None if args.keep_keypoints else retain_after_alignment(doc, [chunk], args.retention)
+    if report is None:
+        doc.save()
+
+    # Load ground control and detect targets only on the images whose footprint covers a GCP
+    if args.gcps:
+        load_markers(chunk, args.gcps)
+        if args.detect_targets:
+            detect_gcp_targets(chunk, max_distance=args.target_max_distance)
+            optimize_cameras(chunk)
+        doc.save()
+
+    # Find cameras that slow or break optimization, optionally dropping them
+    if args.diagnostics or args.drop_outliers:
+        diagnostics_path = project_path.with_name(f"{project_path.stem}_camera_diagnostics.npz")
+        columns = write_camera_diagnostics(chunk, diagnostics_path)
+        if args.drop_outliers:
+            drop_outlier_cameras(chunk, columns)
+        doc.save()
+
+    # Remove poor tie points and re-optimize before building the tie point model
+    if args.gradual_selection > 0:
+        gradual_selection(chunk, iterations=args.gradual_selection)
+        doc.save()
     
-    # Build model from tie points with specified smoothing
-    build_model(chunk, smooth_strength=args.smooth)
+    # Build model (or DEM) from tie points with specified smoothing
+    surface = DICT_ORTHO_SURFACE[args.smooth] if args.ortho_surface == 'preset' else args.ortho_surface
+    use_stage_devices(devices, 'depth')
+    build_surface(chunk, surface=surface, smooth_strength=args.smooth, dem_resolution=args.dem_resolution,
+                  face_count=args.face_count)
 
     # Save project
     doc.save()
@@ -138,7 +430,7 @@ def main():
 
     # Duplicate the 'all_images' chunk
     rgb_chunk = doc.chunk
-    multispec_chunk = rgb_chunk.copy()
+    multispec_chunk = rgb_chunk.copy(keypoints=args.keep_keypoints)
     rgb_chunk.label = "rgb"
     multispec_chunk.label = "multispec"
     print("Created duplicate chunk: multispec")
@@ -146,8 +438,15 @@ def main():
     # Camera filter - remove images from each chunk
     camera_filtering(rgb_chunk, multispec_chunk)
 
-    # Save project after filtering
-    doc.save()
+    # Save project after filtering. The saved project points at the network copy, so it stays
+    # valid if Metashape exits before 'Resume processing' and the staged copy is evicted;
+    # this session keeps reading the staged copy until calibration is done.
+    if staged_dir:
+        repoint_document(doc, staged_dir, imagery_dir)
+        doc.save()
+        repoint_document(doc, imagery_dir, staged_dir)
+    else:
+        doc.save()
     print("Project saved with filtered chunks")
 
     # Add resume processing menu item
@@ -167,10 +466,17 @@ def main():
     print("###########################")
     print("###########################")
 
-    # Add resume processing menu item
+    def finish_run():
+        # Point the project back at the network copy so it stays valid after the staged copy is evicted
+        if staged_dir:
+            repoint_document(doc, staged_dir, imagery_dir)
+            doc.save()
+            release_imagery(imagery_dir, args.stage_dir)
+
+    # Add resume processing menu item; photos stay on the staged copy until calibration is done
     label = "Resume processing"
     Metashape.app.removeMenuItem(label)
-    Metashape.app.addMenuItem(label, lambda: resume_proc(doc, multispec_chunk, args))
+    Metashape.app.addMenuItem(label, lambda: resume_proc(doc, multispec_chunk, args, finish=finish_run))
     Metashape.app.messageBox(
         "Complete Steps 1 to 4 listed on the Console tab and then click on 'Resume Processing' in the toolbar")
 
@@ -1,40 +1,22 @@
-    # Build orthomosaics
-    print("Building orthomosaics...")
-    # rgb_chunk.buildOrthomosaic(surface_data=Metashape.DataSource.ModelData, refine_seamlines=True)
-    # doc.save()
-    multispec_chunk.buildOrthomosaic(surface_data=Metashape.DataSource.ModelData, refine_seamlines=True)
-    doc.save()
-
-    # # Round resolution to 2 decimal places
-    # rgb_res_xy = round(rgb_chunk.orthomosaic.resolution, 2)
-    # multispec_res_xy = round(multispec_chunk.orthomosaic.resolution, 2)
-
-    # # Define output path for RGB orthomosaic
-    # # Example output path: 
-    # # /path/to/imagery_dir/rgb/level1_proc/20250415_PLOTID_rgb_ortho_02.tif
-    # rgb_dir = Path(imagery_dir) / "rgb" / "level1_proc"
-    # rgb_ortho_path = rgb_dir / f"{yyyymmdd}_{plot}_rgb_ortho_{res_xy.split('.')[1]}.tif"
-
-    # # Create output directory if it doesn't exist
-    # rgb_dir.mkdir(parents=True, exist_ok=True)
+"""
+Orthomosaic build and export helpers used once reflectance calibration has
+been resumed on the 'rgb' and 'multispec' chunks.
+"""
 
-    # compression = Metashape.ImageCompression()
-    # compression.tiff_compression = Metashape.ImageCompression.TiffCompressionLZW  # Should be NONE? default on Metashape
-    # compression.tiff_big = True
-    # compression.tiff_tiled = True
-    # compression.tiff_overviews = True
+import json
+import time
+from pathlib import Path
+import Metashape
 
-    # # Export orthomosaic
-    # rgb_chunk.exportOrthomosaic(path=str(rgb_ortho_path), resolution_x=rgb_res_xy, resolution_y=rgb_res_xy,
-    #                        image_format=Metashape.ImageFormatTIFF, save_alpha=False, 
-    #                        source_data=Metashape.OrthomosaicData, image_compression=compression)
-    # print(f"RGB orthomosaic saved to: {rgb_ortho_path}")
-
-    # multispec_chunk.exportRaster(path=str(ortho_file), resolution_x=multispec_res_xy, 
-    #                     resolution_y=multispec_res_xy, image_format=Metashape.ImageFormatTIFF,
-    #                     raster_transform=Metashape.RasterTransformValue, save_alpha=False, 
-    #                     source_data=Metashape.OrthomosaicData, image_compression=compression)
-    # print(f"Multispectral orthomosaic saved to: {multispec_ortho_path}")
+from metashape.processing import ortho_surface_data
+from metashape.tiling import compute_camera_tiles, create_tile_chunks, process_tiles, write_mosaic_vrt
+from metashape.export import (make_compression, block_kwargs, write_block_manifest, convert_to_cog,
+                              find_export_files, write_band_sidecar, band_sidecar_path, resolution_suffix)
+from metashape.workers import save_chunk_projects, open_chunk_project, run_in_workers
+from metashape.catalog import spool_product, default_spool_dir
+from metashape.retention import retain_after_export, archive_project
+from metashape.gpu_setup import use_stage_devices
+from metashape.utils import resolve_profile
 
 
 def export_orthomosaics(multispec_chunk, imagery_dir, yyyymmdd, plot, res_xy):
@@ -70,31 +52,40 @@ def export_orthomosaics(multispec_chunk, imagery_dir, yyyymmdd, plot, res_xy):
                         source_data=Metashape.OrthomosaicData, image_compression=compression)
     print(f"Multispectral orthomosaic saved to: {multispec_ortho_path}")
 
-def build_rgb_orthomosaic(rgb_chunk, doc):
+def build_rgb_orthomosaic(rgb_chunk, doc, surface_data=None, refine_seamlines=True):
     """
     Build orthomosaics for the RGB chunk.
     
     Args:
         rgb_chunk: Metashape chunk containing RGB data
         doc: Metashape document
+        surface_data: Orthorectification surface (defaults to the model, or the DEM if there is no model)
+        refine_seamlines: Refine seamlines based on image content
     """
     print("Building RGB orthomosaic...")
-    rgb_chunk.buildOrthomosaic(surface_data=Metashape.DataSource.ModelData, refine_seamlines=True)
+    if surface_data is None:
+        surface_data = ortho_surface_data(rgb_chunk)
+    rgb_chunk.buildOrthomosaic(surface_data=surface_data, refine_seamlines=refine_seamlines)
     doc.save()
 
-def build_multispec_orthomosaic(multispec_chunk, doc):
+def build_multispec_orthomosaic(multispec_chunk, doc, surface_data=None, refine_seamlines=True):
     """
     Build orthomosaics for the multispectral chunk.
     
     Args:
         multispec_chunk: Metashape chunk containing multispectral data
         doc: Metashape document
+        surface_data: Orthorectification surface (defaults to the model, or the DEM if there is no model)
+        refine_seamlines: Refine seamlines based on image content
     """
     print("Building multispectral orthomosaic...")
-    multispec_chunk.buildOrthomosaic(surface_data=Metashape.DataSource.ModelData, refine_seamlines=True)
+    if surface_data is None:
+        surface_data = ortho_surface_data(multispec_chunk)
+    multispec_chunk.buildOrthomosaic(surface_data=surface_data, refine_seamlines=refine_seamlines)
     doc.save()
 
-def export_rgb_orthomosaic(rgb_chunk, imagery_dir, yyyymmdd, plot):
+def export_rgb_orthomosaic(rgb_chunk, imagery_dir, yyyymmdd, plot, res_xy=None, region=None, tile_label=None,
+                           codec='lzw', block_size=0, cog_codec=None, save_alpha=False):
     """
     Export RGB orthomosaic with proper settings.
     
@@ -103,29 +94,48 @@ def export_rgb_orthomosaic(rgb_chunk, imagery_dir, yyyymmdd, plot):
         imagery_dir: Base directory for imagery
         yyyymmdd: Date string in YYYYMMDD format
         plot: Plot identifier
+        res_xy: Optional output resolution (defaults to the orthomosaic resolution)
+        region: Optional (x_min, y_min, x_max, y_max) extent in chunk CRS units
+        tile_label: Optional tile label; tiles are written to level1_proc/tiles/
+        codec: TIFF codec ('lzw', 'deflate', 'packbits', 'none'; 'jpeg' for RGB only)
+        block_size: Split the output into square blocks of this many pixels (0 for a single file)
+        cog_codec: If set, re-write the output as Cloud-Optimized GeoTIFF with this codec
+                   ('zstd', 'deflate', ...) using GDAL
+        save_alpha: Add an alpha band marking the pixels with data
+        
+    Returns:
+        Path of the exported orthomosaic, or of its block manifest when split in blocks
     """
     # Round resolution to 2 decimal places
-    rgb_res_xy = round(rgb_chunk.orthomosaic.resolution, 2)
+    rgb_res_xy = res_xy if res_xy else round(rgb_chunk.orthomosaic.resolution, 2)
 
     # Define output path for RGB orthomosaic
     rgb_dir = Path(imagery_dir) / "rgb" / "level1_proc"
-    rgb_ortho_path = rgb_dir / f"{yyyymmdd}_{plot}_rgb_ortho_{str(rgb_res_xy).split('.')[1]}.tif"
+    rgb_ortho_name = f"{yyyymmdd}_{plot}_rgb_ortho_{resolution_suffix(rgb_res_xy)}"
+    if tile_label:
+        rgb_dir = rgb_dir / "tiles"
+        rgb_ortho_name = f"{rgb_ortho_name}_{tile_label}"
+    rgb_ortho_path = rgb_dir / f"{rgb_ortho_name}.tif"
 
     # Create output directory if it doesn't exist
     rgb_dir.mkdir(parents=True, exist_ok=True)
 
-    compression = Metashape.ImageCompression()
-    compression.tiff_compression = Metashape.ImageCompression.TiffCompressionLZW
-    compression.tiff_big = True
-    compression.tiff_tiled = True
-    compression.tiff_overviews = True
+    compression = make_compression(codec)
 
-    rgb_chunk.exportOrthomosaic(path=str(rgb_ortho_path), resolution_x=rgb_res_xy, resolution_y=rgb_res_xy,
-                           image_format=Metashape.ImageFormatTIFF, save_alpha=False, 
-                           source_data=Metashape.OrthomosaicData, image_compression=compression)
+    rgb_chunk.exportRaster(path=str(rgb_ortho_path), resolution_x=rgb_res_xy, resolution_y=rgb_res_xy,
+                           image_format=Metashape.ImageFormatTIFF, save_alpha=save_alpha,
+                           source_data=Metashape.OrthomosaicData, image_compression=compression,
+                           **_region_kwargs(rgb_chunk, region), **block_kwargs(block_size))
+    # Split exports are only written as blocks, so the product is recorded by its block manifest
+    rgb_ortho_path = _finalize_export(rgb_ortho_path, codec, block_size, cog_codec, rgb_res_xy, 'rgb')
+    if not tile_label:
+        _catalog_export(rgb_chunk, rgb_ortho_path, imagery_dir, yyyymmdd, plot, 'rgb', rgb_res_xy, region,
+                        alpha=save_alpha)
     print(f"RGB orthomosaic saved to: {rgb_ortho_path}")
+    return rgb_ortho_path
 
-def export_multispec_orthomosaic(multispec_chunk, imagery_dir, yyyymmdd, plot):
+def export_multispec_orthomosaic(multispec_chunk, imagery_dir, yyyymmdd, plot, res_xy=None, region=None, tile_label=None,
+                                 codec='lzw', block_size=0, cog_codec=None):
     """
     Export multispectral orthomosaic with proper settings.
     
@@ -134,28 +144,440 @@ def export_multispec_orthomosaic(multispec_chunk, imagery_dir, yyyymmdd, plot):
         imagery_dir: Base directory for imagery
         yyyymmdd: Date string in YYYYMMDD format
         plot: Plot identifier
+        res_xy: Optional output resolution (defaults to the orthomosaic resolution)
+        region: Optional (x_min, y_min, x_max, y_max) extent in chunk CRS units
+        tile_label: Optional tile label; tiles are written to level1_proc/tiles/
+        codec: TIFF codec ('lzw', 'deflate', 'packbits', 'none'; 'jpeg' for RGB only)
+        block_size: Split the output into square blocks of this many pixels (0 for a single file)
+        cog_codec: If set, re-write the output as Cloud-Optimized GeoTIFF with this codec
+                   ('zstd', 'deflate', ...) using GDAL
+        
+    Returns:
+        Path of the exported orthomosaic, or of its block manifest when split in blocks
     """
     # Round resolution to 2 decimal places
-    multispec_res_xy = round(multispec_chunk.orthomosaic.resolution, 2)
+    multispec_res_xy = res_xy if res_xy else round(multispec_chunk.orthomosaic.resolution, 2)
 
     # Define output path for multispectral orthomosaic
     multispec_dir = Path(imagery_dir) / "multispec" / "level1_proc"
-    multispec_ortho_path = multispec_dir / f"{yyyymmdd}_{plot}_multispec_ortho_{str(multispec_res_xy).split('.')[1]}.tif"
+    multispec_ortho_name = f"{yyyymmdd}_{plot}_multispec_ortho_{resolution_suffix(multispec_res_xy)}"
+    if tile_label:
+        multispec_dir = multispec_dir / "tiles"
+        multispec_ortho_name = f"{multispec_ortho_name}_{tile_label}"
+    multispec_ortho_path = multispec_dir / f"{multispec_ortho_name}.tif"
 
     # Create output directory if it doesn't exist
     multispec_dir.mkdir(parents=True, exist_ok=True)
 
-    compression = Metashape.ImageCompression()
-    compression.tiff_compression = Metashape.ImageCompression.TiffCompressionLZW
-    compression.tiff_big = True
-    compression.tiff_tiled = True
-    compression.tiff_overviews = True
+    if codec == 'jpeg' or cog_codec == 'jpeg':
+        raise ValueError("JPEG compression is lossy and not supported for reflectance data")
+    compression = make_compression(codec)
 
     multispec_chunk.exportRaster(path=str(multispec_ortho_path), resolution_x=multispec_res_xy, 
                         resolution_y=multispec_res_xy, image_format=Metashape.ImageFormatTIFF,
                         raster_transform=Metashape.RasterTransformValue, save_alpha=False, 
-                        source_data=Metashape.OrthomosaicData, image_compression=compression)
+                        source_data=Metashape.OrthomosaicData, image_compression=compression,
+                        **_region_kwargs(multispec_chunk, region), **block_kwargs(block_size))
+    multispec_ortho_path = _finalize_export(multispec_ortho_path, codec, block_size, cog_codec, multispec_res_xy,
+                                            'multispec')
+    write_band_sidecar(multispec_ortho_path, multispec_chunk)
+    if not tile_label:
+        _catalog_export(multispec_chunk, multispec_ortho_path, imagery_dir, yyyymmdd, plot, 'multispec',
+                        multispec_res_xy, region)
     print(f"Multispectral orthomosaic saved to: {multispec_ortho_path}")
+    return multispec_ortho_path
+
+def export_rgb_orthomosaic_ladder(rgb_chunk, imagery_dir, yyyymmdd, plot, resolutions=(0.05, 0.2), codec='lzw'):
+    """
+    Export the RGB orthomosaic at native resolution and derive coarser levels from
+    the written file by area averaging, instead of re-rendering each level.
+    
+    Args:
+        rgb_chunk: Metashape chunk containing RGB data
+        imagery_dir: Base directory for imagery
+        yyyymmdd: Date string in YYYYMMDD format
+        plot: Plot identifier
+        resolutions: Coarser resolutions to produce, in chunk CRS units
+        codec: TIFF codec for the native export
+        
+    Returns:
+        List of exported paths, native first
+    """
+    from metashape.resample import build_resolution_ladder
+
+    # The alpha band keeps the background out of the averages along the orthomosaic edges
+    native_path = export_rgb_orthomosaic(rgb_chunk, imagery_dir, yyyymmdd, plot, codec=codec, save_alpha=True)
+
+    def ladder_path(res_xy):
+        res_xy = round(res_xy, 2)
+        return native_path.with_name(f"{yyyymmdd}_{plot}_rgb_ortho_{resolution_suffix(res_xy)}.tif")
+
+    ladder = build_resolution_ladder(native_path, resolutions, ladder_path)
+    for res_xy, path in ladder.items():
+        # Coarser levels keep the alpha band of the native export
+        _catalog_export(rgb_chunk, path, imagery_dir, yyyymmdd, plot, 'rgb', res_xy, alpha=True)
+    return [native_path] + list(ladder.values())
+
+def _finalize_export(path, codec, block_size, cog_codec, res_xy, product):
+    """
+    Convert exported files to COG and record split blocks in a manifest.
+    
+    Args:
+        path: Path passed to exportRaster
+        codec: Metashape TIFF codec used for the export
+        block_size: Block size in pixels, 0 for a single file
+        cog_codec: COG codec, or None to keep the Metashape layout
+        res_xy: Export resolution
+        product: 'rgb' or 'multispec'
+        
+    Returns:
+        Path of the product: the exported file, or the block manifest when split in blocks
+    """
+    if cog_codec:
+        for file_path in find_export_files(path):
+            if not convert_to_cog(file_path, codec=cog_codec):
+                break
+        else:
+            codec = cog_codec
+    if block_size:
+        return write_block_manifest(path, codec, block_size, res_xy, product)
+    return path
+
+def _catalog_export(chunk, path, imagery_dir, yyyymmdd, plot, product, res_xy, region=None, alpha=False):
+    """
+    Record an exported product for the level1 catalog shared by all plots. The entry
+    is spooled next to the plot directories and added to the catalog by
+    level1_catalog.py -ingest. A catalog failure is reported but never fails the export.
+    
+    Args:
+        chunk: Metashape chunk the product was exported from
+        path: Path passed to exportRaster (or of the written mosaic)
+        imagery_dir: Base directory for imagery
+        yyyymmdd: Date string in YYYYMMDD format
+        plot: Plot identifier
+        product: 'rgb' or 'multispec'
+        res_xy: Export resolution
+        region: Optional (x_min, y_min, x_max, y_max) export extent in chunk CRS units
+        alpha: Whether the product was written with an alpha band after its colour bands
+    """
+    try:
+        if region is None:
+            ortho = chunk.orthomosaic
+            crs = ortho.projection.crs or chunk.crs
+            region = (ortho.left, ortho.bottom, ortho.right, ortho.top)
+        else:
+            crs = chunk.crs
+        wgs84 = Metashape.CoordinateSystem("EPSG::4326")
+        x_min, y_min, x_max, y_max = region
+        corners = [Metashape.CoordinateSystem.transform(Metashape.Vector([x, y, 0]), crs, wgs84)
+                   for x in (x_min, x_max) for y in (y_min, y_max)]
+        footprint = (min(c.x for c in corners), min(c.y for c in corners),
+                     max(c.x for c in corners), max(c.y for c in corners))
+
+        bands, calibration = ['red', 'green', 'blue'], None
+        sidecar_path = band_sidecar_path(path)
+        if product == 'multispec' and sidecar_path.is_file():
+            with open(sidecar_path) as f:
+                calibration = json.load(f)
+            bands = calibration.pop('bands')
+        if alpha:
+            bands = bands + ['alpha']
+        profile = chunk.meta['processing_profile'] if 'processing_profile' in chunk.meta else None
+
+        spool_product(default_spool_dir(imagery_dir), path=str(path), plot=plot, yyyymmdd=yyyymmdd,
+                      product=product, resolution=res_xy, crs=crs.authority or crs.wkt, bounds=list(region),
+                      footprint=list(footprint), bands=bands, calibration=calibration, profile=profile)
+    except Exception as e:
+        print(f"Warning: could not record {path} for the catalog: {e}")
+
+def _recorded_profile(chunk, **overrides):
+    """
+    Get the parameters of the processing profile recorded in a chunk by metashape_proc_coalign.py
+    ('balanced' for chunks processed without one), with explicitly given values taking precedence.
+    """
+    name = chunk.meta['processing_profile'] if 'processing_profile' in chunk.meta else 'balanced'
+    return resolve_profile(name, **overrides)
+
+def export_settings(chunk, product, codec=None, block_size=None, cog_codec=None):
+    """
+    Resolve the export settings of a product: explicit values, else those recorded in the
+    chunk by metashape_proc_coalign.py, else an LZW single-file export. JPEG is lossy and
+    only used for RGB; multispectral products fall back to LZW (and ZSTD for COG).
+    """
+    meta = chunk.meta
+    if codec is None:
+        codec = meta['export_codec'] if 'export_codec' in meta else 'lzw'
+    if block_size is None:
+        block_size = int(meta['export_block_size']) if 'export_block_size' in meta else 0
+    if cog_codec is None:
+        cog_codec = (meta['export_cog_codec'] if 'export_cog_codec' in meta else '') or None
+    if product == 'multispec':
+        codec = 'lzw' if codec == 'jpeg' else codec
+        cog_codec = 'zstd' if cog_codec == 'jpeg' else cog_codec
+    return {'codec': codec, 'block_size': block_size, 'cog_codec': cog_codec}
+
+def _region_kwargs(chunk, region):
+    """
+    Build the projection/region keyword arguments restricting an export to an extent.
+    
+    Args:
+        chunk: Metashape chunk being exported
+        region: (x_min, y_min, x_max, y_max) in chunk CRS units, or None
+        
+    Returns:
+        Dictionary of extra exportRaster/exportOrthomosaic arguments
+    """
+    if region is None:
+        return {}
+    projection = Metashape.OrthoProjection()
+    projection.crs = chunk.crs
+    x_min, y_min, x_max, y_max = region
+    bbox = Metashape.BBox()
+    bbox.min = Metashape.Vector([x_min, y_min])
+    bbox.max = Metashape.Vector([x_max, y_max])
+    return {'projection': projection, 'region': bbox}
+
+def build_and_export_tiled_orthomosaic(doc, chunk, product, imagery_dir, yyyymmdd, plot, max_cameras=1500,
+                                       overlap=0.2, smooth_strength='low', workers=1, align=False,
+                                       surface='model', retention=None, dem_resolution=None, face_count=None,
+                                       codec=None, cog_codec=None):
+    """
+    Build and export an orthomosaic tile by tile for surveys too large for a single pass.
+    
+    The chunk is split into overlapping sub-chunks on a grid over camera positions,
+    each tile gets its own model and orthomosaic clipped to its core extent, and the
+    exported tiles are stitched into one virtual mosaic next to the regular products.
+    
+    Args:
+        doc: Metashape document
+        chunk: Aligned chunk, or a chunk of raw captures when align is True
+        product: 'rgb' or 'multispec'
+        imagery_dir: Base directory for imagery
+        yyyymmdd: Date string in YYYYMMDD format
+        plot: Plot identifier
+        max_cameras: Target number of captures per tile
+        overlap: Tile overlap as a fraction of the tile size
+        smooth_strength: Smoothing strength for the per-tile models
+        workers: Number of parallel worker processes
+        align: Whether to align each tile separately
+        surface: Per-tile orthorectification surface, 'model' or 'dem'
+        retention: Retention policy applied once the tiles are exported
+                   (defaults to the one recorded in the chunk)
+        dem_resolution: Per-tile DEM resolution in metres (defaults to the profile recorded in the chunk)
+        face_count: Per-tile model face count (defaults to the profile recorded in the chunk)
+        codec: TIFF codec of the tiles (defaults to the one recorded in the chunk)
+        cog_codec: COG codec of the tiles (defaults to the one recorded in the chunk); tiles
+                   are never split in blocks, as the mosaic references each tile file
+        
+    Returns:
+        Path of the stitched mosaic
+    """
+    if product not in ('rgb', 'multispec'):
+        raise ValueError(f"Unknown product '{product}', expected 'rgb' or 'multispec'")
+    profile = _recorded_profile(chunk, dem_resolution=dem_resolution, face_count=face_count)
+    export = export_settings(chunk, product, codec=codec, block_size=0, cog_codec=cog_codec)
+
+    tiles = compute_camera_tiles(chunk, max_cameras=max_cameras, overlap=overlap)
+    if not tiles:
+        raise ValueError(f"Could not partition chunk {chunk.label} into tiles")
+
+    tile_chunks = create_tile_chunks(doc, chunk, tiles)
+    created_chunks = [tile_chunk for _, tile_chunk in tile_chunks]
+    tile_chunks = process_tiles(doc, tile_chunks, smooth_strength=smooth_strength, align=align, workers=workers,
+                                surface=surface, dem_resolution=profile['dem_resolution'],
+                                face_count=profile['face_count'])
+
+    # All tiles share the coarsest tile resolution so they fit one grid
+    res_xy = max(round(tile_chunk.orthomosaic.resolution, 2) for _, tile_chunk in tile_chunks)
+
+    tile_rasters = []
+    for tile, tile_chunk in tile_chunks:
+        if product == 'rgb':
+            path = export_rgb_orthomosaic(tile_chunk, imagery_dir, yyyymmdd, plot, res_xy=res_xy,
+                                          region=tile['bounds'], tile_label=tile['label'], **export)
+        else:
+            path = export_multispec_orthomosaic(tile_chunk, imagery_dir, yyyymmdd, plot, res_xy=res_xy,
+                                                region=tile['bounds'], tile_label=tile['label'], **export)
+        tile_rasters.append((path, tile['bounds']))
+
+    mosaic_dir = Path(imagery_dir) / product / "level1_proc"
+    mosaic_path = mosaic_dir / f"{yyyymmdd}_{plot}_{product}_ortho_{resolution_suffix(res_xy)}.vrt"
+    if product == 'rgb':
+        vrt_path = write_mosaic_vrt(tile_rasters, mosaic_path, chunk.crs.wkt, res_xy, band_count=3)
+    else:
+        band_count = len(chunk.raster_transform.formula)
+        vrt_path = write_mosaic_vrt(tile_rasters, mosaic_path, chunk.crs.wkt, res_xy, band_count=band_count,
+                                    data_type='Float32', nodata=-32767)
+        # The tiles share one band layout, so the mosaic takes the sidecar of the first tile
+        sidecar = band_sidecar_path(tile_rasters[0][0])
+        if sidecar.is_file():
+            band_sidecar_path(vrt_path).write_text(sidecar.read_text())
+
+    extent = (min(b[0] for _, b in tile_rasters), min(b[1] for _, b in tile_rasters),
+              max(b[2] for _, b in tile_rasters), max(b[3] for _, b in tile_rasters))
+    _catalog_export(chunk, vrt_path, imagery_dir, yyyymmdd, plot, product, res_xy, region=extent)
+
+    # Tile chunks are intermediates once the mosaic is exported
+    retain_after_export(doc, [chunk], retention, tile_chunks=created_chunks)
+    return vrt_path
+
+def _build_and_export_chunk_project(project_path, product, imagery_dir, yyyymmdd, plot, gpu_mask=None,
+                                    refine_seamlines=True, retention=None, export=None):
+    """
+    Worker entry point: build and export the orthomosaic of a per-chunk project.
+    
+    Args:
+        project_path: Path of the per-chunk project
+        product: 'rgb' or 'multispec'
+        imagery_dir: Base directory for imagery
+        yyyymmdd: Date string in YYYYMMDD format
+        plot: Plot identifier
+        gpu_mask: Optional GPU mask for this worker
+        refine_seamlines: Refine seamlines based on image content
+        retention: Retention policy applied to the per-chunk project after export
+        export: Optional dictionary of exporter settings (codec, block_size, cog_codec)
+        
+    Returns:
+        Dictionary with the product, exported path and build/export times
+    """
+    if gpu_mask is not None:
+        Metashape.app.gpu_mask = gpu_mask
+
+    doc, chunk = open_chunk_project(project_path, read_only=False)
+
+    start = time.perf_counter()
+    if product == 'rgb':
+        build_rgb_orthomosaic(chunk, doc, refine_seamlines=refine_seamlines)
+    else:
+        build_multispec_orthomosaic(chunk, doc, refine_seamlines=refine_seamlines)
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if product == 'rgb':
+        path = export_rgb_orthomosaic(chunk, imagery_dir, yyyymmdd, plot, **(export or {}))
+    else:
+        path = export_multispec_orthomosaic(chunk, imagery_dir, yyyymmdd, plot, **(export or {}))
+    export_time = time.perf_counter() - start
+
+    retain_after_export(doc, [chunk], retention)
+    return {'product': product, 'path': str(path), 'build_time_s': build_time, 'export_time_s': export_time}
+
+def build_and_export_orthomosaics_parallel(doc, rgb_chunk, multispec_chunk, imagery_dir, yyyymmdd, plot,
+                                           work_dir=None, gpu_masks=None, refine_seamlines=True, retention=None,
+                                           codec=None, block_size=None, cog_codec=None):
+    """
+    Build and export the RGB and multispectral orthomosaics at the same time,
+    each in its own worker process working on a per-chunk project.
+    
+    Args:
+        doc: Metashape document
+        rgb_chunk: Metashape chunk containing RGB data
+        multispec_chunk: Metashape chunk containing multispectral data
+        imagery_dir: Base directory for imagery
+        yyyymmdd: Date string in YYYYMMDD format
+        plot: Plot identifier
+        work_dir: Directory for the per-chunk projects (defaults to '<project>_products')
+        gpu_masks: Optional dictionary of product -> GPU mask to give each worker its own device
+        refine_seamlines: Refine seamlines based on image content
+        retention: Retention policy applied to the per-chunk projects after export
+        codec: TIFF codec (defaults to the one recorded in the chunks)
+        block_size: Block size in pixels (defaults to the one recorded in the chunks)
+        cog_codec: COG codec (defaults to the one recorded in the chunks)
+        
+    Returns:
+        List of worker result dictionaries
+    """
+    if work_dir is None:
+        work_dir = Path(doc.path).with_suffix('').as_posix() + "_products"
+    gpu_masks = gpu_masks or {}
+
+    products = [('rgb', rgb_chunk), ('multispec', multispec_chunk)]
+    project_paths = save_chunk_projects(doc, [chunk for _, chunk in products], work_dir)
+    jobs = [(path, product, str(imagery_dir), yyyymmdd, plot, gpu_masks.get(product), refine_seamlines, retention,
+             export_settings(chunk, product, codec, block_size, cog_codec))
+            for (product, chunk), path in zip(products, project_paths)]
+
+    print(f"Building and exporting {len(jobs)} orthomosaics in parallel worker processes...")
+    start = time.perf_counter()
+    results = run_in_workers(_build_and_export_chunk_project, jobs, workers=len(jobs))
+    wall_time = time.perf_counter() - start
+
+    for result in results:
+        print(f"{result['product']}: build {result['build_time_s']:.1f}s, "
+              f"export {result['export_time_s']:.1f}s -> {result['path']}")
+    serial_time = sum(r['build_time_s'] + r['export_time_s'] for r in results)
+    print(f"Wall time {wall_time:.1f}s (sequential would take about {serial_time:.1f}s)")
+    return results
+
+def build_and_export_orthomosaics(doc, rgb_chunk, multispec_chunk, imagery_dir, yyyymmdd, plot,
+                                  tile_max_cameras=0, tile_overlap=0.2, tile_workers=1, smooth_strength='low',
+                                  surface='model', parallel=False, refine_seamlines=None, retention=None,
+                                  archive=False, devices=None, dem_resolution=None, face_count=None,
+                                  codec=None, block_size=None, cog_codec=None):
+    """
+    Build and export the RGB and multispectral orthomosaics.
+    
+    Args:
+        doc: Metashape document
+        rgb_chunk: Metashape chunk containing RGB data
+        multispec_chunk: Metashape chunk containing multispectral data
+        imagery_dir: Base directory for imagery
+        yyyymmdd: Date string in YYYYMMDD format
+        plot: Plot identifier
+        tile_max_cameras: Split chunks with more captures than this into tiles (0 disables tiling)
+        tile_overlap: Tile overlap as a fraction of the tile size
+        tile_workers: Number of parallel worker processes for tiles
+        smooth_strength: Smoothing strength for the per-tile models
+        surface: Per-tile orthorectification surface, 'model' or 'dem'
+        parallel: Build and export both products in parallel worker processes (untiled only)
+        refine_seamlines: Refine seamlines of untiled orthomosaics (tiles always refine them)
+        retention: Retention policy (key of RETENTION_POLICIES) applied after each export
+                   (defaults to the one recorded in the chunks by metashape_proc_coalign.py)
+        archive: Save the project as a single-file .psz archive once everything is exported
+        devices: Per-stage device settings from setup_gpu; the 'ortho' stage devices are used
+                 (parallel workers keep their own GPU masks)
+        dem_resolution: Per-tile DEM resolution in metres
+        face_count: Per-tile model face count
+        codec: TIFF codec ('jpeg' applies to RGB only)
+        block_size: Split untiled exports into square blocks of this many pixels (0 for a single file)
+        cog_codec: Re-write exports as Cloud-Optimized GeoTIFF with this codec
+
+    refine_seamlines, dem_resolution and face_count default to the processing profile,
+    and codec, block_size and cog_codec to the export settings, recorded in the chunks
+    by metashape_proc_coalign.py.
+    """
+    profile = _recorded_profile(rgb_chunk, refine_seamlines=refine_seamlines, dem_resolution=dem_resolution,
+                                face_count=face_count)
+    refine_seamlines = profile['refine_seamlines']
+    use_stage_devices(devices, 'ortho')
+    if parallel and not tile_max_cameras:
+        build_and_export_orthomosaics_parallel(doc, rgb_chunk, multispec_chunk, imagery_dir, yyyymmdd, plot,
+                                               refine_seamlines=refine_seamlines, retention=retention,
+                                               codec=codec, block_size=block_size, cog_codec=cog_codec)
+        if archive:
+            archive_project(doc)
+        return
+
+    for product, chunk in (('rgb', rgb_chunk), ('multispec', multispec_chunk)):
+        n_captures = len([cam for cam in chunk.cameras if cam.master == cam])
+        if tile_max_cameras and n_captures > tile_max_cameras:
+            print(f"{product} chunk has {n_captures} captures, processing in tiles...")
+            build_and_export_tiled_orthomosaic(doc, chunk, product, imagery_dir, yyyymmdd, plot,
+                                               max_cameras=tile_max_cameras, overlap=tile_overlap,
+                                               smooth_strength=smooth_strength, workers=tile_workers,
+                                               surface=surface, retention=retention,
+                                               dem_resolution=profile['dem_resolution'],
+                                               face_count=profile['face_count'], codec=codec, cog_codec=cog_codec)
+        elif product == 'rgb':
+            build_rgb_orthomosaic(chunk, doc, refine_seamlines=refine_seamlines)
+            export_rgb_orthomosaic(chunk, imagery_dir, yyyymmdd, plot,
+                                   **export_settings(chunk, product, codec, block_size, cog_codec))
+            retain_after_export(doc, [chunk], retention)
+        else:
+            build_multispec_orthomosaic(chunk, doc, refine_seamlines=refine_seamlines)
+            export_multispec_orthomosaic(chunk, imagery_dir, yyyymmdd, plot,
+                                         **export_settings(chunk, product, codec, block_size, cog_codec))
+            retain_after_export(doc, [chunk], retention)
 
-    export_rgb_orthomosaic(rgb_chunk, imagery_dir, yyyymmdd, plot)
-    export_multispec_orthomosaic(multispec_chunk, imagery_dir, yyyymmdd, plot)
\ No newline at end of file
+    if archive:
+        archive_project(doc)
@@ -0,0 +1,79 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+
+from metashape.gpu_setup import describe_devices, select_gpus, parse_device_overrides, resolve_device_policy
+
+GPU_LIST = [
+    {'name': 'Intel(R) UHD Graphics 630', 'vendor': 'Intel', 'mem_size': 2e9, 'compute_units': 24},
+    {'name': 'NVIDIA GeForce RTX 3080', 'vendor': 'NVIDIA', 'mem_size': 10e9, 'compute_units': 68},
+    {'name': 'AMD Radeon Pro W6800', 'vendor': 'AMD', 'mem_size': 32e9, 'compute_units': 60},
+]
+
+def test_integrated_and_discrete_selection():
+    devices = describe_devices(GPU_LIST)
+    assert [device['integrated'] for device in devices] == [True, False, False]
+    assert select_gpus(devices, 'discrete') == [1, 2]
+    assert select_gpus(devices, 'all') == [0, 1, 2]
+    assert select_gpus(devices, 'none') == []
+    # Only integrated GPUs: 'discrete' falls back to them rather than to the CPU
+    assert select_gpus(describe_devices(GPU_LIST[:1]), 'discrete') == [0]
+
+def test_name_substring_selection():
+    devices = describe_devices(GPU_LIST)
+    assert select_gpus(devices, 'nvidia') == [1]
+    assert select_gpus(devices, 'RADEON') == [2]
+    assert select_gpus(devices, 'quadro') == []
+
+def test_fastest_selection():
+    devices = describe_devices(GPU_LIST)
+    probe = {'gpus': [4.0, 1.5, None], 'cpu': 9.0, 'gpu_cpu': 1.2}
+    assert select_gpus(devices, 'fastest', probe) == [1]
+    # Without probe timings all discrete GPUs are used
+    assert select_gpus(devices, 'fastest') == [1, 2]
+
+def test_parse_device_overrides():
+    overrides = parse_device_overrides(['ortho=nvidia:cpu', 'depth=all:nocpu', 'matching=fastest:auto'])
+    assert overrides == {
+        'ortho': {'gpus': 'nvidia', 'cpu': True},
+        'depth': {'gpus': 'all', 'cpu': False},
+        'matching': {'gpus': 'fastest', 'cpu': 'auto'},
+    }
+    assert parse_device_overrides(['ortho=discrete']) == {'ortho': {'gpus': 'discrete'}}
+    assert parse_device_overrides(None) == {}
+
+@pytest.mark.parametrize("spec", ['meshing=all', 'ortho=', 'ortho=nvidia:gpu', 'ortho'])
+def test_invalid_device_overrides(spec):
+    with pytest.raises(ValueError):
+        parse_device_overrides([spec])
+
+def test_resolve_device_policy():
+    devices = describe_devices(GPU_LIST)
+    settings = resolve_device_policy(devices, 'gpu', parse_device_overrides(['ortho=nvidia:cpu']))
+    assert settings['matching'] == {'gpu_mask': 0b110, 'cpu_enable': False,
+                                    'gpus': ['NVIDIA GeForce RTX 3080', 'AMD Radeon Pro W6800']}
+    assert settings['ortho'] == {'gpu_mask': 0b010, 'cpu_enable': True, 'gpus': ['NVIDIA GeForce RTX 3080']}
+    with pytest.raises(ValueError):
+        resolve_device_policy(devices, 'turbo')
+
+def test_auto_cpu_follows_probe():
+    devices = describe_devices(GPU_LIST)
+    overrides = parse_device_overrides(['matching=fastest:auto'])
+    faster = resolve_device_policy(devices, 'gpu', overrides, {'gpus': [4.0, 1.5, 2.0], 'gpu_cpu': 1.2})
+    slower = resolve_device_policy(devices, 'gpu', overrides, {'gpus': [4.0, 1.5, 2.0], 'gpu_cpu': 1.49})
+    assert faster['matching']['cpu_enable']
+    assert not slower['matching']['cpu_enable']
+
+def test_no_gpu_falls_back_to_cpu(capsys):
+    settings = resolve_device_policy([], 'gpu')
+    for setting in settings.values():
+        assert setting == {'gpu_mask': 0, 'cpu_enable': True, 'gpus': []}
+    assert capsys.readouterr().out == ""
+
+    # GPUs present but none matching the selector: CPU enabled with a warning
+    settings = resolve_device_policy(describe_devices(GPU_LIST), 'gpu', parse_device_overrides(['depth=quadro']))
+    assert settings['depth'] == {'gpu_mask': 0, 'cpu_enable': True, 'gpus': []}
+    assert "no GPU matches 'quadro' for depth" in capsys.readouterr().out
@@ -0,0 +1,60 @@
+import struct
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+
+from metashape.image_utils import read_tiff_size, read_geotiff_origin
+
+TIEPOINT = (0.0, 0.0, 0.0, 500000.0, 6100000.0, 0.0)
+SCALE = (0.05, 0.05, 0.0)
+
+def write_geotiff_header(path, width, height, big, order='<'):
+    # Header and first IFD only: ImageWidth, ImageLength, ModelPixelScale and ModelTiepoint
+    if big:
+        header = (b'II' if order == '<' else b'MM') + struct.pack(order + 'HHHQ', 43, 8, 0, 16)
+        count_fmt, entry_fmt, offset_fmt, long_type = 'Q', 'HHQ', 'Q', 16
+    else:
+        header = (b'II' if order == '<' else b'MM') + struct.pack(order + 'HI', 42, 8)
+        count_fmt, entry_fmt, offset_fmt, long_type = 'H', 'HHI', 'I', 4
+    value_size = struct.calcsize(offset_fmt)
+    entry_size = struct.calcsize(order + entry_fmt) + value_size
+    data_offset = len(header) + struct.calcsize(count_fmt) + 4 * entry_size + value_size
+    scale_offset = data_offset
+    tiepoint_offset = scale_offset + 8 * len(SCALE)
+
+    def inline(fmt, value):
+        return struct.pack(order + fmt, value).ljust(value_size, b'\0')
+
+    entries = [
+        struct.pack(order + entry_fmt, 256, long_type, 1) + inline(offset_fmt if big else 'I', width),
+        struct.pack(order + entry_fmt, 257, 3, 1) + inline('H', height),
+        struct.pack(order + entry_fmt, 33550, 12, len(SCALE)) + struct.pack(order + offset_fmt, scale_offset),
+        struct.pack(order + entry_fmt, 33922, 12, len(TIEPOINT)) + struct.pack(order + offset_fmt, tiepoint_offset),
+    ]
+    ifd = struct.pack(order + count_fmt, len(entries)) + b''.join(entries) + struct.pack(order + offset_fmt, 0)
+    data = struct.pack(order + 'd' * len(SCALE), *SCALE) + struct.pack(order + 'd' * len(TIEPOINT), *TIEPOINT)
+    Path(path).write_bytes(header + ifd + data)
+
+def test_classic_tiff_header(tmp_path):
+    path = tmp_path / "classic.tif"
+    write_geotiff_header(path, 1234, 567, big=False)
+    assert read_tiff_size(path) == (1234, 567)
+    assert read_geotiff_origin(path) == (500000.0, 6100000.0)
+
+def test_bigtiff_header(tmp_path):
+    path = tmp_path / "big.tif"
+    write_geotiff_header(path, 70000, 567, big=True)
+    assert read_tiff_size(path) == (70000, 567)
+    assert read_geotiff_origin(path) == (500000.0, 6100000.0)
+
+def test_big_endian_bigtiff_header(tmp_path):
+    path = tmp_path / "big_be.tif"
+    write_geotiff_header(path, 321, 123, big=True, order='>')
+    assert read_tiff_size(path) == (321, 123)
+
+def test_not_a_tiff(tmp_path):
+    path = tmp_path / "image.jpg"
+    path.write_bytes(b'\xff\xd8\xff\xe0' + b'\0' * 32)
+    assert read_tiff_size(path) is None
+    assert read_geotiff_origin(path) is None
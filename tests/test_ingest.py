@@ -0,0 +1,90 @@
+import json
+import os
+import shlex
+import socket
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+
+from metashape.ingest import (check_uploads, enqueue_flight, next_job, next_deadline, requeue_interrupted_jobs,
+                              upload_signature, watch_uploads, watched_dirs)
+
+def make_flight(root, plot="plot1", date="20240101", rgb=("DJI_0001.JPG",), multispec=("IMG_0001_1.tif",)):
+    imagery_dir = root / plot / date / "imagery"
+    for subdir, names in (("rgb/level0_raw", rgb), ("multispec/level0_raw", multispec)):
+        (imagery_dir / subdir).mkdir(parents=True, exist_ok=True)
+        for name in names:
+            (imagery_dir / subdir / name).parent.mkdir(parents=True, exist_ok=True)
+            (imagery_dir / subdir / name).write_bytes(b"x" * 100)
+    return imagery_dir
+
+def test_flight_is_queued_once_settled(tmp_path):
+    imagery_dir = make_flight(tmp_path)
+    tracker = {}
+    assert check_uploads(tmp_path, tracker, settle=60, now=1000) == []
+    assert check_uploads(tmp_path, tracker, settle=60, now=1030, touched=set()) == []
+    finished = check_uploads(tmp_path, tracker, settle=60, now=1060, touched=set())
+    assert [key for key, _ in finished] == [str(imagery_dir)]
+    # Queued flights are not reported again
+    assert check_uploads(tmp_path, tracker, settle=60, now=2000) == []
+
+    queue_path = tmp_path / "queue.json"
+    assert enqueue_flight(queue_path, imagery_dir, finished[0][1])
+    assert not enqueue_flight(queue_path, imagery_dir, finished[0][1])
+
+def test_incomplete_flight_is_rescanned(tmp_path):
+    make_flight(tmp_path, rgb=("DJI_0001.JPG", "DJI_0002.JPG.part"))
+    tracker = {}
+    check_uploads(tmp_path, tracker, settle=60, now=1000)
+    assert not next(iter(tracker.values()))['signature']['complete']
+    assert next_deadline(tracker, settle=60, now=1010) == 50
+    # Still incomplete after settling: re-scanned every settle seconds instead of never
+    assert next_deadline(tracker, settle=60, now=1070) == 50
+    assert check_uploads(tmp_path, tracker, settle=60, now=1070, touched=set()) == []
+
+def test_nested_upload_directories_are_watched(tmp_path):
+    imagery_dir = make_flight(tmp_path, multispec=("0001SET/000/IMG_0001_1.tif",))
+    dirs = {path: flight for path, flight in watched_dirs(tmp_path)}
+    nested = imagery_dir / "multispec/level0_raw/0001SET/000"
+    assert dirs[nested] == str(imagery_dir)
+    assert dirs[nested.parent] == str(imagery_dir)
+    assert dirs[tmp_path] is None
+
+def test_interrupted_jobs_are_requeued(tmp_path):
+    queue_path = tmp_path / "queue.json"
+    first = make_flight(tmp_path, date="20240101")
+    second = make_flight(tmp_path, date="20240102")
+    for imagery_dir in (first, second):
+        enqueue_flight(queue_path, imagery_dir, upload_signature(imagery_dir))
+    interrupted = next_job(queue_path)
+    live = next_job(queue_path)
+    assert next_job(queue_path) is None
+
+    # The first job's runner has exited; the second one's (this process) is alive
+    jobs = json.loads(queue_path.read_text())['jobs']
+    jobs[interrupted['imagery_dir']]['runner'] = f"{socket.gethostname()}:{2 ** 22 + 1}"
+    queue_path.write_text(json.dumps({'jobs': jobs}))
+
+    assert requeue_interrupted_jobs(queue_path) == 1
+    jobs = json.loads(queue_path.read_text())['jobs']
+    assert jobs[interrupted['imagery_dir']]['status'] == 'pending'
+    assert jobs[live['imagery_dir']]['status'] == 'running'
+    assert next_job(queue_path)['imagery_dir'] == interrupted['imagery_dir']
+
+def test_once_runs_queue_and_process(tmp_path):
+    root = tmp_path / "root"
+    imagery_dir = make_flight(root)
+    queue_path = tmp_path / "queue.json"
+    marker = tmp_path / "processed"
+    command = (f"{shlex.quote(sys.executable)} -c "
+               f"\"open({str(marker)!r}, 'a').write('{{plot}} {{date}}' + chr(10))\"")
+
+    # The first run only records the upload; the next one queues and processes it
+    watch_uploads(root, queue_path=queue_path, settle=0, command=command, once=True)
+    assert not marker.exists()
+    watch_uploads(root, queue_path=queue_path, settle=0, command=command, once=True)
+    assert marker.read_text() == "plot1 20240101\n"
+    job = json.loads(queue_path.read_text())['jobs'][str(imagery_dir.resolve())]
+    assert job['status'] == 'done'
+    assert os.path.isfile(queue_path.parent / "ingest_logs" / "plot1_20240101.log")